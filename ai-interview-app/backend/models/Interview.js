@@ -427,6 +427,11 @@ const interviewSchema = new mongoose.Schema({
   candidateApplicationPhotoUploadedAt: {
     type: Date,
     default: null
+  },
+  
+  candidateApplicationPhotoEmbedding: {
+    type: mongoose.Schema.Types.Mixed, // Cached face data from face_verification.py, keyed by photo hash
+    default: null
   }
 }, {
   timestamps: true
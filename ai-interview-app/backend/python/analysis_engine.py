@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Frame Analysis Engine
+Process-pool sharding for face_analysis_server_fixed.py.
+
+- One worker process per core, each holding one warm FaceAnalyzer, so
+  MediaPipe/OpenCV work never contends on the server's GIL
+- Stream connections are pinned to a worker; their AnalysisSession (blink
+  and looking-away state) lives inside that worker
+- Stream frames pass a motion gate on the tracked face region before decoding
+  (a static face reuses head pose, never eye or mouth metrics) and are analyzed
+  in that region (vision_mediapipe.py)
+- Frames reach workers through per-worker shared-memory slots; only a small
+  (slot, length) message goes over the pipe, never a pickled frame
+- The number of free slots bounds in-flight frames per worker; callers wait
+  up to a timeout for one, then get PoolBusyError
+- A worker that dies fails its in-flight frames and is restarted (one that
+  cannot start fails engine startup instead); a frame not answered within
+  the analysis timeout kills its worker, which is then restarted the same way
+
+Env: FACE_ANALYSIS_SLOTS (slots per worker, 2), FACE_ANALYSIS_SLOT_BYTES
+(largest frame, encoded or raw, default one raw 720p BGR frame),
+FACE_ANALYSIS_TIMEOUT_MS (longest analysis of one frame, 10000)
+"""
+
+import os
+import time
+import asyncio
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import profiling
+
+SLOTS_PER_WORKER = int(os.environ.get('FACE_ANALYSIS_SLOTS', 2))
+SLOT_BYTES = int(os.environ.get('FACE_ANALYSIS_SLOT_BYTES', 1280 * 720 * 3))
+ANALYSIS_TIMEOUT_MS = int(os.environ.get('FACE_ANALYSIS_TIMEOUT_MS', 10000))
+
+logger = logging.getLogger(__name__)
+
+
+class PoolBusyError(Exception):
+    """No analysis slot became free in time, or too many requests are already waiting"""
+
+
+def decode_frame(frame_bytes, max_height):
+    """BGR frame from encoded image bytes (or any buffer), downscaled to max_height; None if undecodable"""
+    import cv2
+
+    frame = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None or frame.size == 0:
+        return None
+    h, w = frame.shape[:2]
+    if h > max_height:
+        frame = cv2.resize(frame, (int(w * max_height / h), max_height))
+    return frame
+
+
+# =====================================================================
+# WORKER PROCESS
+# =====================================================================
+
+def _read_frame(buf, fmt, meta, max_height):
+    """Frame from a shared-memory slot without copying the encoded bytes"""
+    if fmt == "encoded":
+        frame = decode_frame(buf[:meta], max_height)
+        if frame is None:
+            raise ValueError("Invalid image data")
+        return frame
+    shape, dtype = meta
+    return np.ndarray(shape, dtype=dtype, buffer=buf)
+
+
+def _analyze_slot(analyzer, session, buf, fmt, meta, max_height):
+    """Analyze the frame in one slot; stream frames go through the session's motion gate first"""
+    from vision_mediapipe import analyze_gated
+
+    def read():
+        with profiling.span('decode'):
+            return _read_frame(buf, fmt, meta, max_height)
+
+    with profiling.span('analyze'):
+        if session is None:
+            return analyzer.analyze_frame(read())
+        # Motion gate before decoding: an unchanged frame is never fully decoded
+        source = buf[:meta] if fmt == "encoded" else read()
+        return analyze_gated(analyzer, session, source, read)
+
+
+def _worker_main(index, conn, slot_names, max_faces):
+    """Worker loop: one analyzer, per-connection sessions, frames read from shared memory"""
+    from vision_mediapipe import AnalysisSession, FaceAnalyzer
+
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]
+    analyzer = FaceAnalyzer(max_num_faces=max_faces)
+    analyzer.warm_up()
+    sessions = {}
+    conn.send(("ready", index))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "stop":
+                break
+            if message[0] == "close":
+                sessions.pop(message[1], None)
+                continue
+
+            _, request_id, session_id, slot, fmt, meta, max_height = message
+            profiler = profiling.begin('face_analyzer')
+            try:
+                session = sessions.setdefault(session_id, AnalysisSession()) if session_id else None
+                # The views on the slot go with the call's frame, before the slot is reused
+                result = _analyze_slot(analyzer, session, slots[slot].buf, fmt, meta, max_height)
+                if profiler.active:
+                    # A copy: the session keeps the result as the motion gate's reference
+                    result = {**result, 'timings': profiler.timings()} if profiler.report else result
+                    profiler.write_trace()
+                response = (request_id, "ok", result)
+            except ValueError as e:
+                response = (request_id, "invalid", str(e))
+            except Exception as e:
+                response = (request_id, "error", str(e))
+            conn.send(response)
+    finally:
+        analyzer.close()
+        for shm in slots:
+            try:
+                shm.close()
+            except BufferError:
+                pass
+
+
+# =====================================================================
+# PARENT SIDE
+# =====================================================================
+
+class _Worker:
+    """Parent-side handle: process, pipe, shared-memory slots and in-flight requests"""
+
+    def __init__(self, index, slots, slot_bytes):
+        self.index = index
+        self.slots = [shared_memory.SharedMemory(create=True, size=slot_bytes) for _ in range(slots)]
+        self.free = asyncio.Queue()
+        for slot in range(slots):
+            self.free.put_nowait(slot)
+        self.pending = {}  # request_id -> (future, slot)
+        self.connections = 0
+        self.completed = 0
+        self.restarts = 0
+        self.ready = None
+        self.process = None
+        self.conn = None
+
+    def release(self):
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
+
+
+class AnalysisEngine:
+    """Fixed set of analyzer processes with connection affinity and shared-memory frame transfer"""
+
+    def __init__(self, workers, queue_size, queue_timeout, max_faces=3,
+                 slots_per_worker=SLOTS_PER_WORKER, slot_bytes=SLOT_BYTES,
+                 analysis_timeout=ANALYSIS_TIMEOUT_MS / 1000):
+        self.size = workers
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.analysis_timeout = analysis_timeout
+        self.max_faces = max_faces
+        self.slots_per_worker = slots_per_worker
+        self.slot_bytes = slot_bytes
+        self.ready = False
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.stalled = 0
+        self._stopping = False
+        self._ids = itertools.count(1)
+        self._pinned = {}  # session_id -> _Worker
+        self._workers = []
+        self._loop = None
+        # Spawned (not forked) workers: the server process already runs threads
+        self._ctx = multiprocessing.get_context('spawn')
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for index in range(self.size):
+            worker = _Worker(index, self.slots_per_worker, self.slot_bytes)
+            self._workers.append(worker)
+            self._spawn(worker)
+        try:
+            await asyncio.gather(*(worker.ready for worker in self._workers))
+        except Exception:
+            self.shutdown()
+            raise
+        self.ready = True
+
+    def _spawn(self, worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+        worker.conn = parent_conn
+        worker.ready = self._loop.create_future()
+        worker.process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker.index, child_conn, [shm.name for shm in worker.slots], self.max_faces),
+            name=f"face-analyzer-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+        threading.Thread(target=self._read_responses, args=(worker, parent_conn, worker.ready),
+                         name=f"face-analyzer-{worker.index}-reader", daemon=True).start()
+
+    def _read_responses(self, worker, conn, ready):
+        """Reader thread: hand each worker response to the event loop"""
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "ready":
+                self._loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(True))
+            else:
+                self._loop.call_soon_threadsafe(self._on_response, worker, *message)
+        if not self._stopping:
+            self._loop.call_soon_threadsafe(self._on_worker_exit, worker, conn)
+
+    def _on_response(self, worker, request_id, status, payload):
+        future, slot = worker.pending.pop(request_id, (None, None))
+        if future is None:
+            return
+        # The slot is only reusable once the worker has answered, even if the caller gave up
+        worker.free.put_nowait(slot)
+        worker.completed += 1
+        if future.done():
+            return
+        if status == "ok":
+            future.set_result(payload)
+        elif status == "invalid":
+            future.set_exception(ValueError(payload))
+        else:
+            future.set_exception(RuntimeError(payload))
+
+    def _on_worker_exit(self, worker, conn):
+        if self._stopping or conn is not worker.conn:
+            return
+        if not worker.ready.done():
+            # Died while loading its model: restarting would only loop, so fail startup instead
+            worker.ready.set_exception(RuntimeError(
+                f"Face analyzer worker {worker.index} failed to start (exit code {worker.process.exitcode})"))
+            return
+        logger.error(f"[ERROR] Face analyzer worker {worker.index} (pid {worker.process.pid}) exited; restarting")
+        for future, slot in worker.pending.values():
+            worker.free.put_nowait(slot)
+            if not future.done():
+                future.set_exception(RuntimeError("Analysis worker exited"))
+        worker.pending.clear()
+        worker.restarts += 1
+        # Frames sent before the new worker is warm simply wait in its pipe
+        self._spawn(worker)
+
+    def shutdown(self):
+        self.ready = False
+        self._stopping = True
+        for worker in self._workers:
+            try:
+                worker.conn.send(("stop",))
+            except Exception:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.release()
+
+    def open(self, session_id):
+        """Pin a stream to the worker with the fewest connections"""
+        worker = min(self._workers, key=lambda w: (w.connections, len(w.pending)))
+        worker.connections += 1
+        self._pinned[session_id] = worker
+        return worker.index
+
+    def close(self, session_id):
+        worker = self._pinned.pop(session_id, None)
+        if worker is None:
+            return
+        worker.connections -= 1
+        try:
+            worker.conn.send(("close", session_id))
+        except Exception:
+            pass
+
+    async def analyze(self, frame, session_id=None, max_height=480):
+        """Analyze encoded image bytes or a BGR array.
+
+        Pinned sessions always go to their worker; one-off frames go to the worker
+        with the most free slots. Raises PoolBusyError, ValueError (bad image) or
+        RuntimeError (analysis failed, or not finished within analysis_timeout).
+        """
+        worker = self._pinned.get(session_id) or max(self._workers, key=lambda w: w.free.qsize())
+        if worker.free.empty() and self.waiting >= self.queue_size:
+            self.rejected += 1
+            raise PoolBusyError("Face analysis queue is full")
+
+        self.waiting += 1
+        try:
+            with profiling.span('queue'):
+                slot = await asyncio.wait_for(worker.free.get(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise PoolBusyError(f"No face analyzer free within {int(self.queue_timeout * 1000)}ms")
+        finally:
+            self.waiting -= 1
+
+        # Round trip to the worker, timed from before the transfer (on a busy core the worker can
+        # finish before send() returns); the stages the worker reports are charged out of it
+        with profiling.span('worker'):
+            request_id = None
+            try:
+                buf = worker.slots[slot].buf
+                if isinstance(frame, np.ndarray):
+                    frame = np.ascontiguousarray(frame)
+                    if frame.nbytes > self.slot_bytes:
+                        raise ValueError("Frame is too large")
+                    np.ndarray(frame.shape, dtype=frame.dtype, buffer=buf)[...] = frame
+                    fmt, meta = "array", (frame.shape, frame.dtype.str)
+                else:
+                    if len(frame) > self.slot_bytes:
+                        raise ValueError("Frame is too large")
+                    buf[:len(frame)] = frame
+                    fmt, meta = "encoded", len(frame)
+
+                request_id = next(self._ids)
+                future = self._loop.create_future()
+                worker.pending[request_id] = (future, slot)
+                worker.conn.send(("analyze", request_id, session_id, slot, fmt, meta, max_height))
+            except Exception:
+                worker.pending.pop(request_id, None)
+                worker.free.put_nowait(slot)
+                raise
+
+            try:
+                result = await asyncio.wait_for(asyncio.shield(future), timeout=self.analysis_timeout)
+            except asyncio.TimeoutError:
+                self._recycle(worker, request_id)
+                future.cancel()  # nobody is waiting for it any more
+                raise RuntimeError(f"Analysis did not finish within {int(self.analysis_timeout * 1000)}ms")
+            profiling.current().merge(result.pop('timings', None))
+        return result
+
+    def _recycle(self, worker, request_id):
+        """Kill a worker stuck on a frame; its reader thread then sees the exit and
+        _on_worker_exit fails its other frames and restarts it, as after a crash"""
+        if request_id not in worker.pending:
+            return  # answered or failed meanwhile (e.g. the worker already crashed)
+        self.stalled += 1
+        logger.error(f"[ERROR] Face analyzer worker {worker.index} (pid {worker.process.pid}) "
+                     f"stalled for {self.analysis_timeout:.1f}s; recycling")
+        worker.process.kill()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "analyzers": self.size,
+            "in_use": sum(len(w.pending) for w in self._workers),
+            "waiting": self.waiting,
+            "completed": sum(w.completed for w in self._workers),
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "stalled": self.stalled,
+            "workers": [
+                {"index": w.index, "pid": w.process.pid if w.process else None, "connections": w.connections,
+                 "in_flight": len(w.pending), "completed": w.completed, "restarts": w.restarts}
+                for w in self._workers
+            ],
+        }
+
+
+def benchmark(workers, frames=200, max_height=480):
+    """Frames per second through an engine of `workers` processes (synthetic JPEG frames)"""
+    import cv2
+
+    ok, jpeg = cv2.imencode('.jpg', np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8))
+    jpeg = jpeg.tobytes()
+
+    async def run():
+        engine = AnalysisEngine(workers, queue_size=frames, queue_timeout=60)
+        await engine.start()
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*(engine.analyze(jpeg, max_height=max_height) for _ in range(frames)))
+            return frames / (time.perf_counter() - started)
+        finally:
+            engine.shutdown()
+
+    return asyncio.run(run())
+
+
+if __name__ == "__main__":
+    # Scaling check: python analysis_engine.py [max_workers]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    limit = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    for count in sorted({1, *range(2, limit + 1, 2), limit}):
+        print(f"{count} worker(s): {benchmark(count):.1f} frames/s")
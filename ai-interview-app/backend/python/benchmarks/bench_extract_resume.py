@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+"""
+Resume Extractor Benchmark
+Generates a synthetic local corpus of PDF and DOCX resumes and times each
+stage of extract_resume.py separately, writing machine-readable JSON.
+
+Corpus shapes: single-column, two-column, table-heavy, 1-40 pages, image-only.
+Stages: base64_decode, text_extraction, section_parse, and inside section_parse
+(one parse_sections pass, timed with profiling laps) contact_parse, skill_match
+and section_split (headers, bio and section lines).
+
+Usage:
+  python benchmarks/bench_extract_resume.py                      # run, print summary, write results JSON
+  python benchmarks/bench_extract_resume.py --save-baseline      # also store the results as the baseline
+  python benchmarks/bench_extract_resume.py --baseline base.json # compare against another baseline
+  python benchmarks/bench_extract_resume.py --check              # CI: exit 1 on a regression, 2 if no baseline
+
+The committed baseline (baselines/extract_resume.json) records the machine it
+was measured on; re-save it with --save-baseline when the reference machine changes.
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import base64
+import random
+import struct
+import zlib
+import argparse
+import platform
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling
+from extract_resume import decode_base64_file, extract_text_from_source, parse_sections
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus', 'resumes')
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results', 'extract_resume.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'extract_resume.json')
+
+STAGES = ('base64_decode', 'text_extraction', 'section_parse', 'contact_parse', 'skill_match', 'section_split')
+# parse_sections lap names -> benchmark stages
+PARSE_STAGES = {'contact': 'contact_parse', 'skills': 'skill_match', 'sections': 'section_split'}
+
+# (layout, pages) combinations generated for each file type
+CORPUS_SHAPES = [
+    ('single_column', 1), ('single_column', 2), ('single_column', 10), ('single_column', 40),
+    ('two_column', 1), ('two_column', 2),
+    ('table_heavy', 1), ('table_heavy', 5),
+    ('image_only', 1),
+]
+
+# A stage regresses only if its best time is both this much slower and at least MIN_REGRESSION_MS slower
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 2.0
+
+LINES_PER_PAGE = 48
+
+FIRST_NAMES = ['Asha', 'Rahul', 'Maria', 'John', 'Wei', 'Fatima', 'Liam', 'Priya']
+LAST_NAMES = ['Nair', 'Sharma', 'Garcia', 'Smith', 'Chen', 'Khan', 'Murphy', 'Iyer']
+SKILLS = ['Python', 'JavaScript', 'React', 'Node.js', 'Docker', 'Kubernetes', 'AWS', 'SQL',
+          'MongoDB', 'Java', 'C++', 'Git', 'Linux', 'TensorFlow', 'GraphQL', 'Redis']
+FILLER = ('designed built maintained scalable services pipelines teams delivered reduced latency '
+          'improved reliability customers platform features migrated automated monitoring').split()
+
+
+# =====================================================================
+# SYNTHETIC CONTENT
+# =====================================================================
+
+def resume_lines(rng, pages):
+    """Plain resume lines long enough to fill roughly `pages` pages"""
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    lines = [
+        name,
+        f"{name.split()[0].lower()}@example.com | +1 555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}",
+        f"linkedin.com/in/{name.replace(' ', '-').lower()}",
+        "SUMMARY",
+        "Software engineer with " + ", ".join(rng.sample(SKILLS, 4)) + " experience.",
+        "EXPERIENCE",
+    ]
+    while len(lines) < pages * LINES_PER_PAGE - 6:
+        lines.append(" ".join(rng.choice(FILLER) for _ in range(10)) + " using " + rng.choice(SKILLS))
+    lines += ["EDUCATION", "B.Tech Computer Science", "SKILLS", ", ".join(rng.sample(SKILLS, 8))]
+    return lines
+
+
+def table_rows(rng, pages):
+    """Rows for table-heavy documents (4 columns)"""
+    rows = [["Company", "Role", "Years", "Stack"]]
+    while len(rows) < pages * 30:
+        rows.append([f"Company {len(rows)}", rng.choice(['Engineer', 'Lead', 'Intern']),
+                     f"{rng.randint(2010, 2020)}-{rng.randint(2021, 2024)}", rng.choice(SKILLS)])
+    return rows
+
+
+def noise_image(rng, width=400, height=560):
+    """8-bit grayscale pixels that look vaguely like a scanned page"""
+    rows = []
+    for y in range(height):
+        if y % 14 < 9 and 40 < y < height - 40:
+            rows.append(bytes(rng.choice((30, 240)) if 40 < x < width - 40 else 255 for x in range(width)))
+        else:
+            rows.append(bytes([255]) * width)
+    return b"".join(rows), width, height
+
+
+# =====================================================================
+# MINIMAL PDF WRITER (no extra dependencies)
+# =====================================================================
+
+def _pdf_escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf_text(x, y, text, size=10):
+    return f"BT /F1 {size} Tf {x} {y} Td ({_pdf_escape(text)}) Tj ET\n"
+
+
+def build_pdf(page_streams, image=None):
+    """Assemble a PDF from per-page content streams (optionally sharing one grayscale image)"""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    image_ref = None
+    if image is not None:
+        pixels, width, height = image
+        data = zlib.compress(pixels)
+        image_ref = add(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode()
+            + data + b"\nendstream"
+        )
+
+    page_refs = []
+    for stream in page_streams:
+        content = stream.encode('latin-1')
+        content_ref = add(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        resources = f"/Font << /F1 {font} 0 R >>"
+        if image_ref:
+            resources += f" /XObject << /Im1 {image_ref} 0 R >>"
+        page_refs.append(add(
+            f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << {resources} >> /Contents {content_ref} 0 R >>".encode()
+        ))
+
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages} 0 R >>".encode()
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs)
+    objects[pages - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_refs)} >>".encode()
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    for offset in offsets:
+        out.write(f"{offset:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_pdf(layout, pages, rng):
+    if layout == 'image_only':
+        return build_pdf(["q 512 0 0 717 50 40 cm /Im1 Do Q\n"] * pages, image=noise_image(rng))
+
+    if layout == 'table_heavy':
+        rows = table_rows(rng, pages)
+        streams = []
+        for start in range(0, len(rows), 30):
+            stream = ""
+            for i, row in enumerate(rows[start:start + 30]):
+                y = 740 - i * 22
+                for col, cell in enumerate(row):
+                    x = 50 + col * 128
+                    stream += f"{x} {y - 6} 128 22 re S\n" + _pdf_text(x + 4, y, cell, 9)
+            streams.append(stream)
+        return build_pdf(streams)
+
+    lines = resume_lines(rng, pages)
+    streams = []
+    if layout == 'two_column':
+        per_page = LINES_PER_PAGE * 2
+        for start in range(0, len(lines), per_page):
+            chunk = lines[start:start + per_page]
+            stream = ""
+            for i, line in enumerate(chunk):
+                x = 50 if i < LINES_PER_PAGE else 320
+                y = 750 - (i % LINES_PER_PAGE) * 15
+                stream += _pdf_text(x, y, line[:45], 9)
+            streams.append(stream)
+    else:
+        for start in range(0, len(lines), LINES_PER_PAGE):
+            streams.append("".join(
+                _pdf_text(50, 750 - i * 15, line) for i, line in enumerate(lines[start:start + LINES_PER_PAGE])
+            ))
+    return build_pdf(streams)
+
+
+# =====================================================================
+# DOCX WRITER (python-docx, already required by extract_resume.py)
+# =====================================================================
+
+def _png_bytes(pixels, width, height):
+    """Encode 8-bit grayscale pixels as PNG"""
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    raw = b"".join(b"\x00" + pixels[y * width:(y + 1) * width] for y in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b''))
+
+
+def make_docx(layout, pages, rng):
+    import docx
+    from docx.enum.text import WD_BREAK
+    from docx.oxml.ns import qn
+    from docx.shared import Inches
+
+    document = docx.Document()
+
+    if layout == 'image_only':
+        for page in range(pages):
+            document.add_picture(io.BytesIO(_png_bytes(*noise_image(rng))), width=Inches(6))
+            if page < pages - 1:
+                document.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    elif layout == 'table_heavy':
+        rows = table_rows(rng, pages)
+        table = document.add_table(rows=len(rows), cols=4)
+        for row, values in zip(table.rows, rows):
+            for cell, value in zip(row.cells, values):
+                cell.text = value
+    else:
+        if layout == 'two_column':
+            cols = document.sections[0]._sectPr.makeelement(qn('w:cols'), {qn('w:num'): '2'})
+            document.sections[0]._sectPr.append(cols)
+        for i, line in enumerate(resume_lines(rng, pages)):
+            paragraph = document.add_paragraph(line)
+            if i and i % LINES_PER_PAGE == 0:
+                paragraph.add_run().add_break(WD_BREAK.PAGE)
+
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+
+def build_corpus(corpus_dir, seed=7):
+    """Generate (or reuse) the synthetic corpus; returns a list of document descriptors"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    documents = []
+    for file_type, maker in (('pdf', make_pdf), ('docx', make_docx)):
+        for layout, pages in CORPUS_SHAPES:
+            name = f"{layout}_{pages}p.{file_type}"
+            path = os.path.join(corpus_dir, name)
+            if not os.path.exists(path):
+                data = maker(layout, pages, random.Random(f"{seed}-{name}"))
+                with open(path, 'wb') as f:
+                    f.write(data)
+            documents.append({"name": name, "type": file_type, "layout": layout, "pages": pages, "path": path})
+    return documents
+
+
+# =====================================================================
+# TIMING
+# =====================================================================
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args), None, (time.perf_counter() - start) * 1000
+    except Exception as e:
+        return None, str(e), (time.perf_counter() - start) * 1000
+
+
+def bench_document(document, repeats):
+    """Time each stage of one document `repeats` times"""
+    with open(document['path'], 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('ascii')
+
+    samples = {stage: [] for stage in STAGES}
+    status, error, chars = "ok", None, 0
+
+    for _ in range(repeats):
+        file_bytes, _, elapsed = _timed(decode_base64_file, encoded)
+        samples['base64_decode'].append(elapsed)
+
+        text, error, elapsed = _timed(extract_text_from_source, file_bytes, document['type'])
+        samples['text_extraction'].append(elapsed)
+        if text is None:
+            # Image-only documents are expected to land here
+            status = "no_text"
+            continue
+
+        chars = len(text)
+        profiling.begin('bench_extract_resume', report=False, trace_file=None)
+        _, _, elapsed = _timed(parse_sections, text)
+        samples['section_parse'].append(elapsed)
+        # Sub-stages from a second, profiled pass, so lap overhead stays out of section_parse
+        profiler = profiling.begin('bench_extract_resume', report=True, sample_rate=1, trace_file=None)
+        parse_sections(text)
+        timings = profiler.timings()
+        for lap, stage in PARSE_STAGES.items():
+            samples[stage].append(timings.get(f"{lap}_ms", 0.0))
+
+    stages = {
+        stage: {"median_ms": round(statistics.median(values), 3), "min_ms": round(min(values), 3)}
+        for stage, values in samples.items() if values
+    }
+    return {
+        "name": document['name'],
+        "type": document['type'],
+        "layout": document['layout'],
+        "pages": document['pages'],
+        "bytes": os.path.getsize(document['path']),
+        "chars": chars,
+        "status": status,
+        "error": error if status != "ok" else None,
+        "stages": stages,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """Stages whose best time got slower than the baseline by more than the tolerance"""
+    previous = {doc['name']: doc for doc in baseline.get('documents', [])}
+    regressions = []
+    for doc in results['documents']:
+        base_doc = previous.get(doc['name'])
+        if not base_doc:
+            continue
+        for stage, timing in doc['stages'].items():
+            base_timing = base_doc.get('stages', {}).get(stage)
+            if not base_timing:
+                continue
+            before, after = base_timing['min_ms'], timing['min_ms']
+            if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_MS:
+                regressions.append({
+                    "document": doc['name'],
+                    "stage": stage,
+                    "baseline_ms": before,
+                    "current_ms": after,
+                    "change": round(after / before - 1, 3) if before else None,
+                })
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract_resume.py stages on a synthetic corpus")
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS_DIR, help="corpus directory (generated if missing)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="where to write the results JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="fail (exit 2) if the baseline is missing instead of skipping the comparison")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.check and args.save_baseline:
+        parser.error("--check and --save-baseline are mutually exclusive")
+    if args.check and not os.path.exists(args.baseline):
+        print(json.dumps({"success": False, "error": f"Baseline not found: {args.baseline} (run with --save-baseline)"}))
+        sys.exit(2)
+
+    documents = build_corpus(args.corpus)
+    results = {
+        "benchmark": "extract_resume",
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeats": args.repeats,
+        "documents": [],
+    }
+
+    for document in documents:
+        result = bench_document(document, args.repeats)
+        results['documents'].append(result)
+        timings = "  ".join(f"{stage}={t['median_ms']:.2f}ms" for stage, t in result['stages'].items())
+        print(f"{result['name']:<24} {result['status']:<8} {timings}", file=sys.stderr)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        results['baseline'] = args.baseline
+    elif not args.save_baseline:
+        print(f"WARNING no baseline at {args.baseline}; regressions were not checked", file=sys.stderr)
+        results['baseline'] = None
+    results['regressions'] = regressions
+
+    write_json(args.output, results)
+    if args.save_baseline:
+        write_json(args.baseline, results)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression['document']} {regression['stage']}: "
+              f"{regression['baseline_ms']}ms -> {regression['current_ms']}ms", file=sys.stderr)
+
+    print(json.dumps({"success": True, "output": args.output, "regressions": len(regressions)}))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Face Verification Benchmark
+Builds same-person and different-person photo pairs from augmented copies of a
+set of identities and runs every matching method in face_verification.py on
+them, reporting speed and accuracy side by side in machine-readable JSON.
+
+Identities: procedurally drawn faces (default), or real photos with
+--faces DIR laid out as DIR/<person>/<photo>.jpg.
+Augmentations: crop, brightness, jpeg (quality), rotation, combined.
+Methods: face_recognition, opencv_structural, histogram, plus the full
+verify() cascade. Unavailable methods are reported and skipped.
+
+Per method: latency percentiles (decode + match), single-worker throughput,
+ROC curve and AUC, false-accept / false-reject rate at MATCH_THRESHOLD,
+and the genuine-accept rate per augmentation.
+
+Usage:
+  python benchmarks/bench_face_verification.py                       # run, print summary, write results JSON
+  python benchmarks/bench_face_verification.py --save-baseline       # also store the results as the baseline
+  python benchmarks/bench_face_verification.py --faces ~/lfw_subset  # use real photos
+  python benchmarks/bench_face_verification.py --check              # CI: exit 1 on a regression, 2 if no baseline
+
+The committed baseline (baselines/face_verification.json) records the machine it
+was measured on; re-save it with --save-baseline when the reference machine changes.
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import base64
+import random
+import shutil
+import argparse
+import contextlib
+import platform
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import face_verification
+import reference_cache
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results', 'face_verification.json')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baselines', 'face_verification.json')
+
+AUGMENTATIONS = ('crop', 'brightness', 'jpeg', 'rotation', 'combined')
+METHODS = ('face_recognition', 'opencv_structural', 'histogram', 'cascade')
+
+IMAGE_SIZE = 480
+REFERENCE_QUALITY = 90
+
+# Latency regresses if p50 is both this much slower and at least MIN_REGRESSION_MS slower;
+# accuracy regresses if AUC drops or the false-accept rate rises by more than ACCURACY_TOLERANCE
+DEFAULT_TOLERANCE = 0.25
+MIN_REGRESSION_MS = 2.0
+ACCURACY_TOLERANCE = 0.02
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+# =====================================================================
+# IDENTITIES
+# =====================================================================
+
+def draw_face(rng, size=IMAGE_SIZE):
+    """A cartoon face whose proportions and colors are fixed by the identity's rng"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    skin = tuple(rng.randint(120, 230) - d for d in (0, 25, 55))
+    background = tuple(rng.randint(40, 220) for _ in range(3))
+    hair = tuple(rng.randint(10, 90) for _ in range(3))
+    img = Image.new('RGB', (size, size), background)
+    draw = ImageDraw.Draw(img)
+
+    fw = rng.uniform(0.50, 0.62) * size
+    fh = fw * rng.uniform(1.2, 1.4)
+    cx, cy = size / 2, size * 0.52
+    draw.ellipse([cx - fw / 2, cy - fh / 2, cx + fw / 2, cy + fh / 2], fill=skin)
+    draw.chord([cx - fw / 2 - 5, cy - fh / 2 - 10, cx + fw / 2 + 5, cy - fh / 2 + fh * 0.45], 180, 360, fill=hair)
+
+    eye_y = cy - fh * rng.uniform(0.06, 0.12)
+    eye_gap = fw * rng.uniform(0.19, 0.25)
+    eye_r = fw * rng.uniform(0.06, 0.08)
+    brow = tuple(max(0, c - 60) for c in hair)
+    for side in (-1, 1):
+        ex = cx + side * eye_gap
+        draw.ellipse([ex - eye_r * 1.6, eye_y - eye_r, ex + eye_r * 1.6, eye_y + eye_r], fill=(240, 240, 240))
+        draw.ellipse([ex - eye_r * 0.7, eye_y - eye_r * 0.7, ex + eye_r * 0.7, eye_y + eye_r * 0.7], fill=(40, 30, 20))
+        draw.line([ex - eye_r * 2, eye_y - eye_r * 2.2, ex + eye_r * 2, eye_y - eye_r * 2.4], fill=brow,
+                  width=int(eye_r * 0.8))
+
+    nose_y = cy + fh * rng.uniform(0.08, 0.14)
+    shade = tuple(max(0, c - 50) for c in skin)
+    draw.polygon([(cx, eye_y + eye_r), (cx - fw * 0.07, nose_y), (cx + fw * 0.07, nose_y)], fill=shade)
+    mouth_y = cy + fh * rng.uniform(0.24, 0.3)
+    mouth_w = fw * rng.uniform(0.15, 0.25)
+    draw.chord([cx - mouth_w, mouth_y - fh * 0.04, cx + mouth_w, mouth_y + fh * 0.05], 0, 180, fill=(150, 50, 60))
+    return img.filter(ImageFilter.GaussianBlur(2))
+
+
+def synthetic_identities(count, seed):
+    """[(name, [PIL images])] of drawn identities (one base image each)"""
+    return [(f"synthetic_{i:03d}", [draw_face(random.Random(f"{seed}-face-{i}"))]) for i in range(count)]
+
+
+def photo_identities(faces_dir, count):
+    """[(name, [PIL images])] from DIR/<person>/<photo> (people with no photos are skipped)"""
+    from PIL import Image
+
+    identities = []
+    for person in sorted(os.listdir(faces_dir)):
+        person_dir = os.path.join(faces_dir, person)
+        if not os.path.isdir(person_dir):
+            continue
+        photos = [os.path.join(person_dir, name) for name in sorted(os.listdir(person_dir))
+                  if name.lower().endswith(PHOTO_EXTENSIONS)]
+        if photos:
+            identities.append((person, [Image.open(path).convert('RGB') for path in photos]))
+        if len(identities) >= count:
+            break
+    return identities
+
+
+# =====================================================================
+# AUGMENTATION AND PAIRS
+# =====================================================================
+
+def augment(img, kind, rng):
+    """Apply one augmentation; returns (PIL image, JPEG quality, params)"""
+    from PIL import ImageEnhance
+
+    quality = REFERENCE_QUALITY
+    params = {}
+    kinds = ('crop', 'brightness', 'jpeg', 'rotation') if kind == 'combined' else (kind,)
+
+    for step in kinds:
+        if step == 'crop':
+            keep = rng.uniform(0.75, 0.95)
+            w, h = img.size
+            cw, ch = int(w * keep), int(h * keep)
+            x, y = rng.randint(0, w - cw), rng.randint(0, h - ch)
+            img = img.crop((x, y, x + cw, y + ch)).resize((w, h))
+            params['crop'] = round(keep, 2)
+        elif step == 'brightness':
+            factor = rng.choice((rng.uniform(0.55, 0.85), rng.uniform(1.15, 1.45)))
+            img = ImageEnhance.Brightness(img).enhance(factor)
+            params['brightness'] = round(factor, 2)
+        elif step == 'jpeg':
+            quality = rng.randint(15, 60)
+            params['quality'] = quality
+        elif step == 'rotation':
+            angle = rng.uniform(-15, 15)
+            img = img.rotate(angle, resample=3, fillcolor=img.getpixel((0, 0)))
+            params['rotation'] = round(angle, 1)
+    return img, quality, params
+
+
+def to_data_url(img, quality):
+    out = io.BytesIO()
+    img.save(out, 'JPEG', quality=quality)
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode('ascii')
+
+
+def build_pairs(identities, pairs_per_identity, seed):
+    """Same-person and different-person pairs, augmentations cycled for even coverage"""
+    rng = random.Random(f"{seed}-pairs")
+    references = [to_data_url(images[0], REFERENCE_QUALITY) for _, images in identities]
+    pairs = []
+    for i, (name, images) in enumerate(identities):
+        for j in range(pairs_per_identity):
+            kind = AUGMENTATIONS[(i + j) % len(AUGMENTATIONS)]
+
+            img, quality, params = augment(rng.choice(images), kind, rng)
+            pairs.append({"reference": i, "current": to_data_url(img, quality), "same": True,
+                          "augmentation": kind, "params": params})
+
+            other = rng.choice([k for k in range(len(identities)) if k != i])
+            img, quality, params = augment(rng.choice(identities[other][1]), kind, rng)
+            pairs.append({"reference": i, "current": to_data_url(img, quality), "same": False,
+                          "augmentation": kind, "params": params})
+    return references, pairs
+
+
+# =====================================================================
+# RUNNING METHODS
+# =====================================================================
+
+def run_method(method, reference, current):
+    """Score one pair with one method: (score or None, error)"""
+    if method == 'cascade':
+        result = face_verification.verify(reference, current)
+        return result['match_score'] if result['success'] else None, result.get('error')
+
+    ref_img = face_verification.decode_base64_image(reference)
+    cur_img = face_verification.decode_base64_image(current)
+    if ref_img is None or cur_img is None:
+        return None, "Failed to decode images"
+    if method == 'face_recognition':
+        score, error, _ = face_verification.try_face_recognition(ref_img, cur_img)
+    elif method == 'opencv_structural':
+        score, error, _ = face_verification.try_structural_similarity(ref_img, cur_img)
+    else:
+        score, error = face_verification.try_histogram_comparison(ref_img, cur_img)
+    return score, error
+
+
+def method_available(method):
+    if method == 'face_recognition':
+        return face_verification._method_available('encoding')
+    if method == 'opencv_structural':
+        return face_verification._method_available('face')
+    return True
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)), 3)
+
+
+def roc(genuine, impostor):
+    """ROC points over integer thresholds and the AUC (probability a genuine pair outscores an impostor)"""
+    genuine = np.asarray(genuine, dtype=np.float64)
+    impostor = np.asarray(impostor, dtype=np.float64)
+    points = [{"threshold": t,
+               "tpr": round(float((genuine >= t).mean()), 4),
+               "fpr": round(float((impostor >= t).mean()), 4)} for t in range(0, 101, 5)]
+    greater = (genuine[:, np.newaxis] > impostor[np.newaxis, :]).mean()
+    ties = (genuine[:, np.newaxis] == impostor[np.newaxis, :]).mean()
+    return points, round(float(greater + 0.5 * ties), 4)
+
+
+def bench_method(method, references, pairs, threshold):
+    """Run one method over every pair and summarize speed and accuracy"""
+    latencies, genuine, impostor = [], [], []
+    failures = 0
+    accepted_by_augmentation = {kind: [0, 0] for kind in AUGMENTATIONS}
+
+    for pair in pairs:
+        start = time.perf_counter()
+        # face_verification logs progress to stderr on every call
+        with contextlib.redirect_stderr(io.StringIO()):
+            score, _ = run_method(method, references[pair['reference']], pair['current'])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if score is None:
+            # A failed match (no face found, decode error) counts as a rejection
+            failures += 1
+            score = 0.0
+        (genuine if pair['same'] else impostor).append(score)
+        if pair['same']:
+            counts = accepted_by_augmentation[pair['augmentation']]
+            counts[0] += score >= threshold
+            counts[1] += 1
+
+    points, auc = roc(genuine, impostor)
+    mean_ms = float(np.mean(latencies))
+    return {
+        "method": method,
+        "status": "ok",
+        "pairs": len(pairs),
+        "failures": failures,
+        "latency_ms": {
+            "p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99), "mean": round(mean_ms, 3), "max": round(max(latencies), 3),
+        },
+        "throughput_per_s": round(1000 / mean_ms, 2) if mean_ms else None,
+        "auc": auc,
+        "false_accept_rate": round(float(np.mean(np.asarray(impostor) >= threshold)), 4),
+        "false_reject_rate": round(float(np.mean(np.asarray(genuine) < threshold)), 4),
+        "genuine_accept_by_augmentation": {
+            kind: round(accepted / total, 4) if total else None
+            for kind, (accepted, total) in accepted_by_augmentation.items()
+        },
+        "roc": points,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """Methods that got slower, or lost accuracy, compared with the baseline"""
+    previous = {m['method']: m for m in baseline.get('methods', []) if m.get('status') == 'ok'}
+    regressions = []
+    for method in results['methods']:
+        base = previous.get(method['method'])
+        if not base or method.get('status') != 'ok':
+            continue
+        before, after = base['latency_ms']['p50'], method['latency_ms']['p50']
+        if after > before * (1 + tolerance) and after - before > MIN_REGRESSION_MS:
+            regressions.append({"method": method['method'], "metric": "latency_p50_ms",
+                                "baseline": before, "current": after})
+        if method['auc'] < base['auc'] - ACCURACY_TOLERANCE:
+            regressions.append({"method": method['method'], "metric": "auc",
+                                "baseline": base['auc'], "current": method['auc']})
+        if method['false_accept_rate'] > base['false_accept_rate'] + ACCURACY_TOLERANCE:
+            regressions.append({"method": method['method'], "metric": "false_accept_rate",
+                                "baseline": base['false_accept_rate'], "current": method['false_accept_rate']})
+    return regressions
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face_verification.py methods for speed and accuracy")
+    parser.add_argument('--faces', help="directory of real photos, one subdirectory per person")
+    parser.add_argument('--identities', type=int, default=20)
+    parser.add_argument('--pairs', type=int, default=5, help="same-person pairs per identity (plus as many impostors)")
+    parser.add_argument('--methods', default=','.join(METHODS), help="comma-separated subset of " + ','.join(METHODS))
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="where to write the results JSON")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--check', action='store_true',
+                        help="fail (exit 2) if the baseline is missing instead of skipping the comparison")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.check and args.save_baseline:
+        parser.error("--check and --save-baseline are mutually exclusive")
+    if args.check and not os.path.exists(args.baseline):
+        print(json.dumps({"success": False, "error": f"Baseline not found: {args.baseline} (run with --save-baseline)"}))
+        sys.exit(2)
+
+    methods = args.methods.split(',')
+    unknown = [method for method in methods if method not in METHODS]
+    if unknown:
+        print(json.dumps({"success": False, "error": f"Unknown method(s): {', '.join(unknown)}"}))
+        sys.exit(1)
+
+    if args.faces:
+        identities = photo_identities(args.faces, args.identities)
+    else:
+        identities = synthetic_identities(args.identities, args.seed)
+    if len(identities) < 2:
+        print(json.dumps({"success": False, "error": "Need at least two identities"}))
+        sys.exit(1)
+
+    references, pairs = build_pairs(identities, args.pairs, args.seed)
+    threshold = face_verification.MATCH_THRESHOLD
+
+    # Keep the cascade's reference cache away from the real one
+    cache_dir = tempfile.mkdtemp(prefix='face_bench_cache_')
+    reference_cache._default_cache = reference_cache.ReferenceCache(cache_dir=cache_dir)
+    face_verification.warm_up()
+
+    results = {
+        "benchmark": "face_verification",
+        "generated_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "source": args.faces or "synthetic",
+        "identities": len(identities),
+        "pairs": len(pairs),
+        "match_threshold": threshold,
+        "methods": [],
+    }
+
+    for method in methods:
+        if not method_available(method):
+            results['methods'].append({"method": method, "status": "unavailable"})
+            print(f"{method:<18} unavailable", file=sys.stderr)
+            continue
+        result = bench_method(method, references, pairs, threshold)
+        results['methods'].append(result)
+        latency = result['latency_ms']
+        print(f"{method:<18} p50={latency['p50']:.1f}ms p99={latency['p99']:.1f}ms "
+              f"{result['throughput_per_s']}/s  auc={result['auc']:.3f} "
+              f"far={result['false_accept_rate']:.3f} frr={result['false_reject_rate']:.3f} "
+              f"failures={result['failures']}", file=sys.stderr)
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        results['baseline'] = args.baseline
+    elif not args.save_baseline:
+        print(f"WARNING no baseline at {args.baseline}; regressions were not checked", file=sys.stderr)
+        results['baseline'] = None
+    results['regressions'] = regressions
+
+    write_json(args.output, results)
+    if args.save_baseline:
+        write_json(args.baseline, results)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression['method']} {regression['metric']}: "
+              f"{regression['baseline']} -> {regression['current']}", file=sys.stderr)
+
+    print(json.dumps({"success": True, "output": args.output, "regressions": len(regressions)}))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
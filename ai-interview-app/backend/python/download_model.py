@@ -3,66 +3,88 @@
 Download MediaPipe FaceLandmarker model file
 
 This script downloads the required face_landmarker.task file
-from the official MediaPipe repository.
+from the official MediaPipe repository, or from a mirror, and checks it
+against models/manifest.json (see model_store.py).
 
 Official model repo: https://storage.googleapis.com/mediapipe-assets/face_landmarker.task
+
+Usage:
+  python download_model.py                       # fetch if missing or corrupt
+  python download_model.py --mirror /srv/models  # local directory, file:// or http(s) base URL
+Env:
+  MODEL_MIRROR (same as --mirror), MODEL_DIR (destination, default models/)
+  PROFILE_TIMINGS=1 prints the verify/fetch times; PROFILE_TRACE_FILE (see profiling.py)
 """
 
 import os
 import sys
-import urllib.request
-from pathlib import Path
-
-def download_model():
-    """Download face_landmarker.task model"""
-    
-    # Model URL and destination
-    model_url = "https://storage.googleapis.com/mediapipe-assets/face_landmarker.task"
-    model_dir = os.path.join(os.path.dirname(__file__), 'models')
-    model_path = os.path.join(model_dir, 'face_landmarker.task')
-    
-    # Create models directory if it doesn't exist
-    os.makedirs(model_dir, exist_ok=True)
-    
-    # Check if model already exists
-    if os.path.exists(model_path):
+import argparse
+
+import model_store
+import profiling
+
+MODEL_NAME = 'face_landmarker.task'
+
+
+def download_model(mirror=model_store.MODEL_MIRROR):
+    """Download face_landmarker.task model (resumable, checksum-verified)"""
+
+    model_path = os.path.join(model_store.MODEL_DIR, MODEL_NAME)
+    manifest = model_store.load_manifest()
+    entry = manifest[MODEL_NAME]
+    source = mirror or entry['url']
+
+    # Check if a verified model already exists
+    with profiling.span('verify'):
+        verified = model_store.verify(MODEL_NAME, manifest=manifest)
+    if verified:
         size_mb = os.path.getsize(model_path) / (1024 * 1024)
         print(f"✅ Model already exists: {model_path}")
-        print(f"   Size: {size_mb:.2f} MB")
+        print(f"   Size: {size_mb:.2f} MB (checksum OK)")
         return True
-    
+    if os.path.exists(model_path):
+        print(f"⚠️  Existing model does not match its checksum, fetching again")
+
     print("📥 Downloading MediaPipe FaceLandmarker model...")
-    print(f"   URL: {model_url}")
+    print(f"   Source: {source}")
     print(f"   Destination: {model_path}")
     print("")
-    
+
     try:
-        def download_progress(block_num, block_size, total_size):
-            downloaded = block_num * block_size
-            percent = min(downloaded * 100 // total_size, 100)
+        def download_progress(downloaded):
+            percent = min(downloaded * 100 // entry['size'], 100)
             bar_length = 40
             filled = int(bar_length * percent // 100)
             bar = '█' * filled + '░' * (bar_length - filled)
             sys.stdout.write(f'\r   [{bar}] {percent}%')
             sys.stdout.flush()
-        
-        urllib.request.urlretrieve(model_url, model_path, download_progress)
-        
+
+        with profiling.span('fetch'):
+            model_store.fetch(MODEL_NAME, mirror=mirror, manifest=manifest, progress=download_progress)
+
         print("\n\n✅ Model downloaded successfully!")
         size_mb = os.path.getsize(model_path) / (1024 * 1024)
-        print(f"   Size: {size_mb:.2f} MB")
+        print(f"   Size: {size_mb:.2f} MB (checksum OK)")
         print(f"   Location: {model_path}")
         return True
-        
+
     except Exception as e:
         print(f"\n❌ Download failed: {e}")
         print("\nTroubleshooting:")
-        print(f"  1. Check internet connection")
-        print(f"  2. Create {model_dir} directory manually")
-        print(f"  3. Download from: {model_url}")
-        print(f"  4. Place file at: {model_path}")
+        print(f"  1. Check internet connection, or pass --mirror with a local copy")
+        print(f"  2. Re-run to resume an interrupted download")
+        print(f"  3. Download from: {entry['url']}")
+        print(f"  4. Place file at: {model_path} (SHA-256 {entry['sha256']})")
         return False
 
 if __name__ == "__main__":
-    success = download_model()
+    parser = argparse.ArgumentParser(description="Download the MediaPipe FaceLandmarker model")
+    parser.add_argument('--mirror', default=model_store.MODEL_MIRROR,
+                        help="local directory, file:// or http(s) base URL holding face_landmarker.task")
+    args = parser.parse_args()
+    profiler = profiling.begin('download_model', imports=True)
+    success = download_model(args.mirror)
+    if profiler.active and profiler.report:
+        print(f"   Timings: {profiler.timings()}")
+    profiler.write_trace()
     sys.exit(0 if success else 1)
@@ -3,19 +3,54 @@
 Simple Resume Text Extractor
 Extracts text from PDF and DOCX files using pdfplumber and python-docx
 No AI - just raw text extraction
+
+Input modes:
+  JSON (default):  { "fileBase64": "...", "fileType": "pdf" } on stdin or as argv[1]
+  File path:       extract_resume.py --file /path/to/resume.pdf [pdf]
+  Raw stdin:       extract_resume.py --raw
+                   stdin = one header line with the file type ("pdf\n"), then the raw file bytes
+  Framed worker:   extract_resume.py --framed
+                   repeated requests of [4-byte big-endian header length][header JSON][payload],
+                   header = { "fileType": "pdf", "length": <payload bytes> };
+                   each response is [4-byte big-endian length][result JSON]
+
+Stage timings: PROFILE_TIMINGS=1 adds "timings" to each response; see profiling.py
 """
 
 import sys
 import json
 import io
+import os
 import base64
 import re
+import struct
+
+import profiling
+
+# Largest header line / frame header accepted from a caller
+MAX_HEADER_BYTES = 64 * 1024
+
+# Largest framed payload accepted (same 50 MB as the Node JSON body limit)
+MAX_PAYLOAD_BYTES = int(os.environ.get('RESUME_MAX_PAYLOAD_BYTES', 50 * 1024 * 1024))
+
+# Oversized payloads are discarded in chunks of this size
+SKIP_CHUNK_BYTES = 1024 * 1024
+
+FRAME_LENGTH = struct.Struct('>I')
+
+
+def _open_source(source):
+    """Wrap raw bytes in a stream; paths and file objects are passed through untouched"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    return source
+
 
 def extract_from_pdf(file_bytes):
-    """Extract text from PDF using pdfplumber"""
+    """Extract text from PDF using pdfplumber (accepts bytes, a path or a file object)"""
     try:
-        import pdfplumber
-        pdf_file = io.BytesIO(file_bytes)
+        pdfplumber = profiling.lazy_import('pdfplumber')
+        pdf_file = _open_source(file_bytes)
         text = ""
         
         with pdfplumber.open(pdf_file) as pdf:
@@ -29,10 +64,10 @@ def extract_from_pdf(file_bytes):
         raise Exception(f"PDF extraction error: {str(e)}")
 
 def extract_from_docx(file_bytes):
-    """Extract text from DOCX using python-docx"""
+    """Extract text from DOCX using python-docx (accepts bytes, a path or a file object)"""
     try:
-        import docx
-        docx_file = io.BytesIO(file_bytes)
+        docx = profiling.lazy_import('docx')
+        docx_file = _open_source(file_bytes)
         doc = docx.Document(docx_file)
         
         text = ""
@@ -50,34 +85,35 @@ def extract_from_docx(file_bytes):
     except Exception as e:
         raise Exception(f"DOCX extraction error: {str(e)}")
 
-def extract_text(file_base64, file_type):
+def decode_base64_file(file_base64):
+    """Decode a base64 payload, stripping any data URL prefix"""
+    with profiling.span('decode'):
+        if ',' in file_base64:
+            file_base64 = file_base64.split(',', 1)[1]
+        return base64.b64decode(file_base64)
+
+def extract_text_from_source(source, file_type):
     """
-    Extract text from resume file
+    Extract text from resume content
     
     Args:
-        file_base64: Base64 encoded file content
+        source: Raw file bytes, a filesystem path or a binary file object
         file_type: File extension (pdf, docx)
     
     Returns:
         Extracted text as string
     """
     try:
-        # Remove data URL prefix if present
-        if ',' in file_base64:
-            file_base64 = file_base64.split(',')[1]
-        
-        # Decode base64
-        file_bytes = base64.b64decode(file_base64)
-        
         # Extract based on file type
         file_type = file_type.lower().replace('.', '')
         
-        if file_type == 'pdf':
-            text = extract_from_pdf(file_bytes)
-        elif file_type == 'docx':
-            text = extract_from_docx(file_bytes)
-        else:
-            raise Exception(f"Unsupported file type: {file_type}")
+        with profiling.span('extract'):
+            if file_type == 'pdf':
+                text = extract_from_pdf(source)
+            elif file_type == 'docx':
+                text = extract_from_docx(source)
+            else:
+                raise Exception(f"Unsupported file type: {file_type}")
         
         if len(text.strip()) < 50:
             raise Exception("Extracted text is too short. File may be empty or corrupted.")
@@ -87,130 +123,403 @@ def extract_text(file_base64, file_type):
     except Exception as e:
         raise Exception(f"Text extraction failed: {str(e)}")
 
-def parse_contact_info(text):
-    """Extract contact information using regex"""
-    # Email
-    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
-    emails = re.findall(email_pattern, text)
-    email = emails[0] if emails else None
+def extract_text(file_base64, file_type):
+    """
+    Extract text from resume file
+    
+    Args:
+        file_base64: Base64 encoded file content
+        file_type: File extension (pdf, docx)
+    
+    Returns:
+        Extracted text as string
+    """
+    try:
+        file_bytes = decode_base64_file(file_base64)
+    except Exception as e:
+        raise Exception(f"Text extraction failed: {str(e)}")
+    
+    return extract_text_from_source(file_bytes, file_type)
+
+# Contact patterns (compiled once; email and LinkedIn are searched line by line until the
+# first hit, the phone over the whole text since a number can wrap onto the next line)
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE_PATTERN = re.compile(r'[\+]?[(]?[0-9]{3}[)]?[-\s\.]?[0-9]{3}[-\s\.]?[0-9]{4,6}')
+LINKEDIN_PATTERN = re.compile(r'(?:https?://)?(?:www\.)?linkedin\.com/in/[\w-]+', re.IGNORECASE)
+
+# Common technical skills list
+SKILL_KEYWORDS = [
+    'JavaScript', 'TypeScript', 'Python', 'Java', 'C++', 'C#', 'Ruby', 'PHP', 'Go', 'Rust',
+    'React', 'Angular', 'Vue', 'Node.js', 'Express', 'Django', 'Flask', 'Spring', 'Laravel',
+    'MongoDB', 'MySQL', 'PostgreSQL', 'Redis', 'SQL', 'NoSQL', 'Elasticsearch',
+    'AWS', 'Azure', 'GCP', 'Docker', 'Kubernetes', 'Jenkins', 'CI/CD',
+    'Git', 'GitHub', 'GitLab', 'Jira', 'Agile', 'Scrum',
+    'HTML', 'CSS', 'SASS', 'Bootstrap', 'Tailwind',
+    'REST', 'API', 'GraphQL', 'Microservices',
+    'Machine Learning', 'AI', 'Deep Learning', 'TensorFlow', 'PyTorch',
+    'Linux', 'Unix', 'Bash', 'Shell',
+    'Testing', 'Jest', 'Mocha', 'Selenium', 'Cypress'
+]
+
+# One alternation for every keyword (longest first, so "Java" never shadows "JavaScript");
+# a plural or "JS" suffix still counts ("APIs", "ReactJS", "Vue.js")
+SKILL_PATTERN = re.compile(
+    r'(?<![\w+#.])(' +
+    '|'.join(re.escape(skill) for skill in sorted(SKILL_KEYWORDS, key=len, reverse=True)) +
+    r')(?:s|\.?js)?(?![\w+#])',
+    re.IGNORECASE
+)
+SKILL_LOOKUP = {skill.lower(): skill for skill in SKILL_KEYWORDS}
+
+# Section header phrases (normalized to lowercase letters and single spaces)
+SECTION_HEADERS = {
+    'summary': 'summary', 'professional summary': 'summary', 'career summary': 'summary',
+    'profile': 'summary', 'professional profile': 'summary', 'objective': 'summary',
+    'career objective': 'summary', 'about': 'summary', 'about me': 'summary', 'bio': 'summary',
+    'experience': 'experience', 'work experience': 'experience',
+    'professional experience': 'experience', 'employment': 'experience',
+    'employment history': 'experience', 'work history': 'experience', 'internships': 'experience',
+    'education': 'education', 'academic background': 'education', 'qualifications': 'education',
+    'educational qualifications': 'education', 'academics': 'education',
+    'skills': 'skills', 'technical skills': 'skills', 'key skills': 'skills',
+    'core competencies': 'skills', 'technologies': 'skills',
+    'projects': 'projects', 'personal projects': 'projects', 'academic projects': 'projects',
+    'key projects': 'projects',
+    'contact': 'contact', 'contact information': 'contact', 'contact details': 'contact',
+}
+SECTION_NAMES = ('summary', 'experience', 'education', 'skills', 'projects', 'contact')
+HEADER_NORMALIZE_PATTERN = re.compile(r'[^a-z]+')
+
+# Fallback for headers not listed above ("EXECUTIVE SUMMARY", "Summary of Qualifications"):
+# a short header-like line containing one of these words, checked in this order
+SECTION_KEYWORDS = (
+    ('summary', {'summary', 'objective', 'profile', 'about', 'bio', 'overview'}),
+    ('experience', {'experience', 'employment', 'internship', 'internships'}),
+    ('education', {'education', 'educational', 'academic', 'academics'}),
+    ('skills', {'skills', 'competencies', 'technologies', 'expertise'}),
+    ('projects', {'projects'}),
+    ('contact', {'contact'}),
+)
+MAX_HEADER_WORDS = 4
+HEADER_REJECT_PATTERN = re.compile(r'[0-9@:,;.!?]')
+SKILL_ITEM_SPLIT_PATTERN = re.compile(r'\s*[,;|\u2022\u00b7]\s*')
+
+# Longest line that can still be a section header
+MAX_HEADER_LENGTH = 40
+
+
+def _section_for_header(line):
+    """Return the section name if `line` is a section header, otherwise None"""
+    if len(line) > MAX_HEADER_LENGTH:
+        return None
+    key = HEADER_NORMALIZE_PATTERN.sub(' ', line.lower()).strip()
+    section = SECTION_HEADERS.get(key)
+    if section is not None or HEADER_REJECT_PATTERN.search(line.rstrip(':')):
+        return section
+    words = key.split()
+    if not words or len(words) > MAX_HEADER_WORDS:
+        return None
+    for name, keywords in SECTION_KEYWORDS:
+        if keywords.intersection(words):
+            return name
+    return None
+
+def _is_contact_line(line):
+    return bool(EMAIL_PATTERN.search(line) or PHONE_PATTERN.search(line) or LINKEDIN_PATTERN.search(line))
+
+def parse_sections(text):
+    """
+    Segment resume text into sections in a single pass
     
-    # Phone
-    phone_pattern = r'[\+]?[(]?[0-9]{3}[)]?[-\s\.]?[0-9]{3}[-\s\.]?[0-9]{4,6}'
-    phones = re.findall(phone_pattern, text)
-    phone = phones[0] if phones else None
+    Contact fields stop being searched once found, skills are matched with
+    one precompiled alternation, and every section is filled in the same loop.
+    When profiled, the loop's time is split into "contact", "skills" and
+    "sections" (headers, bio and section lines).
     
-    # LinkedIn
-    linkedin_pattern = r'(?:https?://)?(?:www\.)?linkedin\.com/in/[\w-]+'
-    linkedins = re.findall(linkedin_pattern, text, re.IGNORECASE)
-    linkedin = linkedins[0] if linkedins else None
+    Returns:
+        Dict with contact, skills, bio and per-section line lists
+    """
+    laps = profiling.laps()
+    phone = PHONE_PATTERN.search(text)
+    contact = {'name': None, 'email': None, 'phone': phone.group(0) if phone else None, 'linkedin': None}
+    sections = {name: [] for name in SECTION_NAMES}
+    found_skills = set()
     
-    # Name (first line, assuming it's the name)
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
-    name = lines[0] if lines else None
+    bio_text = ""
+    bio_done = False
+    current = None
+    non_empty_seen = 0
+    early_lines = []
+    
+    for raw_line in text.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            continue
+        
+        non_empty_seen += 1
+        if contact['name'] is None:
+            # Name (first line, assuming it's the name)
+            contact['name'] = line
+        
+        # First-match short-circuit: stop searching once a field is filled
+        if contact['email'] is None:
+            match = EMAIL_PATTERN.search(line)
+            if match:
+                contact['email'] = match.group(0)
+        if contact['linkedin'] is None:
+            match = LINKEDIN_PATTERN.search(line)
+            if match:
+                contact['linkedin'] = match.group(0)
+        laps.lap('contact')
+        
+        for match in SKILL_PATTERN.finditer(line):
+            found_skills.add(match.group(1).lower())
+        laps.lap('skills')
+        
+        section = _section_for_header(line)
+        if section is not None:
+            if current == 'summary' and bio_text:
+                bio_done = True
+            current = section
+            laps.lap('sections')
+            continue
+        
+        if current is not None:
+            sections[current].append(line)
+        elif 1 < non_empty_seen <= 4 and not _is_contact_line(line) and not (line.isupper() and len(line) > 5):
+            # Fallback bio candidates after the name: no contact details or unrecognised headers
+            early_lines.append(line)
+        
+        # Summary/bio capture: stop at an all-caps line (an unrecognised header)
+        if current == 'summary' and not bio_done:
+            if line.isupper() and len(line) > 5:
+                bio_done = True
+            else:
+                bio_text += line + " "
+                # Limit bio to 3-4 lines
+                if len(bio_text) > 300:
+                    bio_done = True
+        laps.lap('sections')
+    
+    # If no bio section found, use the lines after name
+    if not bio_text and early_lines:
+        bio_text = " ".join(early_lines)
+    
+    skills_section = []
+    for line in sections['skills']:
+        skills_section.extend(item for item in SKILL_ITEM_SPLIT_PATTERN.split(line) if item)
+    laps.lap('sections')
+    laps.close()
     
     return {
-        'name': name,
-        'email': email,
-        'phone': phone,
-        'linkedin': linkedin
+        'contact': contact,
+        'skills': [skill for skill in SKILL_KEYWORDS if skill.lower() in found_skills],
+        'bio': bio_text.strip()[:500],  # Max 500 chars
+        'sections': {
+            'summary': " ".join(sections['summary']),
+            'experience': sections['experience'],
+            'education': sections['education'],
+            'skills': skills_section,
+            'projects': sections['projects'],
+            'contact': sections['contact'],
+        }
     }
 
+def parse_contact_info(text):
+    """Extract contact information using regex"""
+    return parse_sections(text)['contact']
+
 def parse_skills(text):
     """Extract skills from text"""
-    # Common technical skills list
-    skill_keywords = [
-        'JavaScript', 'TypeScript', 'Python', 'Java', 'C++', 'C#', 'Ruby', 'PHP', 'Go', 'Rust',
-        'React', 'Angular', 'Vue', 'Node.js', 'Express', 'Django', 'Flask', 'Spring', 'Laravel',
-        'MongoDB', 'MySQL', 'PostgreSQL', 'Redis', 'SQL', 'NoSQL', 'Elasticsearch',
-        'AWS', 'Azure', 'GCP', 'Docker', 'Kubernetes', 'Jenkins', 'CI/CD',
-        'Git', 'GitHub', 'GitLab', 'Jira', 'Agile', 'Scrum',
-        'HTML', 'CSS', 'SASS', 'Bootstrap', 'Tailwind',
-        'REST', 'API', 'GraphQL', 'Microservices',
-        'Machine Learning', 'AI', 'Deep Learning', 'TensorFlow', 'PyTorch',
-        'Linux', 'Unix', 'Bash', 'Shell',
-        'Testing', 'Jest', 'Mocha', 'Selenium', 'Cypress'
-    ]
-    
-    found_skills = []
-    text_lower = text.lower()
-    
-    for skill in skill_keywords:
-        if skill.lower() in text_lower:
-            found_skills.append(skill)
-    
-    return found_skills
+    return parse_sections(text)['skills']
 
 def extract_bio(text):
     """Extract summary/bio section from resume"""
-    # Common bio section headers
-    bio_headers = ['summary', 'profile', 'objective', 'about', 'bio']
+    return parse_sections(text)['bio']
+
+def parse_resume(source, file_type):
+    """Run extraction and parsing, returning the JSON-ready result"""
+    text = extract_text_from_source(source, file_type)
     
-    lines = text.split('\n')
-    bio_text = ""
-    capturing = False
+    # Parse every section in one pass
+    with profiling.span('parse'):
+        parsed = parse_sections(text)
     
-    for i, line in enumerate(lines):
-        line_lower = line.lower().strip()
-        
-        # Check if this line is a bio header
-        if any(header in line_lower for header in bio_headers):
-            capturing = True
+    return {
+        "success": True,
+        "text": text,
+        "length": len(text),
+        "contact": parsed['contact'],
+        "skills": parsed['skills'],
+        "bio": parsed['bio'],
+        "sections": parsed['sections']
+    }
+
+def _read_exact(stream, size):
+    """Read exactly `size` bytes from a binary stream, or None on clean EOF"""
+    data = stream.read(size)
+    if not data and size:
+        return None
+    if len(data) != size:
+        raise Exception(f"Truncated input: expected {size} bytes, got {len(data)}")
+    return data
+
+def read_file_input(args):
+    """--file PATH [TYPE]: the parser reads the document straight from disk"""
+    if not args:
+        raise Exception("Missing file path for --file")
+    
+    file_path = args[0]
+    file_type = args[1] if len(args) > 1 else os.path.splitext(file_path)[1]
+    
+    if not os.path.isfile(file_path):
+        raise Exception(f"File not found: {file_path}")
+    if not file_type:
+        raise Exception("Missing file type: pass it after the path or use a .pdf/.docx extension")
+    
+    return file_path, file_type
+
+def read_raw_input(stream):
+    """--raw: a single header line with the file type, followed by the raw file bytes"""
+    header = stream.readline(MAX_HEADER_BYTES)
+    if not header.endswith(b'\n'):
+        raise Exception("Missing file type header line")
+    
+    file_type = header.decode('ascii').strip()
+    if not file_type:
+        raise Exception("Missing file type in header line")
+    
+    return stream.read(), file_type
+
+def read_json_input(input_json):
+    """Legacy JSON document with base64 content (or a filePath)"""
+    input_data = json.loads(input_json)
+    file_base64 = input_data.get('fileBase64')
+    file_path = input_data.get('filePath')
+    file_type = input_data.get('fileType')
+    
+    if file_path and not file_base64:
+        return read_file_input([file_path] + ([file_type] if file_type else []))
+    
+    if not file_base64 or not file_type:
+        raise Exception("Missing required fields: fileBase64 and fileType")
+    
+    return decode_base64_file(file_base64), file_type
+
+class FrameError(Exception):
+    """Bad framed request whose bytes were fully consumed, so the stream is still in sync"""
+
+def _skip_exact(stream, size):
+    """Discard `size` bytes without buffering them"""
+    while size:
+        chunk = stream.read(min(size, SKIP_CHUNK_BYTES))
+        if not chunk:
+            raise Exception("Truncated input: missing frame payload")
+        size -= len(chunk)
+
+def read_frame(stream):
+    """Read one framed request; returns (payload, file_type) or None at EOF.
+    
+    Raises FrameError for a rejected request the worker can answer and move past,
+    any other exception when the stream can no longer be trusted.
+    """
+    prefix = _read_exact(stream, FRAME_LENGTH.size)
+    if prefix is None:
+        return None
+    
+    (header_length,) = FRAME_LENGTH.unpack(prefix)
+    if header_length == 0:
+        return None
+    if header_length > MAX_HEADER_BYTES:
+        raise Exception(f"Frame header too large: {header_length} bytes")
+    
+    header_bytes = _read_exact(stream, header_length)
+    if header_bytes is None:
+        raise Exception("Truncated input: missing frame header")
+    
+    try:
+        header = json.loads(header_bytes)
+        length = int(header.get('length', 0))
+    except (ValueError, TypeError, AttributeError) as e:
+        # Without a length the payload cannot be skipped
+        raise Exception(f"Invalid frame header: {str(e)}")
+    file_type = header.get('fileType')
+    
+    if length < 0:
+        # Nothing can follow a negative length, so the next frame starts right here
+        raise FrameError(f"Invalid frame payload length: {length}")
+    if length > MAX_PAYLOAD_BYTES:
+        _skip_exact(stream, length)
+        raise FrameError(f"Frame payload too large: {length} bytes (limit {MAX_PAYLOAD_BYTES})")
+    
+    payload = _read_exact(stream, length) if length else b''
+    if payload is None:
+        raise Exception("Truncated input: missing frame payload")
+    
+    if not file_type:
+        raise FrameError("Missing required field in frame header: fileType")
+    
+    return payload, file_type
+
+def write_frame(stream, result, profiler=None):
+    """Write one length-prefixed JSON response"""
+    body = (profiler.dumps(result) if profiler else json.dumps(result)).encode('utf-8')
+    stream.write(FRAME_LENGTH.pack(len(body)))
+    stream.write(body)
+    stream.flush()
+
+def serve_framed(stdin, stdout):
+    """Persistent worker loop: one framed request in, one framed response out"""
+    first = True
+    while True:
+        try:
+            frame = read_frame(stdin)
+        except FrameError as e:
+            write_frame(stdout, {"success": False, "error": str(e)})
             continue
+        except Exception as e:
+            # The stream is out of sync; report and stop
+            write_frame(stdout, {"success": False, "error": str(e)})
+            return 1
         
-        # Stop capturing at next section
-        if capturing and line.isupper() and len(line) > 5:
-            break
+        if frame is None:
+            return 0
         
-        # Capture bio lines
-        if capturing and line.strip():
-            bio_text += line.strip() + " "
-            
-            # Limit bio to 3-4 lines
-            if len(bio_text) > 300:
-                break
-    
-    # If no bio section found, use first few lines after name
-    if not bio_text and len(lines) > 2:
-        bio_text = " ".join(lines[2:5])
-    
-    return bio_text.strip()[:500]  # Max 500 chars
+        payload, file_type = frame
+        # Startup and imports are charged to the first request only
+        profiler = profiling.begin('extract_resume', imports=first)
+        first = False
+        try:
+            result = parse_resume(payload, file_type)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        
+        write_frame(stdout, result, profiler)
 
 def main():
     """Main entry point"""
+    args = sys.argv[1:]
+    
+    if args and args[0] == '--framed':
+        sys.exit(serve_framed(sys.stdin.buffer, sys.stdout.buffer))
+    
+    profiler = profiling.begin('extract_resume', imports=True)
     try:
-        # Read input from stdin or argument
-        if len(sys.argv) > 1:
-            input_json = sys.argv[1]
-        else:
-            input_json = sys.stdin.read()
-        
-        # Parse input
-        input_data = json.loads(input_json)
-        file_base64 = input_data.get('fileBase64')
-        file_type = input_data.get('fileType')
-        
-        if not file_base64 or not file_type:
-            raise Exception("Missing required fields: fileBase64 and fileType")
-        
-        # Extract text
-        text = extract_text(file_base64, file_type)
-        
-        # Parse information
-        contact = parse_contact_info(text)
-        skills = parse_skills(text)
-        bio = extract_bio(text)
-        
-        # Return result
-        result = {
-            "success": True,
-            "text": text,
-            "length": len(text),
-            "contact": contact,
-            "skills": skills,
-            "bio": bio
-        }
+        # Read input from a file path, raw stdin, or JSON (argument or stdin)
+        with profiling.span('read'):
+            if args and args[0] == '--file':
+                source, file_type = read_file_input(args[1:])
+            elif args and args[0] == '--raw':
+                source, file_type = read_raw_input(sys.stdin.buffer)
+            elif args:
+                source, file_type = read_json_input(args[0])
+            else:
+                source, file_type = read_json_input(sys.stdin.buffer.read())
+        
+        # Extract text and parse information
+        result = parse_resume(source, file_type)
         
-        print(json.dumps(result))
+        print(profiler.dumps(result))
         sys.exit(0)
     
     except Exception as e:
@@ -218,7 +527,7 @@ def main():
             "success": False,
             "error": str(e)
         }
-        print(json.dumps(error_result))
+        print(profiler.dumps(error_result))
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -1,21 +1,69 @@
+#!/usr/bin/env python3
 """
-⚠️ DEPRECATED FILE - DO NOT USE
+Face Analysis Server
+Server-side fallback for browsers that cannot run MediaPipe JS. Returns the
+same metrics as the frontend's useMediaPipeJS hook (see vision_mediapipe.py).
 
-This file is an old backend implementation for face analysis.
-All face detection now runs in the frontend via MediaPipe JS.
+- One warm FaceAnalyzer per worker process (analysis_engine.py), frames passed
+  through shared memory; stream connections stay pinned to one worker
+- Analysis never runs on the event loop or contends on the server's GIL
+- When every analyzer is busy, requests wait in a bounded queue up to a timeout
 
-🚀 USE INSTEAD:
-  Backend: python app_mediapipe_js.py  (logging only)
-  Frontend: useMediaPipeJS hook + FaceMetricsMonitor component
+Run:   python face_analysis_server_fixed.py
+Env:   FACE_ANALYSIS_PORT (8000), FACE_ANALYSIS_POOL_SIZE (worker processes, cpu count),
+       FACE_ANALYSIS_QUEUE (requests allowed to wait, default 4 per analyzer),
+       FACE_ANALYSIS_QUEUE_TIMEOUT_MS (longest wait for an analyzer, 2000)
+Stage timings: PROFILE_TIMINGS=1 adds "timings" to each response and stream reply
+(queue and worker round trip, with the analyzer's decode/analyze charged out of the
+round trip; see profiling.py)
 
-Migration completed in previous iteration.
-File kept for historical reference only.
+POST /analyze/frame   multipart image upload
+POST /analyze/base64  { "base64_frame": "data:image/jpeg;base64,..." }
+WS   /ws/video        binary JPEG messages; replies carry frame_id and per-connection
+                      latency / dropped-frame stats (stale frames are skipped); static
+                      frames reuse the last result ("analysis_mode": "reused"); closed
+                      with 1013 (try again later) until the analyzers are ready
 """
 
+import os
+import json
+import time
+import base64
+import asyncio
+import logging
+import uuid
+from collections import deque
+from typing import Optional
+
+from fastapi import FastAPI, File, HTTPException, UploadFile, WebSocket
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, ConfigDict
+
+import model_store
+import profiling
+import vision_mediapipe
+from analysis_engine import AnalysisEngine, PoolBusyError
+
+PORT = int(os.environ.get('FACE_ANALYSIS_PORT', 8000))
+POOL_SIZE = int(os.environ.get('FACE_ANALYSIS_POOL_SIZE', os.cpu_count() or 1))
+QUEUE_SIZE = int(os.environ.get('FACE_ANALYSIS_QUEUE', POOL_SIZE * 4))
+QUEUE_TIMEOUT_MS = int(os.environ.get('FACE_ANALYSIS_QUEUE_TIMEOUT_MS', 2000))
+
+MAX_FACES = 3
+
+# Frames are downscaled to this height before analysis
+REST_MAX_HEIGHT = 480
+STREAM_MAX_HEIGHT = 720
+
+# Latency samples kept per connection for the p50/p95 figures
+LATENCY_WINDOW = 100
+
+
 # Request model for base64 frames
 class FrameData(BaseModel):
     model_config = ConfigDict(extra="allow")
-    
+
     base64_frame: Optional[str] = None
     frame: Optional[str] = None
     interview_id: Optional[str] = None
@@ -45,16 +93,101 @@ app.add_middleware(
     allow_origin_regex=".*",
 )
 
-# Per-connection analyzers (prevents memory leaks)
-active_connections = {}  # websocket -> FaceAnalyzer
+
+class FrameMailbox:
+    """One-slot mailbox between a connection's receive and analysis tasks.
+
+    A frame that arrives while the previous one is still waiting replaces it,
+    so analysis always starts on the newest frame and never falls behind.
+    """
+
+    def __init__(self):
+        self.dropped = 0
+        self.closed = False
+        self._item = None
+        self._ready = asyncio.Event()
+
+    def put(self, item):
+        if self._item is not None:
+            self.dropped += 1
+        self._item = item
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    async def get(self):
+        """Newest frame, or None once the mailbox is closed and empty"""
+        while self._item is None:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        item, self._item = self._item, None
+        return item
+
+
+class StreamStats:
+    """Per-connection counters and receive-to-reply latency"""
+
+    def __init__(self):
+        self.received = 0
+        self.analyzed = 0
+        self.errors = 0
+        self.modes = {}  # analysis_mode -> frames ("full", "roi", "reused")
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self, dropped):
+        latencies = sorted(self.latencies)
+        return {
+            "received": self.received,
+            "analyzed": self.analyzed,
+            "dropped": dropped,
+            "errors": self.errors,
+            "modes": dict(self.modes),
+            "latency_ms": {
+                "last": round(self.latencies[-1], 1) if latencies else None,
+                "p50": round(latencies[len(latencies) // 2], 1) if latencies else None,
+                "p95": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else None,
+            },
+        }
+
+
+pool: Optional[AnalysisEngine] = None
+active_connections = {}  # websocket -> (StreamStats, FrameMailbox)
+
+
+async def analyze_or_503(frame_bytes):
+    """Pool analysis for the REST endpoints, mapping bad images to 400 and saturation to 503"""
+    if not pool or not pool.ready:
+        raise HTTPException(status_code=503, detail="Face analyzers are not ready")
+    try:
+        return await pool.analyze(frame_bytes, max_height=REST_MAX_HEIGHT)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except PoolBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 
 @app.on_event("startup")
 async def startup():
-    """Initialize on startup"""
-    logger.info("[OK] Face Analysis API Server Started")
-    logger.info("[+] Face detection model loaded successfully")
-    logger.info("[*] Ready to process video frames")
+    """Start and warm the analyzer processes"""
+    global pool
+    if vision_mediapipe.MODEL_PATH is None:
+        # Fetch/verify once here so the analyzer processes only stat the stamped file
+        await asyncio.to_thread(model_store.ensure, vision_mediapipe.MODEL_NAME)
+    pool = AnalysisEngine(POOL_SIZE, QUEUE_SIZE, QUEUE_TIMEOUT_MS / 1000, max_faces=MAX_FACES)
+    logger.info(f"[*] Starting {POOL_SIZE} face analyzer process(es)...")
+    started = time.perf_counter()
+    await pool.start()
+    logger.info(f"[OK] Face Analysis API ready in {time.perf_counter() - started:.2f}s")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if pool:
+        pool.shutdown()
 
 
 @app.get("/health")
@@ -67,178 +200,171 @@ async def health_check():
     }
 
 
+@app.get("/ready")
+async def ready():
+    """Readiness: every analyzer has loaded its model"""
+    body = pool.stats() if pool else {"ready": False}
+    return JSONResponse(content=body, status_code=200 if body["ready"] else 503)
+
+
 @app.post("/analyze/frame")
 async def analyze_frame(file: UploadFile = File(...)):
     """Analyze a single frame (image upload)"""
-    temp_analyzer = FaceAnalyzer(max_num_faces=3)
+    profiler = profiling.begin('face_analysis_server')
     try:
-        contents = await file.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None:
+        with profiling.span('read'):
+            contents = await file.read()
+        if not contents:
             raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Analyze
-        results = temp_analyzer.analyze_frame(frame)
-        
+
+        results = await analyze_or_503(contents)
+
         logger.info(f"Frame analyzed: {results.get('face_count', 0)} face(s)")
-        
-        return JSONResponse(content=results)
-    
+
+        return Response(content=profiler.dumps(results), media_type="application/json")
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"[ERROR] Frame analysis error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-    finally:
-        try:
-            temp_analyzer.close()
-        except Exception as e:
-            logger.error(f"[ERROR] Cleanup error: {str(e)}")
 
 
 @app.post("/analyze/base64")
 async def analyze_base64(data: FrameData):
     """Analyze frame from base64-encoded image"""
-    temp_analyzer = None
+    profiler = profiling.begin('face_analysis_server')
     try:
         # Try both possible key names
         frame_base64 = data.base64_frame or data.frame or ""
-        
+
         if not frame_base64:
             raise HTTPException(status_code=400, detail="No frame data provided")
-        
+
         if frame_base64.startswith("data:"):
             frame_base64 = frame_base64.split(",")[1]
-        
+
         # Decode base64 safely
         try:
-            frame_bytes = base64.b64decode(frame_base64)
+            with profiling.span('decode'):
+                frame_bytes = base64.b64decode(frame_base64)
         except Exception as e:
             logger.error(f"[ERROR] Base64 decode error: {str(e)}")
             raise HTTPException(status_code=400, detail="Invalid base64 encoding")
-        
-        nparr = np.frombuffer(frame_bytes, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if frame is None or frame.size == 0:
-            raise HTTPException(status_code=400, detail="Invalid image data")
-        
-        # Resize for performance
-        h, w = frame.shape[:2]
-        if h > 480:
-            scale = 480 / h
-            frame = cv2.resize(frame, (int(w * scale), 480))
-        
-        # Initialize analyzer for this frame
-        temp_analyzer = FaceAnalyzer(max_num_faces=3)
-        results = temp_analyzer.analyze_frame(frame)
-        
+
+        results = await analyze_or_503(frame_bytes)
+
         logger.info(f"✓ Frame analyzed: {results.get('face_count', 0)} face(s) detected")
-        return JSONResponse(content=results)
-    
+        return Response(content=profiler.dumps(results), media_type="application/json")
+
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"[ERROR] Base64 analysis error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
-    finally:
-        if temp_analyzer:
-            try:
-                temp_analyzer.close()
-            except Exception as e:
-                logger.error(f"[ERROR] Cleanup error: {str(e)}")
 
 
 @app.websocket("/ws/video")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time streaming with improved error handling"""
+    """Real-time stream: binary JPEG messages in, one metrics reply per analyzed frame.
+
+    Receiving and analysis run as separate tasks joined by a one-slot mailbox, so
+    frames that arrive while the analyzer is busy replace each other instead of
+    queueing; each reply carries the connection's latency and dropped-frame counts.
+    Text messages of the form { "frame": "<base64>" } are still accepted.
+    """
     try:
         await websocket.accept()
     except Exception as e:
         logger.error(f"[ERROR] WebSocket accept failed: {str(e)}")
         return
-    
-    # Per-connection analyzer
-    connection_analyzer = None
-    frame_count = 0
-    
-    try:
-        connection_analyzer = FaceAnalyzer(max_num_faces=3)
-        active_connections[websocket] = connection_analyzer
-        
-        logger.info(f"[+] WebSocket client connected (Active: {len(active_connections)})")
-        
-        while True:
-            try:
-                data = await websocket.receive_text()
-                frame_count += 1
-                
-                try:
-                    message = json.loads(data)
-                    frame_base64 = message.get("frame", "")
-                    
-                    if not frame_base64:
-                        logger.warning(f"[W] WebSocket frame {frame_count}: No frame data")
-                        continue
-                    
-                    # Safely decode frame
+
+    if not pool or not pool.ready:
+        # 1013 Try Again Later: analyzers are still warming up (or the pool is shutting down)
+        logger.warning("[!] WebSocket client rejected: face analyzers are not ready")
+        await websocket.close(code=1013, reason="Face analyzers are not ready")
+        return
+
+    # Pin the connection to one analyzer process, which keeps its blink/away state
+    session_id = uuid.uuid4().hex
+    worker_index = pool.open(session_id)
+    stats = StreamStats()
+    mailbox = FrameMailbox()
+    active_connections[websocket] = (stats, mailbox)
+
+    logger.info(f"[+] WebSocket client connected to analyzer {worker_index} (Active: {len(active_connections)})")
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                received_at = time.perf_counter()
+
+                frame_bytes = message.get("bytes")
+                if frame_bytes is None and message.get("text"):
                     try:
-                        frame_bytes = base64.b64decode(frame_base64)
+                        frame_bytes = base64.b64decode(json.loads(message["text"]).get("frame", ""))
                     except Exception as e:
-                        logger.warning(f"[W] WebSocket frame {frame_count}: Invalid base64 - {str(e)}")
-                        continue
-                    
-                    nparr = np.frombuffer(frame_bytes, np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    
-                    if frame is None or frame.size == 0:
-                        logger.warning(f"[W] WebSocket frame {frame_count}: Invalid image data")
+                        stats.errors += 1
+                        logger.warning(f"[W] WebSocket frame {stats.received + 1}: Invalid text frame - {str(e)}")
                         continue
-                    
-                    # Resize for performance
-                    h, w = frame.shape[:2]
-                    if h > 720:  # Increased from 480 for better accuracy
-                        scale = 720 / h
-                        frame = cv2.resize(frame, (int(w * scale), 720))
-                    
-                    # Analyze in thread pool to avoid blocking
-                    loop = asyncio.get_event_loop()
-                    results = await loop.run_in_executor(None, connection_analyzer.analyze_frame, frame)
-                    
-                    # Send back results
-                    await websocket.send_json(results)
-                    
-                    if frame_count % 30 == 0:
-                        logger.info(f"[✓] Processed {frame_count} frames, face detected: {results.get('face_detected')}")
-                
-                except json.JSONDecodeError as e:
-                    logger.error(f"[ERROR] WebSocket JSON decode error: {str(e)}")
-                    await websocket.send_json({"error": "Invalid JSON"})
-                except Exception as e:
-                    logger.error(f"[ERROR] WebSocket frame processing error: {str(e)}")
-                    await websocket.send_json({"error": f"Processing error: {str(e)}"})
-            
+                if not frame_bytes:
+                    continue
+
+                stats.received += 1
+                mailbox.put((stats.received, frame_bytes, received_at))
+        except Exception as e:
+            logger.error(f"[ERROR] WebSocket receive error: {str(e)}")
+        finally:
+            mailbox.close()
+
+    async def analyze_frames():
+        while True:
+            item = await mailbox.get()
+            if item is None:
+                return
+            frame_id, frame_bytes, received_at = item
+
+            # One profiled request per frame (this task's context only, not the receiver's)
+            profiler = profiling.begin('face_analysis_stream')
+            try:
+                results = await pool.analyze(frame_bytes, session_id, max_height=STREAM_MAX_HEIGHT)
+                stats.analyzed += 1
+                mode = results.get("analysis_mode")
+                stats.modes[mode] = stats.modes.get(mode, 0) + 1
+            except PoolBusyError as e:
+                results = {"error": str(e)}
+                stats.errors += 1
             except Exception as e:
-                logger.error(f"[ERROR] WebSocket receive error: {str(e)}")
-                break
-    
+                logger.error(f"[ERROR] WebSocket frame processing error: {str(e)}")
+                results = {"error": f"Processing error: {str(e)}"}
+                stats.errors += 1
+
+            latency_ms = (time.perf_counter() - received_at) * 1000
+            if "error" not in results:
+                stats.latencies.append(latency_ms)
+            results["frame_id"] = frame_id
+            results["stream"] = stats.snapshot(mailbox.dropped)
+            results["stream"]["latency_ms"]["last"] = round(latency_ms, 1)
+            await websocket.send_text(profiler.dumps(results))
+
+            if stats.analyzed and stats.analyzed % 30 == 0:
+                logger.info(f"[✓] Processed {stats.analyzed} frames ({mailbox.dropped} dropped), "
+                            f"face detected: {results.get('face_detected')}")
+
+    receiver = asyncio.create_task(receive_frames())
+    try:
+        await analyze_frames()
     except Exception as e:
         logger.error(f"[ERROR] WebSocket connection error: {str(e)}")
-    
     finally:
-        # Cleanup
-        if websocket in active_connections:
-            try:
-                connection_analyzer = active_connections[websocket]
-                if connection_analyzer:
-                    connection_analyzer.close()
-                del active_connections[websocket]
-            except Exception as e:
-                logger.error(f"[ERROR] WebSocket cleanup error: {str(e)}")
-        
-        logger.info(f"[-] WebSocket client disconnected after {frame_count} frames (Active: {len(active_connections)})")
+        receiver.cancel()
+        pool.close(session_id)
+        active_connections.pop(websocket, None)
+        logger.info(f"[-] WebSocket client disconnected after {stats.received} frames "
+                    f"({stats.analyzed} analyzed, {mailbox.dropped} dropped, Active: {len(active_connections)})")
 
 
 @app.get("/metrics/summary")
@@ -246,24 +372,26 @@ async def get_summary():
     """Get session summary metrics"""
     return {
         "active_connections": len(active_connections),
+        "connections": [stats.snapshot(mailbox.dropped) for stats, mailbox in active_connections.values()],
+        "pool": pool.stats() if pool else None,
         "status": "running"
     }
 
 
 if __name__ == "__main__":
     import uvicorn
-    
+
     print("\n" + "="*60)
     print("[*] Starting Face Analysis API Server...")
     print("="*60)
-    print("[+] Server: http://localhost:8000")
-    print("[+] API Docs: http://localhost:8000/docs")
-    print("[+] Ready for real-time face detection with MediaPipe")
+    print(f"[+] Server: http://localhost:{PORT}")
+    print(f"[+] API Docs: http://localhost:{PORT}/docs")
+    print(f"[+] Analyzer processes: {POOL_SIZE} warm MediaPipe FaceLandmarker(s)")
     print("="*60 + "\n")
-    
+
     uvicorn.run(
         app,
         host="0.0.0.0",
-        port=8000,
+        port=PORT,
         log_level="info"
     )
@@ -4,268 +4,825 @@ Face Verification Service
 Compares two face images and returns a match score.
 Reads JSON from stdin, writes JSON to stdout.
 
-Input:  { "reference_photo": "data:image/jpeg;base64,...", "current_photo": "data:image/jpeg;base64,..." }
-Output: { "success": true, "match_score": 85.5, "is_match": true, "threshold": 60 }
+Input:  { "reference_photo": "data:image/jpeg;base64,...", "current_photo": "data:image/jpeg;base64,...",
+          "reference_embedding": { ... },   (optional, as returned by a previous call)
+          "deadline_ms": 5000 }              (optional latency budget)
+Output: { "success": true, "match_score": 85.5, "is_match": true, "threshold": 60, "method": "...",
+          "methods": { "face_recognition": { "status": "ok", "elapsed_ms": 412.0, "score": 85.5 }, ... },
+          "fallback_reason": null,
+          "reference_embedding": { "hash": "...", "encoding": [...], "face": "..." } }
+
+Batch input:  { "pairs": [{ "reference_photo": ..., "current_photo": ... }, ...] }
+          or  { "reference_photo": ..., "frames": ["data:image/jpeg;base64,...", ...] }
+Batch output: { "success": true, "results": [{ "index": 0, "match_score": ..., "method": ..., "timings": {...} }, ...],
+                "timings": { "encode_ms": ..., "distance_ms": ..., "total_ms": ... } }
+
+Stage timings: PROFILE_TIMINGS=1 adds "timings" (import, read, decode, detect, encode,
+serialize) to the response; batch mode adds them beside its own keys. See profiling.py
 """
 
 import sys
 import json
 import base64
 import io
+import os
+import time
+import queue
+import threading
+import contextvars
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+import profiling
+from reference_cache import FACE_CROP_SIZE, entry_from_json, entry_to_json, get_cache, photo_hash
+
 # Match threshold (percentage)
 MATCH_THRESHOLD = 60
 
+# Longest image side used for detection and encoding; larger photos are downscaled while decoding
+WORKING_MAX_SIDE = 640
+
+# Default latency budget for one verification (Node kills the process at 15s)
+DEFAULT_DEADLINE_MS = int(os.environ.get('FACE_VERIFICATION_DEADLINE_MS', 12000))
+
+# Worker processes used to prepare photos in batch mode
+BATCH_WORKERS = int(os.environ.get('FACE_BATCH_WORKERS', os.cpu_count() or 1))
+
+# Haar cascade, loaded once per process
+_face_cascade = None
+
+# How long verify() waits for cancelled method threads to reach a checkpoint before returning
+# anyway; a thread inside a native stage (face_encodings, detectMultiScale) exits on its own later
+STOP_GRACE_S = 0.05
+
+# Cancel event of the verification that owns the current method thread
+_method_state = threading.local()
+
+
+class VerificationCancelled(BaseException):
+    """Raised in a method thread at its next stage once verify() has stopped waiting for it.
+
+    A BaseException, so the methods' own `except Exception` handlers (decode and
+    library errors) cannot turn a cancellation into an ordinary failure.
+    """
+
+
+def checkpoint():
+    """Stage boundary: stop here if this thread's verification has been cancelled."""
+    cancelled = getattr(_method_state, 'cancelled', None)
+    if cancelled is not None and cancelled.is_set():
+        raise VerificationCancelled()
 
-def decode_base64_image(data_url):
-    """Decode base64 data URL to numpy array."""
+
+def get_face_cascade():
+    """Load the OpenCV frontal-face Haar cascade once and reuse it."""
+    global _face_cascade
+    if _face_cascade is None:
+        import cv2
+        _face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    return _face_cascade
+
+
+def warm_up():
+    """Import the heavy libraries and load models ahead of the first request."""
+    from PIL import Image  # noqa: F401
+    # Optional methods: a missing library just means that method is skipped later
     try:
-        # Remove data URL prefix (e.g., "data:image/jpeg;base64,")
-        if ',' in data_url:
-            data_url = data_url.split(',', 1)[1]
+        get_face_cascade()
+    except Exception as e:
+        print(f"OpenCV warm-up skipped: {e}", file=sys.stderr)
+    try:
+        import face_recognition  # noqa: F401
+    except ImportError:
+        pass
+
+
+class FaceImage:
+    """Photo decoded at working resolution, with a grayscale view shared by all methods.
+    
+    JPEGs are decoded with PIL draft mode (DCT scaling), so phone-camera photos never
+    materialize at full resolution; face boxes are mapped back to the original only
+    when a final crop needs more detail than the working image has.
+    """
+    
+    def __init__(self, image_bytes, max_side=None):
+        from PIL import Image
         
-        image_bytes = base64.b64decode(data_url)
+        max_side = max_side or WORKING_MAX_SIDE
+        self._bytes = image_bytes
+        img = Image.open(io.BytesIO(image_bytes))
+        self.full_size = img.size
+        if img.format == 'JPEG':
+            # Reduced-size decoding: picks the largest 1/2, 1/4 or 1/8 scale still >= max_side
+            img.draft('RGB', (max_side, max_side))
+        img = img.convert('RGB')
+        if max(img.size) > max_side:
+            img.thumbnail((max_side, max_side))
+        
+        self.rgb = np.asarray(img)
+        self.scale = self.full_size[0] / img.size[0]
+        self._gray = None
+    
+    @property
+    def shape(self):
+        return self.rgb.shape
+    
+    @property
+    def gray(self):
+        """Grayscale working image, computed once."""
+        if self._gray is None:
+            try:
+                import cv2
+                self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+            except ImportError:
+                from PIL import Image
+                self._gray = np.asarray(Image.fromarray(self.rgb).convert('L'))
+        return self._gray
+    
+    def crop_gray(self, box, min_size=0):
+        """Grayscale crop of a working-resolution box.
+        
+        If the box is smaller than min_size and the photo was downscaled, the crop is
+        taken from the original image instead.
+        """
+        x, y, w, h = [int(v) for v in box]
+        if self.scale <= 1.0 or min(w, h) >= min_size:
+            return self.gray[y:y+h, x:x+w]
         
         from PIL import Image
-        img = Image.open(io.BytesIO(image_bytes)).convert('RGB')
-        return np.array(img)
+        img = Image.open(io.BytesIO(self._bytes))
+        if img.format == 'JPEG':
+            img.draft('L', img.size)
+        full_box = (round(x * self.scale), round(y * self.scale),
+                    round((x + w) * self.scale), round((y + h) * self.scale))
+        return np.asarray(img.convert('L').crop(full_box))
+
+
+def decode_base64_image(data_url, max_side=None):
+    """Decode base64 data URL to a FaceImage at working resolution."""
+    try:
+        checkpoint()
+        with profiling.span('decode'):
+            # Remove data URL prefix (e.g., "data:image/jpeg;base64,")
+            if ',' in data_url:
+                data_url = data_url.split(',', 1)[1]
+            
+            image_bytes = base64.b64decode(data_url)
+            
+            return FaceImage(image_bytes, max_side)
     except Exception as e:
         print(f"Image decode error: {e}", file=sys.stderr)
         return None
 
 
-def try_face_recognition(ref_img, cur_img):
-    """Try using face_recognition library (most accurate)."""
+def encode_face(img):
+    """Return the face_recognition embedding of the first face in img."""
+    face_recognition = profiling.lazy_import('face_recognition')
+    
+    checkpoint()
+    with profiling.span('encode'):
+        encodings = face_recognition.face_encodings(img.rgb)
+    return encodings[0] if encodings else None
+
+
+def try_face_recognition(ref_img, cur_img, ref_encoding=None):
+    """Try using face_recognition library (most accurate).
+    
+    Returns (score, error, ref_encoding); a cached ref_encoding skips the reference photo.
+    """
     try:
-        import face_recognition
+        face_recognition = profiling.lazy_import('face_recognition')
         
-        ref_encodings = face_recognition.face_encodings(ref_img)
-        cur_encodings = face_recognition.face_encodings(cur_img)
+        if ref_encoding is None:
+            ref_encoding = encode_face(ref_img)
+        if ref_encoding is None:
+            return None, "No face found in reference photo", None
         
-        if len(ref_encodings) == 0:
-            return None, "No face found in reference photo"
-        if len(cur_encodings) == 0:
-            return None, "No face found in current photo"
+        cur_encoding = encode_face(cur_img)
+        if cur_encoding is None:
+            return None, "No face found in current photo", ref_encoding
         
         # Compare faces - face_distance returns euclidean distance (0 = identical)
-        distance = face_recognition.face_distance([ref_encodings[0]], cur_encodings[0])[0]
+        distance = face_recognition.face_distance([ref_encoding], cur_encoding)[0]
         
         # Convert distance to percentage score (0 distance = 100%, 1.0 distance = 0%)
         score = max(0, (1.0 - distance) * 100)
         
-        return round(score, 1), None
+        return round(score, 1), None, ref_encoding
     except ImportError:
-        return None, "face_recognition not installed"
+        return None, "face_recognition not installed", None
     except Exception as e:
-        return None, str(e)
+        return None, str(e), None
 
 
-def try_structural_similarity(ref_img, cur_img):
-    """Fallback: Use structural similarity (SSIM) on face regions."""
+def extract_face_crop(img):
+    """Crop the largest Haar-detected face, resized and histogram-equalized for comparison."""
+    import cv2
+    
+    # Detect faces using Haar cascades on the shared grayscale view
+    gray = img.gray
+    face_cascade = get_face_cascade()
+    checkpoint()
+    with profiling.span('detect'):
+        faces = face_cascade.detectMultiScale(gray, 1.1, 5, minSize=(60, 60))
+        
+        if len(faces) == 0:
+            # Try with more lenient params
+            faces = face_cascade.detectMultiScale(gray, 1.05, 3, minSize=(30, 30))
+    
+    if len(faces) == 0:
+        return None
+    
+    # Crop largest face (from the original photo if the working copy is too small)
+    crop = img.crop_gray(max(faces, key=lambda f: f[2] * f[3]), min_size=FACE_CROP_SIZE)
+    
+    # Resize to a fixed size for comparison and normalize histogram
+    target_size = (FACE_CROP_SIZE, FACE_CROP_SIZE)
+    return cv2.equalizeHist(cv2.resize(crop, target_size))
+
+
+def try_structural_similarity(ref_img, cur_img, ref_face=None):
+    """Fallback: Use structural similarity (SSIM) on face regions.
+    
+    Returns (score, error, ref_face); a cached ref_face skips the reference photo.
+    """
     try:
         import cv2
         
-        # Convert to grayscale
-        ref_gray = cv2.cvtColor(ref_img, cv2.COLOR_RGB2GRAY)
-        cur_gray = cv2.cvtColor(cur_img, cv2.COLOR_RGB2GRAY)
-        
-        # Detect faces using Haar cascades
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        
-        ref_faces = face_cascade.detectMultiScale(ref_gray, 1.1, 5, minSize=(60, 60))
-        cur_faces = face_cascade.detectMultiScale(cur_gray, 1.1, 5, minSize=(60, 60))
-        
-        if len(ref_faces) == 0:
-            # Try with more lenient params
-            ref_faces = face_cascade.detectMultiScale(ref_gray, 1.05, 3, minSize=(30, 30))
-        if len(cur_faces) == 0:
-            cur_faces = face_cascade.detectMultiScale(cur_gray, 1.05, 3, minSize=(30, 30))
-        
-        if len(ref_faces) == 0:
-            return None, "No face found in reference photo"
-        if len(cur_faces) == 0:
-            return None, "No face found in current photo"
-        
-        # Crop largest face from each
-        ref_face = max(ref_faces, key=lambda f: f[2] * f[3])
-        cur_face = max(cur_faces, key=lambda f: f[2] * f[3])
-        
-        rx, ry, rw, rh = ref_face
-        cx, cy, cw, ch = cur_face
-        
-        ref_crop = ref_gray[ry:ry+rh, rx:rx+rw]
-        cur_crop = cur_gray[cy:cy+ch, cx:cx+cw]
+        if ref_face is None:
+            ref_face = extract_face_crop(ref_img)
+        if ref_face is None:
+            return None, "No face found in reference photo", None
         
-        # Resize both to same size for comparison
-        target_size = (128, 128)
-        ref_resized = cv2.resize(ref_crop, target_size)
-        cur_resized = cv2.resize(cur_crop, target_size)
+        cur_face = extract_face_crop(cur_img)
+        if cur_face is None:
+            return None, "No face found in current photo", ref_face
         
-        # Normalize histograms
-        ref_norm = cv2.equalizeHist(ref_resized)
-        cur_norm = cv2.equalizeHist(cur_resized)
+        score = structural_scores(ref_face[np.newaxis], cur_face[np.newaxis])[0]
         
-        # Method 1: Histogram comparison
-        ref_hist = cv2.calcHist([ref_norm], [0], None, [256], [0, 256])
-        cur_hist = cv2.calcHist([cur_norm], [0], None, [256], [0, 256])
-        cv2.normalize(ref_hist, ref_hist)
-        cv2.normalize(cur_hist, cur_hist)
-        hist_score = cv2.compareHist(ref_hist, cur_hist, cv2.HISTCMP_CORREL)
-        
-        # Method 2: Template matching (normalized cross-correlation)
-        result = cv2.matchTemplate(ref_norm, cur_norm, cv2.TM_CCOEFF_NORMED)
-        template_score = result[0][0]
-        
-        # Method 3: Mean absolute difference (inverted)
-        diff = cv2.absdiff(ref_norm, cur_norm)
-        mean_diff = np.mean(diff)
-        pixel_score = max(0, 1.0 - mean_diff / 128.0)
-        
-        # Weighted combination
-        combined = (hist_score * 0.3 + template_score * 0.4 + pixel_score * 0.3)
-        
-        # Scale to 0-100 range with a boost (structural similarity tends to be lower)
-        score = min(100, max(0, combined * 100 * 1.2))
-        
-        return round(score, 1), None
+        return round(float(score), 1), None, ref_face
         
     except ImportError:
-        return None, "opencv-python not installed"
+        return None, "opencv-python not installed", None
     except Exception as e:
-        return None, str(e)
+        return None, str(e), None
+
+
+def histogram_thumbnail(img):
+    """128x128 float grayscale thumbnail used by the histogram fallback."""
+    from PIL import Image
+    
+    # Resize the shared grayscale view
+    checkpoint()
+    with profiling.span('thumbnail'):
+        return np.array(Image.fromarray(img.gray).resize((128, 128)), dtype=np.float64)
 
 
 def try_histogram_comparison(ref_img, cur_img):
     """Last resort fallback: Simple histogram comparison."""
     try:
-        from PIL import Image
-        
-        # Convert to same size grayscale
-        ref_pil = Image.fromarray(ref_img).convert('L').resize((128, 128))
-        cur_pil = Image.fromarray(cur_img).convert('L').resize((128, 128))
-        
-        ref_arr = np.array(ref_pil, dtype=np.float64)
-        cur_arr = np.array(cur_pil, dtype=np.float64)
+        ref_arr = histogram_thumbnail(ref_img)
+        cur_arr = histogram_thumbnail(cur_img)
         
-        # Normalized correlation
-        ref_norm = (ref_arr - ref_arr.mean()) / (ref_arr.std() + 1e-8)
-        cur_norm = (cur_arr - cur_arr.mean()) / (cur_arr.std() + 1e-8)
+        score = histogram_scores(ref_arr[np.newaxis], cur_arr[np.newaxis])[0]
         
-        correlation = np.mean(ref_norm * cur_norm)
-        score = max(0, min(100, correlation * 100))
-        
-        return round(score, 1), None
+        return round(float(score), 1), None
         
     except Exception as e:
         return None, str(e)
 
 
-def main():
-    try:
-        # Read input from stdin
-        input_data = sys.stdin.read()
-        data = json.loads(input_data)
-        
-        reference_photo = data.get('reference_photo', '')
-        current_photo = data.get('current_photo', '')
-        
-        if not reference_photo or not current_photo:
-            print(json.dumps({
-                "success": False,
-                "match_score": 0,
-                "is_match": False,
-                "threshold": MATCH_THRESHOLD,
-                "error": "Missing photo data"
-            }))
-            return
-        
-        # Decode images
-        print("Decoding reference photo...", file=sys.stderr)
-        ref_img = decode_base64_image(reference_photo)
-        print("Decoding current photo...", file=sys.stderr)
-        cur_img = decode_base64_image(current_photo)
-        
-        if ref_img is None or cur_img is None:
-            print(json.dumps({
-                "success": False,
-                "match_score": 0,
-                "is_match": False,
-                "threshold": MATCH_THRESHOLD,
-                "error": "Failed to decode images"
-            }))
+# =====================================================================
+# VECTORIZED SCORING (row i of the reference stack vs row i of the current stack)
+# =====================================================================
+
+def face_recognition_scores(ref_encodings, cur_encodings):
+    """Scores for stacked (n, 128) encodings; same distance as face_recognition.face_distance."""
+    distances = np.linalg.norm(ref_encodings - cur_encodings, axis=1)
+    
+    # Convert distance to percentage score (0 distance = 100%, 1.0 distance = 0%)
+    return np.maximum(0, (1.0 - distances) * 100)
+
+
+def _row_correlation(a, b):
+    """Pearson correlation of each row of a with the same row of b."""
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    denom = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+    return np.divide((a * b).sum(axis=1), denom, out=np.ones(len(a)), where=denom > 0)
+
+
+def structural_scores(ref_faces, cur_faces):
+    """OpenCV-fallback scores for stacked (n, 128, 128) equalized uint8 face crops."""
+    n = len(ref_faces)
+    ref_flat = ref_faces.reshape(n, -1)
+    cur_flat = cur_faces.reshape(n, -1)
+    
+    # Method 1: Histogram comparison (correlation of 256-bin histograms, one bincount per stack)
+    offsets = (np.arange(n) * 256)[:, np.newaxis]
+    ref_hist = np.bincount((ref_flat + offsets).ravel(), minlength=256 * n).reshape(n, 256)
+    cur_hist = np.bincount((cur_flat + offsets).ravel(), minlength=256 * n).reshape(n, 256)
+    hist_score = _row_correlation(ref_hist.astype(np.float64), cur_hist.astype(np.float64))
+    
+    # Method 2: Template matching (normalized cross-correlation of same-size crops)
+    ref_pixels = ref_flat.astype(np.float64)
+    cur_pixels = cur_flat.astype(np.float64)
+    template_score = _row_correlation(ref_pixels, cur_pixels)
+    
+    # Method 3: Mean absolute difference (inverted)
+    mean_diff = np.abs(ref_pixels - cur_pixels).mean(axis=1)
+    pixel_score = np.maximum(0, 1.0 - mean_diff / 128.0)
+    
+    # Weighted combination
+    combined = hist_score * 0.3 + template_score * 0.4 + pixel_score * 0.3
+    
+    # Scale to 0-100 range with a boost (structural similarity tends to be lower)
+    return np.clip(combined * 100 * 1.2, 0, 100)
+
+
+def histogram_scores(ref_thumbs, cur_thumbs):
+    """Histogram-fallback scores for stacked (n, 128, 128) float thumbnails."""
+    n = len(ref_thumbs)
+    ref_arr = ref_thumbs.reshape(n, -1)
+    cur_arr = cur_thumbs.reshape(n, -1)
+    
+    # Normalized correlation
+    ref_norm = (ref_arr - ref_arr.mean(axis=1, keepdims=True)) / (ref_arr.std(axis=1, keepdims=True) + 1e-8)
+    cur_norm = (cur_arr - cur_arr.mean(axis=1, keepdims=True)) / (cur_arr.std(axis=1, keepdims=True) + 1e-8)
+    
+    correlation = np.mean(ref_norm * cur_norm, axis=1)
+    return np.clip(correlation * 100, 0, 100)
+
+
+def failure_result(error):
+    """Standard failed-verification response."""
+    return {
+        "success": False,
+        "match_score": 0,
+        "is_match": False,
+        "threshold": MATCH_THRESHOLD,
+        "error": error
+    }
+
+
+class MethodScheduler:
+    """Runs matching methods on threads and collects their outcomes.
+    
+    Methods check for cancellation between stages (checkpoint()), so after
+    stop() every thread ends within one stage. stop() itself waits at most
+    STOP_GRACE_S, so a native stage in progress never delays the result.
+    """
+    
+    def __init__(self):
+        self.started = {}
+        self.outcomes = {}
+        self.cancelled = threading.Event()
+        self._done = queue.Queue()
+        self._threads = []
+    
+    def start(self, name, func):
+        if name in self.started:
             return
-        
-        print(f"Reference image: {ref_img.shape}", file=sys.stderr)
-        print(f"Current image: {cur_img.shape}", file=sys.stderr)
-        
-        # Try methods in order of accuracy
-        score = None
-        method = None
-        
-        # Method 1: face_recognition (most accurate)
-        score, err = try_face_recognition(ref_img, cur_img)
-        if score is not None:
-            method = "face_recognition"
-            print(f"Used face_recognition: {score}%", file=sys.stderr)
-        else:
-            print(f"face_recognition unavailable: {err}", file=sys.stderr)
-        
-        # Method 2: OpenCV structural similarity
-        if score is None:
-            score, err = try_structural_similarity(ref_img, cur_img)
-            if score is not None:
-                method = "opencv_structural"
-                print(f"Used OpenCV structural: {score}%", file=sys.stderr)
-            else:
-                print(f"OpenCV unavailable: {err}", file=sys.stderr)
-        
-        # Method 3: Simple histogram
-        if score is None:
-            score, err = try_histogram_comparison(ref_img, cur_img)
-            if score is not None:
-                method = "histogram"
-                print(f"Used histogram comparison: {score}%", file=sys.stderr)
+        self.started[name] = time.perf_counter()
+        
+        def run():
+            _method_state.cancelled = self.cancelled
+            try:
+                outcome = func()
+            except VerificationCancelled:
+                outcome = (None, "cancelled", None)
+            except Exception as e:
+                outcome = (None, str(e), None)
+            self._done.put((name, outcome, time.perf_counter()))
+        
+        # Copy the caller's context so the method's spans reach this request's profiler
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(run,),
+                                  name=f"verify-{name}", daemon=True)
+        self._threads.append(thread)
+        thread.start()
+    
+    def stop(self):
+        """Cancel unfinished methods; give their threads STOP_GRACE_S in total to exit (they are daemons)."""
+        self.cancelled.set()
+        until = time.perf_counter() + STOP_GRACE_S
+        for thread in self._threads:
+            thread.join(max(until - time.perf_counter(), 0))
+    
+    def wait(self, timeout):
+        """Record the next finished method and return its name; None if none finished in time."""
+        try:
+            name, outcome, finished = self._done.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+        self.outcomes[name] = (outcome, round((finished - self.started[name]) * 1000, 1))
+        return name
+    
+    def running(self, name):
+        return name in self.started and name not in self.outcomes
+    
+    def succeeded(self, name):
+        return name in self.outcomes and self.outcomes[name][0][0] is not None
+
+
+def verify(reference_photo, current_photo, reference_embedding=None, deadline_ms=None):
+    """Compare two base64 photos and return the JSON-ready result.
+    
+    Reference face data is looked up by photo hash (in `reference_embedding` from the
+    caller, then the local cache) so the reference photo is only decoded on a miss.
+    
+    The most accurate available method runs alongside the cheap histogram fallback;
+    once `deadline_ms` has passed, the best result finished so far is returned.
+    Per-method status and timings are reported under "methods".
+    """
+    started = time.perf_counter()
+    deadline = started + (deadline_ms or DEFAULT_DEADLINE_MS) / 1000
+    
+    if not reference_photo or not current_photo:
+        return failure_result("Missing photo data")
+    
+    ref_id = photo_hash(reference_photo)
+    cache = get_cache()
+    cached = None
+    if reference_embedding and reference_embedding.get('hash') == ref_id:
+        cached = entry_from_json(reference_embedding)
+    if cached is None:
+        cached = cache.get(ref_id) or {}
+    ref_encoding = cached.get('encoding')
+    ref_face = cached.get('face')
+    if cached:
+        print("Using cached reference face data", file=sys.stderr)
+    
+    # Decode images (the reference only when a method actually needs it)
+    ref_img = None
+    ref_lock = threading.Lock()
+    
+    def reference_image():
+        nonlocal ref_img
+        with ref_lock:
+            if ref_img is None:
+                print("Decoding reference photo...", file=sys.stderr)
+                ref_img = decode_base64_image(reference_photo)
+        return ref_img
+    
+    print("Decoding current photo...", file=sys.stderr)
+    cur_img = decode_base64_image(current_photo)
+    
+    if cur_img is None or (ref_encoding is None and ref_face is None and reference_image() is None):
+        return failure_result("Failed to decode images")
+    
+    print(f"Current image: {cur_img.full_size} -> working {cur_img.shape}", file=sys.stderr)
+    
+    def run_face_recognition():
+        return try_face_recognition(reference_image() if ref_encoding is None else None, cur_img, ref_encoding)
+    
+    def run_structural():
+        return try_structural_similarity(reference_image() if ref_face is None else None, cur_img, ref_face)
+    
+    def run_histogram():
+        if reference_image() is None:
+            return None, "Failed to decode reference photo", None
+        score, err = try_histogram_comparison(reference_image(), cur_img)
+        return score, err, None
+    
+    # Methods in order of accuracy
+    methods = [
+        ("face_recognition", run_face_recognition,
+         ref_encoding is not None or importlib.util.find_spec('face_recognition') is not None),
+        ("opencv_structural", run_structural, importlib.util.find_spec('cv2') is not None),
+        ("histogram", run_histogram, True),
+    ]
+    available = [name for name, _, ok in methods if ok]
+    runners = {name: func for name, func, _ in methods}
+    
+    # Start the most accurate method, with the cheap fallback speculatively alongside it
+    scheduler = MethodScheduler()
+    scheduler.start(available[0], runners[available[0]])
+    scheduler.start("histogram", run_histogram)
+    
+    try:
+        best = None
+        deadline_hit = False
+        while True:
+            # Best method that can still succeed
+            candidates = [name for name in available if name not in scheduler.outcomes or scheduler.succeeded(name)]
+            if candidates and scheduler.succeeded(candidates[0]):
+                best = candidates[0]
+                break
+            if not candidates:
+                break
+            
+            # Start the next method down once everything more accurate has failed
+            if candidates[0] not in scheduler.started:
+                scheduler.start(candidates[0], runners[candidates[0]])
+            
+            finished = scheduler.wait(deadline - time.perf_counter())
+            if finished is None:
+                deadline_hit = True
+                break
+            
+            outcome, elapsed = scheduler.outcomes[finished]
+            if outcome[0] is None:
+                print(f"{finished} unavailable: {outcome[1]} ({elapsed}ms)", file=sys.stderr)
+        
+        if best is None:
+            succeeded = [name for name in available if scheduler.succeeded(name)]
+            best = succeeded[0] if succeeded else None
+        
+        # Per-method report
+        method_report = {}
+        for name, _, ok in methods:
+            if name in scheduler.outcomes:
+                (score, err, _), elapsed = scheduler.outcomes[name]
+                method_report[name] = {"status": "ok" if score is not None else "failed", "elapsed_ms": elapsed}
+                if score is not None:
+                    method_report[name]["score"] = float(score)
+                else:
+                    method_report[name]["error"] = err
+            elif scheduler.running(name):
+                method_report[name] = {
+                    "status": "timeout",
+                    "elapsed_ms": round((time.perf_counter() - scheduler.started[name]) * 1000, 1)
+                }
             else:
-                print(f"Histogram comparison failed: {err}", file=sys.stderr)
-        
-        if score is None:
-            print(json.dumps({
-                "success": False,
-                "match_score": 0,
-                "is_match": False,
-                "threshold": MATCH_THRESHOLD,
-                "error": "All face matching methods failed"
-            }))
-            return
+                method_report[name] = {"status": "skipped" if ok else "unavailable"}
+        
+        fallback_reason = None
+        if best is not None and best != available[0]:
+            reasons = []
+            for name in available[:available.index(best)]:
+                report = method_report[name]
+                if report["status"] == "timeout":
+                    reasons.append(f"{name}: deadline of {deadline_ms or DEFAULT_DEADLINE_MS}ms reached")
+                elif report["status"] == "failed":
+                    reasons.append(f"{name}: {report['error']}")
+            fallback_reason = "; ".join(reasons) or None
+        
+        # Remember any reference data computed on this call
+        new_encoding = scheduler.outcomes.get("face_recognition", ((None, None, None), 0))[0][2]
+        new_face = scheduler.outcomes.get("opencv_structural", ((None, None, None), 0))[0][2]
+        entry = dict(cached)
+        if (ref_encoding is None and new_encoding is not None) or (ref_face is None and new_face is not None):
+            entry = cache.put(ref_id, {'encoding': new_encoding, 'face': new_face})
+        
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        if best is None:
+            result = failure_result("Verification deadline reached before any method finished" if deadline_hit
+                                    else "All face matching methods failed")
+            result["methods"] = method_report
+            return result
         
         # Convert numpy types to native Python types for JSON serialization
-        score = float(score)
+        score = float(scheduler.outcomes[best][0][0])
+        print(f"Used {best}: {score}%", file=sys.stderr)
         
-        print(json.dumps({
+        result = {
             "success": True,
             "match_score": score,
             "is_match": bool(score >= MATCH_THRESHOLD),
             "threshold": MATCH_THRESHOLD,
-            "method": method
-        }))
+            "method": best,
+            "methods": method_report,
+            "fallback_reason": fallback_reason,
+            "deadline_hit": deadline_hit,
+            "elapsed_ms": elapsed_ms
+        }
+        if entry:
+            result["reference_embedding"] = entry_to_json(ref_id, entry)
+        return result
+    finally:
+        # Cancel and join whatever is still running, so the worker is free once this returns
+        scheduler.stop()
+
+
+# =====================================================================
+# BATCH VERIFICATION
+# =====================================================================
+
+# (method, per-photo feature, vectorized scorer) in order of accuracy
+BATCH_METHODS = (
+    ('face_recognition', 'encoding', face_recognition_scores),
+    ('opencv_structural', 'face', structural_scores),
+    ('histogram', 'thumb', histogram_scores),
+)
+
+# Batches with at most this many photos to prepare are handled in-process
+BATCH_INLINE_LIMIT = 2
+
+# Profiler stage for each per-photo feature (pool workers report these times back)
+FEATURE_STAGES = {'encoding': 'encode', 'face': 'detect', 'thumb': 'thumbnail'}
+
+
+def prepare_photo(data_url, feature):
+    """Worker task: decode one photo and compute one feature.
+    
+    Returns (value, error, decode_ms, feature_ms); value is None if no face was found.
+    """
+    started = time.perf_counter()
+    img = decode_base64_image(data_url)
+    decoded = time.perf_counter()
+    if img is None:
+        return None, "Failed to decode image", round((decoded - started) * 1000, 2), 0.0
+    
+    try:
+        if feature == 'encoding':
+            value = encode_face(img)
+        elif feature == 'face':
+            value = extract_face_crop(img)
+        else:
+            value = histogram_thumbnail(img)
+        error = None if value is not None else "No face found"
+    except Exception as e:
+        value, error = None, str(e)
+    
+    return value, error, round((decoded - started) * 1000, 2), round((time.perf_counter() - decoded) * 1000, 2)
+
+
+def _method_available(feature):
+    if feature == 'encoding':
+        return importlib.util.find_spec('face_recognition') is not None
+    if feature == 'face':
+        return importlib.util.find_spec('cv2') is not None
+    return True
+
+
+def verify_batch(data, executor=None, workers=None):
+    """Verify many pairs at once.
+    
+    Input is either { "pairs": [{ "reference_photo", "current_photo" }, ...] } or
+    { "reference_photo": ..., "frames": [...] } (one reference against many frames).
+    Each distinct photo is prepared once in a process pool, then every pair that has
+    the needed feature on both sides is scored with a single vectorized call.
+    """
+    started = time.perf_counter()
+    
+    if data.get('frames') is not None:
+        reference_photo = data.get('reference_photo', '')
+        raw_pairs = [(reference_photo, frame) for frame in data['frames']]
+    else:
+        raw_pairs = [(pair.get('reference_photo', ''), pair.get('current_photo', ''))
+                     for pair in data.get('pairs') or []]
+    
+    if not raw_pairs:
+        return {"success": False, "error": "No pairs or frames provided", "results": []}
+    
+    # Deduplicate photos by content hash (one reference vs many frames is encoded once)
+    photos = {}
+    pairs = []
+    for ref_url, cur_url in raw_pairs:
+        keys = []
+        for url in (ref_url, cur_url):
+            key = photo_hash(url) if url else None
+            if key:
+                photos[key] = url
+            keys.append(key)
+        pairs.append(tuple(keys))
+    
+    features = {key: {} for key in photos}
+    errors = {}
+    photo_ms = {key: 0.0 for key in photos}
+    
+    # Seed reference photos from the cache / caller-supplied embedding
+    cache = get_cache()
+    reference_keys = {ref for ref, _ in pairs if ref}
+    supplied = data.get('reference_embedding')
+    for key in reference_keys:
+        cached = None
+        if supplied and supplied.get('hash') == key:
+            cached = entry_from_json(supplied)
+        cached = cached or cache.get(key) or {}
+        for feature in ('encoding', 'face'):
+            if cached.get(feature) is not None:
+                features[key][feature] = cached[feature]
+    
+    results = [None] * len(pairs)
+    for i, (ref, cur) in enumerate(pairs):
+        if not ref or not cur:
+            results[i] = failure_result("Missing photo data")
+    
+    encode_ms = 0.0
+    distance_ms = 0.0
+    pool = None
+    workers = workers or BATCH_WORKERS
+    
+    try:
+        for method, feature, scorer in BATCH_METHODS:
+            pending = [i for i, result in enumerate(results) if result is None]
+            if not pending:
+                break
+            if not _method_available(feature):
+                continue
+            
+            keys = sorted({key for i in pending for key in pairs[i]
+                           if feature not in features[key] and key not in errors})
+            if keys:
+                phase_started = time.perf_counter()
+                if executor is None and len(keys) > BATCH_INLINE_LIMIT and workers > 1:
+                    if pool is None:
+                        pool = ProcessPoolExecutor(max_workers=min(workers, len(photos)), initializer=warm_up)
+                    mapper = pool.map
+                elif executor is not None:
+                    mapper = executor.map
+                else:
+                    mapper = map
+                
+                prepared = mapper(prepare_photo, [photos[key] for key in keys], [feature] * len(keys))
+                for key, (value, error, decode_ms, feature_ms) in zip(keys, prepared):
+                    features[key][feature] = value
+                    photo_ms[key] += decode_ms + feature_ms
+                    if mapper is not map:
+                        # Spans in other processes never reach this profiler
+                        profiling.current().record('decode', decode_ms)
+                        profiling.current().record(FEATURE_STAGES[feature], feature_ms)
+                    if error == "Failed to decode image":
+                        errors[key] = error
+                encode_ms += (time.perf_counter() - phase_started) * 1000
+            
+            ready = [i for i in pending
+                     if features[pairs[i][0]].get(feature) is not None
+                     and features[pairs[i][1]].get(feature) is not None]
+            if not ready:
+                continue
+            
+            scoring_started = time.perf_counter()
+            with profiling.span('score'):
+                scores = scorer(np.stack([features[pairs[i][0]][feature] for i in ready]),
+                                np.stack([features[pairs[i][1]][feature] for i in ready]))
+            distance_ms += (time.perf_counter() - scoring_started) * 1000
+            
+            for i, score in zip(ready, scores):
+                score = round(float(score), 1)
+                results[i] = {
+                    "success": True,
+                    "match_score": score,
+                    "is_match": bool(score >= MATCH_THRESHOLD),
+                    "threshold": MATCH_THRESHOLD,
+                    "method": method
+                }
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    
+    for i, (ref, cur) in enumerate(pairs):
+        if results[i] is None:
+            decode_failed = errors.get(ref) or errors.get(cur)
+            results[i] = failure_result("Failed to decode images" if decode_failed
+                                        else "All face matching methods failed")
+        results[i]["index"] = i
+        results[i]["timings"] = {
+            "reference_ms": round(photo_ms.get(ref, 0.0), 2),
+            "current_ms": round(photo_ms.get(cur, 0.0), 2),
+        }
+    
+    # Remember reference data computed in this batch
+    for key in reference_keys:
+        new_entry = {feature: features[key].get(feature) for feature in ('encoding', 'face')}
+        if any(value is not None for value in new_entry.values()):
+            cache.put(key, new_entry)
+    
+    response = {
+        "success": True,
+        "threshold": MATCH_THRESHOLD,
+        "count": len(results),
+        "matched": sum(1 for result in results if result.get("is_match")),
+        "results": results,
+        "timings": {
+            "encode_ms": round(encode_ms, 2),
+            "distance_ms": round(distance_ms, 3),
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+    }
+    if data.get('frames') is not None and pairs[0][0]:
+        entry = cache.get(pairs[0][0])
+        if entry:
+            response["reference_embedding"] = entry_to_json(pairs[0][0], entry)
+    return response
+
+
+def main():
+    profiler = profiling.begin('face_verification', imports=True)
+    try:
+        # Read input from stdin
+        with profiling.span('read'):
+            input_data = sys.stdin.read()
+            data = json.loads(input_data)
+        
+        if 'pairs' in data or 'frames' in data:
+            print(profiler.dumps(verify_batch(data)))
+            return
+        
+        print(profiler.dumps(verify(
+            data.get('reference_photo', ''),
+            data.get('current_photo', ''),
+            data.get('reference_embedding'),
+            data.get('deadline_ms')
+        )))
         
     except json.JSONDecodeError as e:
-        print(json.dumps({
-            "success": False,
-            "match_score": 0,
-            "is_match": False,
-            "threshold": MATCH_THRESHOLD,
-            "error": f"Invalid JSON input: {str(e)}"
-        }))
+        print(profiler.dumps(failure_result(f"Invalid JSON input: {str(e)}")))
     except Exception as e:
-        print(json.dumps({
-            "success": False,
-            "match_score": 0,
-            "is_match": False,
-            "threshold": MATCH_THRESHOLD,
-            "error": f"Unexpected error: {str(e)}"
-        }))
+        print(profiler.dumps(failure_result(f"Unexpected error: {str(e)}")))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Face Verification Server
+Long-lived HTTP front end for face_verification.py so models and libraries
+are loaded once instead of on every verification.
+
+- Bounded process pool (one warm worker per core by default)
+- Admission queue with per-request deadlines
+- /health (liveness) and /ready (workers warmed up) endpoints
+
+Run:   python face_verification_server.py
+Env:   FACE_VERIFICATION_PORT (8001), FACE_VERIFICATION_WORKERS (cpu count),
+       FACE_VERIFICATION_QUEUE (requests allowed to wait, default 4 per worker),
+       FACE_VERIFICATION_TIMEOUT_MS (default deadline, 10000),
+       FACE_VERIFICATION_MAX_BATCH (pairs or frames per batch request, 64)
+
+POST /verify  { "reference_photo": "...", "current_photo": "...", "reference_embedding": {...}, "timeout_ms": 5000 }
+  -> same JSON as face_verification.py (with worker-side "timings" when PROFILE_TIMINGS=1)
+POST /verify/batch  { "pairs": [...] } or { "reference_photo": "...", "frames": [...] }
+  -> same JSON as face_verification.py batch mode; every photo goes through the
+     same admission queue and worker slots as /verify (413 above the batch cap)
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+import face_verification
+import profiling
+
+PORT = int(os.environ.get('FACE_VERIFICATION_PORT', 8001))
+WORKERS = int(os.environ.get('FACE_VERIFICATION_WORKERS', os.cpu_count() or 1))
+QUEUE_SIZE = int(os.environ.get('FACE_VERIFICATION_QUEUE', WORKERS * 4))
+DEFAULT_TIMEOUT_MS = int(os.environ.get('FACE_VERIFICATION_TIMEOUT_MS', 10000))
+MAX_BATCH_PAIRS = int(os.environ.get('FACE_VERIFICATION_MAX_BATCH', 64))
+
+# Share of the request deadline given to the method cascade (the rest covers queueing, IPC and
+# the short grace cancelled methods get to stop; see MethodScheduler.stop)
+DEADLINE_SHARE = 0.9
+
+# Logger setup
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="Face Verification Service", version="1.0.0")
+
+
+class VerifyRequest(BaseModel):
+    reference_photo: str = ""
+    current_photo: str = ""
+    reference_embedding: Optional[dict] = None
+    timeout_ms: Optional[int] = None
+
+
+class BatchVerifyRequest(BaseModel):
+    pairs: Optional[List[dict]] = None
+    reference_photo: Optional[str] = None
+    frames: Optional[List[str]] = None
+    reference_embedding: Optional[dict] = None
+    timeout_ms: Optional[int] = None
+
+
+class WorkerPool:
+    """Process pool with a bounded wait queue and deadline-aware submission"""
+
+    def __init__(self, workers, queue_size):
+        self.workers = workers
+        self.executor = None
+        self.ready = False
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._slots = asyncio.Semaphore(workers)
+        self._admission = asyncio.Semaphore(workers + queue_size)
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=face_verification.warm_up)
+        loop = asyncio.get_running_loop()
+        # One warm-up task per worker forces every process to start and load its models
+        await asyncio.gather(*(loop.run_in_executor(self.executor, face_verification.warm_up)
+                               for _ in range(self.workers)))
+        self.ready = True
+
+    def shutdown(self):
+        self.ready = False
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, _future=None):
+        self.in_flight -= 1
+        self._slots.release()
+
+    async def run(self, func, *args, timeout, wait=False):
+        """Run func(*args) on a worker; raises asyncio.TimeoutError past the deadline.
+
+        A full queue raises OverflowError, unless `wait` is set (batch tasks), which
+        waits for a queue place instead.
+        """
+        if self._admission.locked() and not wait:
+            self.rejected += 1
+            raise OverflowError("Verification queue is full")
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        await asyncio.wait_for(self._admission.acquire(), timeout=max(deadline - loop.time(), 0))
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(deadline - loop.time(), 0))
+            self.in_flight += 1
+            try:
+                future = loop.run_in_executor(self.executor, func, *args)
+            except Exception:
+                self._release()
+                raise
+            # A worker cannot be interrupted mid-task, so its slot is only freed when it really finishes
+            future.add_done_callback(self._release)
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=max(deadline - loop.time(), 0))
+            self.completed += 1
+            return result
+        finally:
+            self._admission.release()
+
+
+class PoolMapper:
+    """executor.map() stand-in for verify_batch, run from its coordinator thread.
+
+    Each task goes through WorkerPool.run on the event loop, so batch work shares
+    the admission queue, worker slots and in_flight count with /verify. At most
+    one task per worker is queued at a time, so single requests interleave with a
+    large batch instead of waiting behind all of it.
+    """
+
+    def __init__(self, pool, loop, deadline):
+        self.pool = pool
+        self.loop = loop
+        self.deadline = deadline
+        self.cancelled = False
+        self._futures = deque()
+
+    def _submit(self, func, args):
+        if self.cancelled:
+            raise CancelledError()
+        coro = self.pool.run(func, *args, timeout=max(self.deadline - self.loop.time(), 0), wait=True)
+        self._futures.append(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    def map(self, func, *iterables):
+        calls = zip(*iterables)
+        for args in calls:
+            self._submit(func, args)
+            if len(self._futures) >= self.pool.workers:
+                break
+        while self._futures:
+            result = self._futures[0].result()
+            self._futures.popleft()
+            args = next(calls, None)
+            if args is not None:
+                self._submit(func, args)
+            yield result
+
+    def cancel(self):
+        """Stop queueing tasks for an abandoned batch (tasks already on a worker finish)"""
+        self.cancelled = True
+        for future in list(self._futures):
+            future.cancel()
+
+
+pool: Optional[WorkerPool] = None
+
+
+@app.on_event("startup")
+async def startup():
+    """Start the worker pool and warm every worker"""
+    global pool
+    pool = WorkerPool(WORKERS, QUEUE_SIZE)
+    logger.info(f"[*] Warming {WORKERS} face verification worker(s)...")
+    started = time.perf_counter()
+    await pool.start()
+    logger.info(f"[OK] Face verification workers ready in {time.perf_counter() - started:.2f}s")
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if pool:
+        pool.shutdown()
+
+
+@app.get("/health")
+async def health():
+    """Liveness: the server process is up"""
+    return {"status": "healthy", "service": "Face Verification"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: all workers have loaded their models"""
+    body = {
+        "ready": bool(pool and pool.ready),
+        "workers": WORKERS,
+        "in_flight": pool.in_flight if pool else 0,
+        "completed": pool.completed if pool else 0,
+        "rejected": pool.rejected if pool else 0,
+        "timed_out": pool.timed_out if pool else 0,
+    }
+    return JSONResponse(content=body, status_code=200 if body["ready"] else 503)
+
+
+@app.post("/verify")
+async def verify(request: VerifyRequest):
+    """Compare a reference photo with a current photo"""
+    if not pool or not pool.ready:
+        return JSONResponse(content=face_verification.failure_result("Service is not ready"), status_code=503)
+
+    timeout = (request.timeout_ms or DEFAULT_TIMEOUT_MS) / 1000
+    started = time.perf_counter()
+    try:
+        # Leave the method cascade a little headroom inside the request deadline
+        result = await pool.run(profiling.call, "face_verification_server", face_verification.verify,
+                                request.reference_photo, request.current_photo, request.reference_embedding,
+                                int(timeout * 1000 * DEADLINE_SHARE), timeout=timeout)
+    except OverflowError as e:
+        return JSONResponse(content=face_verification.failure_result(str(e)), status_code=503)
+    except asyncio.TimeoutError:
+        pool.timed_out += 1
+        return JSONResponse(
+            content=face_verification.failure_result(f"Verification deadline of {int(timeout * 1000)}ms exceeded"),
+            status_code=504
+        )
+
+    result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+@app.post("/verify/batch")
+async def verify_batch(request: BatchVerifyRequest):
+    """Verify many pairs (or one reference against many frames), sharing the worker pool"""
+    if not pool or not pool.ready:
+        return JSONResponse(content={"success": False, "error": "Service is not ready"}, status_code=503)
+
+    size = len(request.frames) if request.frames is not None else len(request.pairs or [])
+    if size > MAX_BATCH_PAIRS:
+        return JSONResponse(
+            content={"success": False, "error": f"Batch of {size} exceeds the limit of {MAX_BATCH_PAIRS}"},
+            status_code=413
+        )
+
+    timeout = (request.timeout_ms or DEFAULT_TIMEOUT_MS) / 1000
+    loop = asyncio.get_running_loop()
+    mapper = PoolMapper(pool, loop, loop.time() + timeout)
+    # verify_batch fans the per-photo work out through the mapper; run its coordinator off the event loop
+    job = partial(face_verification.verify_batch, request.model_dump(exclude_none=True), executor=mapper)
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(None, job), timeout=timeout)
+    except asyncio.TimeoutError:
+        mapper.cancel()
+        pool.timed_out += 1
+        return JSONResponse(
+            content={"success": False, "error": f"Batch deadline of {int(timeout * 1000)}ms exceeded"},
+            status_code=504
+        )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=PORT, log_level="info")
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+File Locks
+Advisory inter-process locks for the on-disk indexes, so concurrent one-shot
+CLI calls and --serve processes never interleave their writes.
+
+Uses flock() on POSIX (shared or exclusive) and msvcrt byte locks on Windows
+(always exclusive there).
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def locked(path, exclusive=True):
+    """Hold a lock on `path` (created if missing) for the duration of the block"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return
+
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                time.sleep(0.01)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+Duplicate Identity Index
+Nearest-identity search over every candidate's reference-photo face encoding,
+to spot one person behind several candidate accounts.
+
+- Encodings (128-d, face_recognition) live in a memory-mapped float32 matrix,
+  so a large index opens instantly and pages are shared between processes
+- Search is a blocked NumPy matrix product over the matrix
+- For large populations an IVF-style partition (k-means centroids) limits the
+  scan to the rows in the nearest few partitions: rebuild stores each
+  partition's row ids (ivf.npz), so a search reads only the probed lists plus
+  the rows added since the last rebuild
+- Inserts are incremental (append in place, grow by doubling); a replaced or
+  removed row is tombstoned, and once COMPACT_DELETED_RATIO of the rows are
+  dead the arrays are rewritten as a new generation (meta.json switches to it
+  atomically)
+- Every request holds a lock on the index directory (exclusive for writes), so
+  concurrent one-shot calls and --serve processes never lose each other's inserts
+
+Reads JSON from stdin, writes JSON to stdout.
+
+Input:
+  { "action": "add",    "id": "cand1", "photo": "data:image/jpeg;base64,..." }   (or "encoding": [...])
+  { "action": "search", "photo": "...", "threshold": 0.4, "top_k": 5 }
+  { "action": "remove", "id": "cand1" }
+  { "action": "rebuild" }   (drop deleted rows and retrain the IVF partition)
+  { "action": "stats" }
+  Any request may include "index": "/path/to/dir" (default: IDENTITY_INDEX_DIR or data/identity_index)
+
+"add" reports the existing identities within the threshold before inserting:
+Output: { "success": true, "id": "cand1", "duplicates": [{ "id": "cand7", "distance": 0.31, "match_score": 69.0 }] }
+
+Stage timings: PROFILE_TIMINGS=1 adds "timings" to each response (see profiling.py).
+
+Run with --serve to keep the index open and answer one JSON request per stdin line.
+"""
+
+import sys
+import os
+import json
+import math
+import tempfile
+
+import numpy as np
+
+import profiling
+from file_lock import locked
+
+DEFAULT_INDEX_DIR = os.environ.get(
+    'IDENTITY_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'identity_index')
+)
+
+DIM = 128
+
+# Same cut-off as face verification: score = (1 - distance) * 100 >= MATCH_THRESHOLD
+DEFAULT_DISTANCE_THRESHOLD = 0.4
+DEFAULT_TOP_K = 5
+
+# Rows scored per matrix product
+SEARCH_BLOCK = 16384
+
+# IVF partitioning kicks in from this many identities
+IVF_MIN_SIZE = 50000
+IVF_NPROBE = 8
+IVF_TRAIN_SAMPLE = 50000
+KMEANS_ITERATIONS = 10
+
+INITIAL_CAPACITY = 1024
+
+# Rewrite the arrays without tombstoned rows once this share of rows is dead
+COMPACT_DELETED_RATIO = 0.25
+
+WRITE_ACTIONS = ('add', 'remove', 'rebuild')
+
+
+def _atomic_write(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def kmeans(data, k, iterations=KMEANS_ITERATIONS, seed=0):
+    """Plain Lloyd's k-means with blocked assignment; returns float32 centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        assign = assign_nearest(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        counts = np.bincount(assign, minlength=k)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        # Re-seed empty clusters from random points
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids
+
+
+def assign_nearest(data, centroids):
+    """Index of the nearest centroid for every row of data."""
+    centroid_norms = (centroids * centroids).sum(axis=1)
+    assign = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), SEARCH_BLOCK):
+        block = data[start:start + SEARCH_BLOCK]
+        # argmin |x - c|^2 = argmin |c|^2 - 2 x.c
+        assign[start:start + len(block)] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return assign
+
+
+class IdentityIndex:
+    """Memory-mapped encoding matrix with optional IVF partitions."""
+
+    def __init__(self, index_dir=DEFAULT_INDEX_DIR):
+        self.index_dir = index_dir
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        self.ids = []
+        self.row_of = {}
+        self.deleted = set()
+        self.count = 0
+        self.capacity = 0
+        self.generation = 0
+        self.centroids = None
+        self.vectors = None
+        self.norms = None
+        self.lists = None
+        self.ivf_rows = None         # live row ids grouped by partition (rows below ivf_count)
+        self.ivf_offsets = None      # partition p -> ivf_rows[offsets[p]:offsets[p + 1]]
+        self.ivf_count = 0
+        self._meta_stat = None
+
+    # ---- storage ----------------------------------------------------
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _array_path(self, name, generation=None):
+        """Array file for a generation (generation 0 keeps the original names)"""
+        generation = self.generation if generation is None else generation
+        if generation == 0:
+            return self._path(name)
+        stem, ext = os.path.splitext(name)
+        return self._path(f"{stem}.{generation}{ext}")
+
+    def lock(self, exclusive=True):
+        """Inter-process lock on the index directory (see WRITE_ACTIONS)"""
+        return locked(self._path('.lock'), exclusive)
+
+    def _open_arrays(self, capacity, mode):
+        self.vectors = np.memmap(self._array_path('vectors.f32'), dtype=np.float32, mode=mode, shape=(capacity, DIM))
+        self.norms = np.memmap(self._array_path('norms.f32'), dtype=np.float32, mode=mode, shape=(capacity,))
+        self.lists = np.memmap(self._array_path('lists.i32'), dtype=np.int32, mode=mode, shape=(capacity,))
+        self.capacity = capacity
+
+    def _stat_meta(self):
+        try:
+            st = os.stat(self._path('meta.json'))
+            return st.st_ino, st.st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        meta_path = self._path('meta.json')
+        self._meta_stat = self._stat_meta()
+        if self._meta_stat is None:
+            return
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.ids = meta['ids']
+        self.count = len(self.ids)
+        self.generation = meta.get('generation', 0)
+        self.deleted = set(meta.get('deleted', []))
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids) if row not in self.deleted}
+        self._open_arrays(meta['capacity'], 'r+')
+        if os.path.exists(self._path('centroids.npy')):
+            self.centroids = np.load(self._path('centroids.npy'))
+            if os.path.exists(self._path('ivf.npz')):
+                with np.load(self._path('ivf.npz')) as ivf:
+                    # Lists written for another generation (or an unfinished rebuild) are ignored
+                    if int(ivf['generation']) == self.generation and int(ivf['count']) <= self.count:
+                        self.ivf_rows = ivf['rows']
+                        self.ivf_offsets = ivf['offsets']
+                        self.ivf_count = int(ivf['count'])
+
+    def refresh(self):
+        """Reopen the index if another process has written it since it was loaded"""
+        if self._stat_meta() != self._meta_stat:
+            self._reset()
+            self._load()
+
+    def _grow(self, needed):
+        if needed <= self.capacity:
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        capacity = max(needed, self.capacity * 2, INITIAL_CAPACITY)
+        for name, itemsize, width in (('vectors.f32', 4, DIM), ('norms.f32', 4, 1), ('lists.i32', 4, 1)):
+            with open(self._array_path(name), 'ab') as f:
+                f.truncate(capacity * itemsize * width)
+        if self.vectors is not None:
+            self.flush()
+        self._open_arrays(capacity, 'r+')
+
+    def flush(self):
+        """Write the arrays, then the metadata that makes the new rows visible."""
+        if self.vectors is None:
+            return
+        for array in (self.vectors, self.norms, self.lists):
+            array.flush()
+        meta = {
+            "version": 1,
+            "dim": DIM,
+            "capacity": self.capacity,
+            "generation": self.generation,
+            "ids": self.ids,
+            "deleted": sorted(self.deleted),
+        }
+        _atomic_write(self._path('meta.json'), lambda f: f.write(json.dumps(meta).encode('utf-8')))
+        self._meta_stat = self._stat_meta()
+
+    # ---- updates ----------------------------------------------------
+
+    @property
+    def live_count(self):
+        return len(self.row_of)
+
+    def add(self, doc_id, encoding):
+        """Insert or replace one identity's encoding (a replaced row is tombstoned)."""
+        doc_id = str(doc_id)
+        vector = np.asarray(encoding, dtype=np.float32).reshape(DIM)
+
+        # Always a new row, so a row's partition never changes after the inverted lists are built
+        old_row = self.row_of.get(doc_id)
+        row = self.count
+        self._grow(row + 1)
+        self.ids.append(doc_id)
+        self.count += 1
+        self.row_of[doc_id] = row
+
+        self.vectors[row] = vector
+        self.norms[row] = float(vector @ vector)
+        self.lists[row] = assign_nearest(vector[np.newaxis], self.centroids)[0] if self.centroids is not None else -1
+        if old_row is not None:
+            self._tombstone(old_row)
+
+    def remove(self, doc_id):
+        row = self.row_of.pop(str(doc_id), None)
+        if row is None:
+            return False
+        self._tombstone(row)
+        return True
+
+    def _tombstone(self, row):
+        self.deleted.add(row)
+        if len(self.deleted) > COMPACT_DELETED_RATIO * self.count:
+            self.compact()
+
+    def compact(self):
+        """Rewrite the arrays with live rows only, as a new generation.
+
+        The new files are complete before meta.json points at them, so a crash
+        leaves either the old or the new generation in use.
+        """
+        if not self.deleted:
+            return
+        live = np.asarray(sorted(self.row_of.values()), dtype=np.int64)
+        old_generation = self.generation
+        generation = old_generation + 1
+        capacity = max(2 * len(live), INITIAL_CAPACITY)
+
+        for name, source in (('vectors.f32', self.vectors), ('norms.f32', self.norms), ('lists.i32', self.lists)):
+            path = self._array_path(name, generation)
+            target = np.memmap(path, dtype=source.dtype, mode='w+', shape=(capacity,) + source.shape[1:])
+            for start in range(0, len(live), SEARCH_BLOCK):
+                rows = live[start:start + SEARCH_BLOCK]
+                target[start:start + len(rows)] = source[rows]
+            target.flush()
+            del target
+
+        self.ids = [self.ids[row] for row in live]
+        self.count = len(self.ids)
+        self.deleted = set()
+        self.row_of = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.generation = generation
+        self._open_arrays(capacity, 'r+')
+        if self.centroids is not None:
+            self._build_inverted_lists()
+        self.flush()
+
+        for name in ('vectors.f32', 'norms.f32', 'lists.i32'):
+            old_path = self._array_path(name, old_generation)
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+    def _build_inverted_lists(self):
+        """Group the live rows by partition (row order kept within a partition)"""
+        live = np.ones(self.count, dtype=bool)
+        live[list(self.deleted)] = False
+        rows = np.flatnonzero(live)
+        partitions = np.asarray(self.lists[:self.count])[rows]
+        order = np.argsort(partitions, kind='stable')
+        self.ivf_rows = rows[order].astype(np.int32)
+        self.ivf_offsets = np.searchsorted(partitions[order], np.arange(len(self.centroids) + 1)).astype(np.int64)
+        self.ivf_count = self.count
+        _atomic_write(self._path('ivf.npz'), lambda f: np.savez(
+            f, rows=self.ivf_rows, offsets=self.ivf_offsets, count=self.ivf_count, generation=self.generation))
+
+    def rebuild(self):
+        """Drop deleted rows and (re)train the IVF partition; small indexes fall back to a flat scan."""
+        self.compact()
+        live = np.asarray(sorted(self.row_of.values()), dtype=np.int64)
+        if len(live) < IVF_MIN_SIZE:
+            self.centroids = None
+            self.ivf_rows = self.ivf_offsets = None
+            self.ivf_count = 0
+            for name in ('centroids.npy', 'ivf.npz'):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            if self.count:
+                self.lists[:self.count] = -1
+            return 0
+
+        rng = np.random.default_rng(0)
+        sample = live[rng.choice(len(live), size=min(IVF_TRAIN_SAMPLE, len(live)), replace=False)]
+        nlist = int(math.sqrt(len(live)))
+        self.centroids = kmeans(np.asarray(self.vectors[np.sort(sample)]), nlist)
+        for start in range(0, self.count, SEARCH_BLOCK):
+            end = min(start + SEARCH_BLOCK, self.count)
+            self.lists[start:end] = assign_nearest(np.asarray(self.vectors[start:end]), self.centroids)
+        self.lists.flush()
+        _atomic_write(self._path('centroids.npy'), lambda f: np.save(f, self.centroids))
+        self._build_inverted_lists()
+        return nlist
+
+    # ---- search -----------------------------------------------------
+
+    def _probed_rows(self, probes):
+        """Rows in the probed partitions: their inverted lists plus matching rows added since the rebuild"""
+        rows = []
+        if self.ivf_rows is not None:
+            rows = [self.ivf_rows[self.ivf_offsets[p]:self.ivf_offsets[p + 1]] for p in probes]
+        if self.count > self.ivf_count:
+            tail = np.flatnonzero(np.isin(self.lists[self.ivf_count:self.count], probes))
+            rows.append((self.ivf_count + tail).astype(np.int32))
+        if not rows:
+            return np.zeros(0, dtype=np.int64)
+        # Sorted, so the gather walks the memmap forwards
+        return np.sort(np.concatenate(rows))
+
+    def _blocks(self, probes):
+        """(rows or None, first row, vectors, norms) for each block to score"""
+        if probes is None:
+            for start in range(0, self.count, SEARCH_BLOCK):
+                end = min(start + SEARCH_BLOCK, self.count)
+                yield None, start, self.vectors[start:end], self.norms[start:end]
+            return
+        candidates = self._probed_rows(probes)
+        for start in range(0, len(candidates), SEARCH_BLOCK):
+            rows = candidates[start:start + SEARCH_BLOCK]
+            yield rows, 0, self.vectors[rows], self.norms[rows]
+
+    def search(self, encoding, threshold=DEFAULT_DISTANCE_THRESHOLD, top_k=DEFAULT_TOP_K, exclude=None):
+        """Identities within `threshold` Euclidean distance, nearest first."""
+        if self.live_count == 0:
+            return []
+        query = np.asarray(encoding, dtype=np.float32).reshape(DIM)
+        query_norm = float(query @ query)
+        max_sq = threshold * threshold
+
+        probes = None
+        if self.centroids is not None:
+            centroid_dist = ((self.centroids - query) ** 2).sum(axis=1)
+            probes = np.argsort(centroid_dist)[:IVF_NPROBE]
+
+        hits_rows, hits_dist = [], []
+        for rows, start, block, block_norms in self._blocks(probes):
+            # |q - x|^2 = |q|^2 + |x|^2 - 2 q.x  (one matrix-vector product per block)
+            sq = np.maximum(block_norms + query_norm - 2 * (block @ query), 0)
+            close = np.flatnonzero(sq <= max_sq)
+            if len(close):
+                hits_rows.append(close + start if rows is None else rows[close])
+                hits_dist.append(np.sqrt(sq[close]))
+
+        if not hits_rows:
+            return []
+        rows = np.concatenate(hits_rows)
+        distances = np.concatenate(hits_dist)
+        order = np.argsort(distances, kind='stable')
+
+        matches = []
+        for i in order:
+            row = int(rows[i])
+            if row in self.deleted or self.ids[row] == exclude:
+                continue
+            distance = float(distances[i])
+            matches.append({
+                "id": self.ids[row],
+                "distance": round(distance, 4),
+                "match_score": round(max(0.0, (1.0 - distance) * 100), 1)
+            })
+            if len(matches) >= top_k:
+                break
+        return matches
+
+
+def request_encoding(data):
+    """Encoding from the request: given directly, or computed from a photo."""
+    if data.get('encoding') is not None:
+        return np.asarray(data['encoding'], dtype=np.float32)
+
+    photo = data.get('photo')
+    if not photo:
+        raise Exception("Missing photo or encoding")
+
+    import face_verification
+    from reference_cache import get_cache, photo_hash
+
+    cache = get_cache()
+    photo_id = photo_hash(photo)
+    cached = cache.get(photo_id) or {}
+    if cached.get('encoding') is not None:
+        return np.asarray(cached['encoding'], dtype=np.float32)
+
+    try:
+        import face_recognition  # noqa: F401
+    except ImportError:
+        raise Exception("face_recognition not installed (needed to encode photos)")
+
+    img = face_verification.decode_base64_image(photo)
+    if img is None:
+        raise Exception("Failed to decode image")
+    encoding = face_verification.encode_face(img)
+    if encoding is None:
+        raise Exception("No face found in photo")
+    cache.put(photo_id, {'encoding': encoding})
+    return np.asarray(encoding, dtype=np.float32)
+
+
+def with_encoding(data):
+    """Request with any photo already encoded, so the slow part runs before the index is locked"""
+    if data.get('action') in ('add', 'search') and data.get('encoding') is None and data.get('photo'):
+        return {**data, 'encoding': request_encoding(data).tolist()}
+    return data
+
+
+def handle_request(index, data):
+    """Apply one request to the index; returns (response, index_changed)"""
+    action = data.get('action')
+    threshold = float(data.get('threshold', DEFAULT_DISTANCE_THRESHOLD))
+    top_k = int(data.get('top_k', DEFAULT_TOP_K))
+
+    if action == 'add':
+        doc_id = data.get('id')
+        if doc_id is None:
+            return {"success": False, "error": "Missing id"}, False
+        encoding = request_encoding(data)
+        duplicates = index.search(encoding, threshold, top_k, exclude=str(doc_id))
+        index.add(doc_id, encoding)
+        return {"success": True, "id": str(doc_id), "duplicates": duplicates, "count": index.live_count}, True
+
+    if action == 'search':
+        matches = index.search(request_encoding(data), threshold, top_k, exclude=data.get('exclude'))
+        return {"success": True, "matches": matches, "count": index.live_count}, False
+
+    if action == 'remove':
+        removed = index.remove(data.get('id'))
+        return {"success": True, "removed": removed, "count": index.live_count}, removed
+
+    if action == 'rebuild':
+        nlist = index.rebuild()
+        return {"success": True, "partitions": nlist, "count": index.live_count}, True
+
+    if action == 'stats':
+        return {
+            "success": True,
+            "count": index.live_count,
+            "rows": index.count,
+            "deleted": len(index.deleted),
+            "capacity": index.capacity,
+            "partitions": 0 if index.centroids is None else len(index.centroids),
+            # Rows added since the last rebuild (scanned by partition id, not via the inverted lists)
+            "unindexed": index.count - index.ivf_count if index.centroids is not None else 0
+        }, False
+
+    return {"success": False, "error": f"Unknown action: {action}"}, False
+
+
+def serve(index_dir):
+    """Keep the index open and answer one JSON request per line"""
+    with locked(os.path.join(index_dir, '.lock'), exclusive=False):
+        index = IdentityIndex(index_dir)
+    print(f"Loaded identity index: {index.live_count} identities", file=sys.stderr)
+
+    first = True
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        # Startup, imports and the index load are charged to the first request only
+        profiler = profiling.begin('identity_index', imports=first)
+        first = False
+        try:
+            with profiling.span('read'):
+                data = json.loads(line)
+            with profiling.span('encode'):
+                data = with_encoding(data)
+            with index.lock(exclusive=data.get('action') in WRITE_ACTIONS):
+                with profiling.span('load'):
+                    # Pick up writes from one-shot calls or other servers
+                    index.refresh()
+                with profiling.span(str(data.get('action'))):
+                    response, changed = handle_request(index, data)
+                if changed:
+                    with profiling.span('save'):
+                        index.flush()
+        except Exception as e:
+            response = {"success": False, "error": str(e)}
+        sys.stdout.write(profiler.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_DIR)
+        return
+
+    profiler = profiling.begin('identity_index', imports=True)
+    try:
+        with profiling.span('read'):
+            data = json.loads(sys.stdin.read())
+        with profiling.span('encode'):
+            data = with_encoding(data)
+        index_dir = data.get('index') or DEFAULT_INDEX_DIR
+        with locked(os.path.join(index_dir, '.lock'), exclusive=data.get('action') in WRITE_ACTIONS):
+            with profiling.span('load'):
+                index = IdentityIndex(index_dir)
+            with profiling.span(str(data.get('action'))):
+                response, changed = handle_request(index, data)
+            if changed:
+                with profiling.span('save'):
+                    index.flush()
+        print(profiler.dumps(response))
+    except json.JSONDecodeError as e:
+        print(profiler.dumps({"success": False, "error": f"Invalid JSON input: {str(e)}"}))
+    except Exception as e:
+        print(profiler.dumps({"success": False, "error": f"Unexpected error: {str(e)}"}))
+
+
+if __name__ == '__main__':
+    main()
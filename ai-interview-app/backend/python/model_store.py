@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Model Asset Store
+Checksummed model files for the Python services (models/manifest.json).
+
+- Every asset has a SHA-256 and size in the manifest; a file that does not
+  match is never handed to a loader
+- Downloads go to <name>.part in chunks, resume from the bytes already
+  there (HTTP Range, or a seek for directory mirrors), are verified, then
+  atomically renamed into place
+- Successful verifications are stamped (size + mtime) in models/.verified.json,
+  so later cold starts and every worker process skip re-hashing
+- Loaders get a file path: MediaPipe maps the file read-only and shared
+  (MAP_SHARED), so all worker processes on a node use the same page-cache
+  copy. Passing model_asset_buffer instead would give each process a
+  private copy of the model.
+
+Env: MODEL_DIR (models/), MODEL_MIRROR (base URL, file:// URL or local
+directory holding the same file names; default is the manifest URL)
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import urllib.request
+from urllib.parse import urlparse
+
+from file_lock import locked
+
+MODEL_DIR = os.environ.get(
+    'MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+)
+MODEL_MIRROR = os.environ.get('MODEL_MIRROR')
+MANIFEST_NAME = 'manifest.json'
+STAMP_NAME = '.verified.json'
+
+CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_ATTEMPTS = 3
+TIMEOUT_S = 30
+
+
+class ModelIntegrityError(Exception):
+    """A model file (or download) does not match its manifest entry"""
+
+
+def load_manifest(model_dir=MODEL_DIR):
+    with open(os.path.join(model_dir, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_stamps(model_dir):
+    try:
+        with open(os.path.join(model_dir, STAMP_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_stamp(model_dir, name, stamp):
+    # Read-modify-write under the lock, so workers stamping different assets keep each other's stamps
+    with locked(os.path.join(model_dir, STAMP_NAME + '.lock')):
+        stamps = _read_stamps(model_dir)
+        stamps[name] = stamp
+        tmp = os.path.join(model_dir, f"{STAMP_NAME}.{os.getpid()}.tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(stamps, f, indent=2)
+        os.replace(tmp, os.path.join(model_dir, STAMP_NAME))
+
+
+def verify(name, model_dir=MODEL_DIR, manifest=None):
+    """True if the file matches its manifest entry (hashed only when the stamp is stale)."""
+    entry = (manifest or load_manifest(model_dir))[name]
+    path = os.path.join(model_dir, name)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if st.st_size != entry['size']:
+        return False
+
+    stamp = {"sha256": entry['sha256'], "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if _read_stamps(model_dir).get(name) == stamp:
+        return True
+    if sha256_file(path) != entry['sha256']:
+        return False
+    _write_stamp(model_dir, name, stamp)
+    return True
+
+
+def _source(name, entry, mirror):
+    """(local path or None, URL or None) for one asset"""
+    if not mirror:
+        return None, entry['url']
+    parsed = urlparse(mirror)
+    if parsed.scheme in ('http', 'https'):
+        return None, f"{mirror.rstrip('/')}/{name}"
+    if parsed.scheme == 'file':
+        return os.path.join(urllib.request.url2pathname(parsed.path), name), None
+    return os.path.join(mirror, name), None
+
+
+def _copy_from(source_path, part_path, offset, progress):
+    with open(source_path, 'rb') as src, open(part_path, 'ab') as dst:
+        src.seek(offset)
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dst.write(chunk)
+            offset += len(chunk)
+            if progress:
+                progress(offset)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def _download_from(url, part_path, offset, progress):
+    request = urllib.request.Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+    with urllib.request.urlopen(request, timeout=TIMEOUT_S) as response:
+        if offset and response.status != 206:
+            # Server ignored the Range header: start over
+            offset = 0
+        with open(part_path, 'ab' if offset else 'wb') as dst:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b''):
+                dst.write(chunk)
+                offset += len(chunk)
+                if progress:
+                    progress(offset)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+
+def fetch(name, mirror=MODEL_MIRROR, model_dir=MODEL_DIR, manifest=None, progress=None):
+    """Download (or copy) one asset into model_dir; returns its path.
+
+    `progress(bytes_done)` is called per chunk. A partial file left by an
+    interrupted run is resumed. Raises ModelIntegrityError if the finished
+    file does not match the manifest, OSError/URLError if no attempt succeeds.
+    """
+    manifest = manifest or load_manifest(model_dir)
+    entry = manifest[name]
+    path = os.path.join(model_dir, name)
+    part_path = path + '.part'
+    source_path, url = _source(name, entry, mirror)
+    os.makedirs(model_dir, exist_ok=True)
+
+    error = None
+    for _ in range(DOWNLOAD_ATTEMPTS):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > entry['size']:
+            os.remove(part_path)
+            offset = 0
+        try:
+            if offset < entry['size']:
+                if source_path:
+                    _copy_from(source_path, part_path, offset, progress)
+                else:
+                    _download_from(url, part_path, offset, progress)
+            error = None
+            break
+        except OSError as e:  # URLError and socket timeouts included; keep the partial file
+            error = e
+    if error is not None:
+        raise error
+
+    if os.path.getsize(part_path) != entry['size'] or sha256_file(part_path) != entry['sha256']:
+        os.remove(part_path)
+        raise ModelIntegrityError(f"{name}: download does not match manifest checksum")
+    os.replace(part_path, path)
+    st = os.stat(path)
+    _write_stamp(model_dir, name, {"sha256": entry['sha256'], "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+    return path
+
+
+def ensure(name, mirror=MODEL_MIRROR, model_dir=MODEL_DIR, progress=None):
+    """Path to a verified copy of `name`, fetching it first if missing or corrupt."""
+    manifest = load_manifest(model_dir)
+    if verify(name, model_dir, manifest):
+        return os.path.join(model_dir, name)
+    return fetch(name, mirror, model_dir, manifest, progress)
+
+
+def model_path(name, model_dir=MODEL_DIR):
+    """Path to a verified local copy for loaders (no download); raises ModelIntegrityError."""
+    path = os.path.join(model_dir, name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Model not found: {path} (run download_model.py)")
+    if not verify(name, model_dir):
+        raise ModelIntegrityError(f"Model does not match manifest checksum: {path} (run download_model.py)")
+    return path
+
+
+def add_to_manifest(path, url, model_dir=MODEL_DIR):
+    """Record (or update) a manifest entry for a local file."""
+    manifest_path = os.path.join(model_dir, MANIFEST_NAME)
+    manifest = load_manifest(model_dir) if os.path.exists(manifest_path) else {}
+    manifest[os.path.basename(path)] = {"url": url, "size": os.path.getsize(path), "sha256": sha256_file(path)}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    return manifest
+
+
+if __name__ == "__main__":
+    # python model_store.py             verify every asset in the manifest
+    # python model_store.py add FILE URL
+    if len(sys.argv) == 4 and sys.argv[1] == 'add':
+        dest = os.path.join(MODEL_DIR, os.path.basename(sys.argv[2]))
+        if os.path.abspath(sys.argv[2]) != os.path.abspath(dest):
+            shutil.copyfile(sys.argv[2], dest)
+        print(json.dumps(add_to_manifest(dest, sys.argv[3]), indent=2))
+        sys.exit(0)
+    ok = True
+    for asset in load_manifest():
+        good = verify(asset)
+        ok = ok and good
+        print(f"{'OK ' if good else 'BAD'} {asset}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Stage Timing
+Lightweight per-request spans for the Python entry points, so callers can see
+where a request's time went (startup/imports, decode, extraction or detection,
+encoding, serialization) without attaching a profiler.
+
+    profiler = profiling.begin("extract_resume", imports=True)
+    with profiling.span("decode"):
+        ...
+    print(profiler.dumps(result))   # adds "timings": { "decode_ms": ..., "total_ms": ... }
+
+Library code only calls profiling.span(); outside a profiled request (or for a
+request that was not sampled) a span costs one attribute check.
+
+The current request is a context variable, so the servers' concurrent requests
+(each handled in its own asyncio task) keep separate profilers. Threads start
+with an empty context: run their target with contextvars.copy_context().run to
+report to the request that started them.
+
+Stage totals are exclusive: a span nested in another on the same thread (an
+import inside "extract", a decode inside "read") counts only toward the inner
+stage, so the stages of a single-threaded request add up to at most total_ms.
+The trace keeps every span whole.
+
+Env:
+  PROFILE_TIMINGS=1       add a "timings" object to each JSON response
+  PROFILE_SAMPLE_RATE     fraction of requests profiled (0-1, default 1)
+  PROFILE_TRACE_FILE      append spans as Chrome trace events (open in
+                          chrome://tracing or https://ui.perfetto.dev)
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import threading
+import importlib
+import contextvars
+from contextlib import contextmanager
+
+from file_lock import locked
+
+REPORT_TIMINGS = os.environ.get('PROFILE_TIMINGS', '').lower() in ('1', 'true', 'yes')
+SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))
+TRACE_FILE = os.environ.get('PROFILE_TRACE_FILE')
+
+# Wall-clock microseconds = (perf_counter() + offset) * 1e6, for trace timestamps across processes
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+
+def _process_start():
+    """perf_counter() value when this process started (Linux), else when this module was imported"""
+    try:
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        age = time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf('SC_CLK_TCK')
+        return time.perf_counter() - max(age, 0.0)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter()
+
+
+PROCESS_STARTED = _process_start()
+
+
+class Profiler:
+    """Spans for one request: exclusive time summed per stage for "timings", kept individually for the trace."""
+
+    def __init__(self, name, report=REPORT_TIMINGS, sample_rate=SAMPLE_RATE, trace_file=TRACE_FILE):
+        self.name = name
+        self.report = report
+        self.trace_file = trace_file
+        self.active = bool(report or trace_file) and (sample_rate >= 1 or random.random() < sample_rate)
+        self.started = time.perf_counter()
+        self._totals = {}
+        self._events = []
+        self._lock = threading.Lock()
+        self._open = threading.local()  # per thread: time spent in nested spans, one entry per open span
+
+    @contextmanager
+    def span(self, name):
+        if not self.active:
+            yield
+            return
+        nested = self._open.__dict__.setdefault('stack', [])
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            inner = nested.pop()
+            if nested:
+                nested[-1] += end - start
+            self.add(name, start, end, exclusive=end - start - inner)
+
+    def add(self, name, start, end, exclusive=None):
+        """Record a span from perf_counter() timestamps (safe from any thread).
+
+        `exclusive` is the part of it charged to the stage total (default: all of it).
+        """
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0.0) + (end - start if exclusive is None else exclusive)
+            self._events.append((name, start, end, threading.get_ident()))
+
+    def nested(self, name, seconds):
+        """Charge part of the enclosing span on this thread to stage `name` instead (not traced)"""
+        if not self.active:
+            return
+        stack = self._open.__dict__.get('stack')
+        if stack:
+            stack[-1] += seconds
+        with self._lock:
+            self._totals[name] = self._totals.get(name, 0.0) + seconds
+
+    def merge(self, timings):
+        """Charge the stages in a worker's "timings" to the enclosing span on this thread (e.g. the wait for it)"""
+        for key, ms in (timings or {}).items():
+            if key.endswith('_ms') and key != 'total_ms':
+                self.nested(key[:-3], ms / 1000)
+
+    def record(self, name, ms):
+        """Add time measured elsewhere (e.g. in a pool worker) to a stage total; not traced"""
+        if self.active:
+            with self._lock:
+                self._totals[name] = self._totals.get(name, 0.0) + ms / 1000
+
+    def timings(self):
+        with self._lock:
+            timings = {f"{name}_ms": round(seconds * 1000, 2) for name, seconds in self._totals.items()}
+        timings["total_ms"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def dumps(self, result):
+        """json.dumps(result), with "timings" added when reporting (serialization included).
+
+        A "timings" object already in the result keeps its keys; stage keys are added beside them.
+        """
+        if not self.active:
+            return json.dumps(result)
+
+        existing = result.pop('timings', None)
+        try:
+            with self.span('serialize'):
+                body = json.dumps(result)
+        finally:
+            if existing is not None:
+                result['timings'] = existing
+        timings = {**self.timings(), **(existing or {})} if self.report else existing
+        if timings is not None:
+            body = body[:-1] + (', ' if len(body) > 2 else '') + '"timings": ' + json.dumps(timings) + '}'
+        self.write_trace()
+        return body
+
+    def write_trace(self):
+        """Append this request's spans to the trace file (JSON array format, left open for appending)"""
+        if not self.trace_file or not self.active:
+            return
+        pid = os.getpid()
+        end = time.perf_counter()
+        with self._lock:
+            spans = [(self.name, self.started, end, threading.get_ident())] + self._events
+            self._events = []
+        lines = ''.join(
+            json.dumps({"name": name, "cat": self.name, "ph": "X", "pid": pid, "tid": tid,
+                        "ts": round((start + _EPOCH_OFFSET) * 1e6), "dur": round((stop - start) * 1e6)}) + ',\n'
+            for name, start, stop, tid in spans
+        )
+        try:
+            # Under the lock, the process that finds the file empty writes the header before any event
+            with locked(self.trace_file + '.lock'):
+                with open(self.trace_file, 'a', encoding='utf-8') as f:
+                    if f.tell() == 0:
+                        f.write('[\n')
+                    f.write(lines)
+        except OSError as e:
+            print(f"Trace write failed: {e}", file=sys.stderr)
+
+
+class Laps:
+    """Stopwatch for the interleaved steps of one hot loop, where a span per step would cost
+    more than the step: lap(name) charges the time since the previous lap to `name`, and
+    close() reports the totals as stages nested in the enclosing span."""
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.active = profiler.active
+        self.totals = {}
+        self.last = time.perf_counter() if self.active else 0.0
+
+    def lap(self, name):
+        if self.active:
+            now = time.perf_counter()
+            self.totals[name] = self.totals.get(name, 0.0) + (now - self.last)
+            self.last = now
+
+    def close(self):
+        for name, seconds in self.totals.items():
+            self.profiler.nested(name, seconds)
+        self.totals = {}
+
+
+_current = contextvars.ContextVar('profiler', default=Profiler(None, report=False, trace_file=None))
+
+
+def begin(name, imports=False, **options):
+    """Start profiling a request in the current context; `imports` adds the process startup and module import time"""
+    profiler = Profiler(name, **options)
+    if imports and profiler.active:
+        profiler.started = PROCESS_STARTED
+        profiler.add('import', PROCESS_STARTED, time.perf_counter())
+    _current.set(profiler)
+    return profiler
+
+
+def current():
+    return _current.get()
+
+
+def span(name):
+    """Span on the current request's profiler (bound now, so late threads report to their own request)"""
+    return _current.get().span(name)
+
+
+def laps():
+    """Laps on the current request's profiler"""
+    return Laps(_current.get())
+
+
+def lazy_import(module_name):
+    """Import a heavy optional module, counting the first import as "import" time"""
+    module = sys.modules.get(module_name)
+    if module is None:
+        with span('import'):
+            module = importlib.import_module(module_name)
+    return module
+
+
+def call(name, func, *args):
+    """Run func(*args) as one profiled request; for pool workers returning result dicts"""
+    profiler = begin(name)
+    result = func(*args)
+    if profiler.active and isinstance(result, dict):
+        if profiler.report and 'timings' not in result:
+            result['timings'] = profiler.timings()
+        profiler.write_trace()
+    return result
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Reference Face Cache
+Bounded in-memory + on-disk store for reference-photo face data, keyed by
+the SHA-256 of the photo payload. An entry holds whatever the matching
+methods need from the reference photo:
+
+  encoding: 128-d face_recognition embedding (float64)
+  face:     128x128 histogram-equalized grayscale crop (uint8, OpenCV fallback)
+
+Entries also round-trip through JSON so the Node side can persist them
+next to the application photo and send them back with later requests.
+"""
+
+import os
+import sys
+import base64
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'FACE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'reference_faces')
+)
+MEMORY_ENTRIES = int(os.environ.get('FACE_CACHE_MEMORY_ENTRIES', 256))
+DISK_ENTRIES = int(os.environ.get('FACE_CACHE_DISK_ENTRIES', 5000))
+
+# Size of the OpenCV face crop stored in an entry
+FACE_CROP_SIZE = 128
+
+# Check the on-disk entry count every N writes
+PRUNE_INTERVAL = 64
+
+
+def photo_hash(data_url):
+    """Content hash of a base64 photo (data URL prefix ignored)."""
+    if ',' in data_url:
+        data_url = data_url.split(',', 1)[1]
+    return hashlib.sha256(data_url.strip().encode('ascii', 'ignore')).hexdigest()
+
+
+def entry_to_json(photo_id, entry):
+    """Serialize an entry for the JSON response."""
+    encoding = entry.get('encoding')
+    face = entry.get('face')
+    return {
+        "hash": photo_id,
+        "encoding": [round(float(v), 6) for v in encoding] if encoding is not None else None,
+        "face": base64.b64encode(np.ascontiguousarray(face, dtype=np.uint8).tobytes()).decode('ascii')
+                if face is not None else None,
+    }
+
+
+def entry_from_json(data):
+    """Parse an entry previously returned by entry_to_json; None if unusable."""
+    if not isinstance(data, dict) or not data.get('hash'):
+        return None
+    entry = {}
+    try:
+        if data.get('encoding'):
+            entry['encoding'] = np.asarray(data['encoding'], dtype=np.float64)
+        if data.get('face'):
+            face = np.frombuffer(base64.b64decode(data['face']), dtype=np.uint8)
+            entry['face'] = face.reshape(FACE_CROP_SIZE, FACE_CROP_SIZE)
+    except Exception as e:
+        print(f"Ignoring invalid reference embedding: {e}", file=sys.stderr)
+        return None
+    return entry or None
+
+
+class ReferenceCache:
+    """LRU memory cache backed by a bounded directory of .npz files.
+
+    Safe to share between threads (the server's batch coordinators): lookups,
+    merges and file writes hold a lock, and one thread at a time prunes.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, memory_entries=MEMORY_ENTRIES, disk_entries=DISK_ENTRIES):
+        self.cache_dir = cache_dir
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._writes = 0
+        self._lock = threading.RLock()
+        self._pruning = threading.Lock()
+
+    def _path(self, photo_id):
+        return os.path.join(self.cache_dir, photo_id[:2], photo_id + '.npz')
+
+    def get(self, photo_id):
+        with self._lock:
+            entry = self._memory.get(photo_id)
+            if entry is not None:
+                self._memory.move_to_end(photo_id)
+                return entry
+
+        if not self.cache_dir:
+            return None
+        path = self._path(photo_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = {key: data[key] for key in data.files}
+            os.utime(path)  # keep recently used entries from being pruned
+        except Exception as e:
+            print(f"Reference cache read failed: {e}", file=sys.stderr)
+            return None
+
+        self._remember(photo_id, entry)
+        return entry
+
+    def put(self, photo_id, entry):
+        """Merge `entry` into the cached one (so both methods' data can accumulate)."""
+        with self._lock:
+            merged = dict(self.get(photo_id) or {})
+            merged.update({key: value for key, value in entry.items() if value is not None})
+            self._remember(photo_id, merged)
+
+            if not self.cache_dir:
+                return merged
+            # Written under the lock, so an older merge never replaces a newer file
+            try:
+                path = self._path(photo_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+                with os.fdopen(fd, 'wb') as f:
+                    np.savez(f, **merged)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                print(f"Reference cache write failed: {e}", file=sys.stderr)
+                return merged
+            self._writes += 1
+            due = self._writes % PRUNE_INTERVAL == 0
+
+        if due:
+            self.prune()
+        return merged
+
+    def _remember(self, photo_id, entry):
+        with self._lock:
+            self._memory[photo_id] = entry
+            self._memory.move_to_end(photo_id)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def prune(self):
+        """Delete the least recently used files beyond the disk bound (skipped if another thread is pruning)."""
+        if not self._pruning.acquire(blocking=False):
+            return
+        try:
+            files = []
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    if name.endswith('.npz'):
+                        path = os.path.join(root, name)
+                        try:
+                            files.append((os.path.getmtime(path), path))
+                        except OSError:
+                            pass  # removed by another process meanwhile
+            if len(files) <= self.disk_entries:
+                return
+            files.sort()
+            for _, path in files[:len(files) - self.disk_entries]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        finally:
+            self._pruning.release()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide cache instance."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ReferenceCache()
+    return _default_cache
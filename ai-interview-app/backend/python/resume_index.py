@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+"""
+Resume Ranking Index
+BM25 ranking of resumes against a job description using an incrementally
+updated inverted index (sparse term -> (doc, tf) postings) and NumPy scoring.
+
+Persistence: a merged base snapshot (.npz, replaced atomically) plus an
+append-only delta log (.npz.log, one JSON record per add/remove). Writes only
+append to the log under an exclusive lock (.npz.lock); once the log outgrows
+MERGE_MIN_RECORDS / MERGE_LOG_RATIO it is folded into a new base. One-shot
+add/remove calls read just the base's id list, not its postings.
+
+Reads JSON from stdin, writes JSON to stdout.
+
+Input:
+  { "action": "add",    "documents": [{ "id": "cand1", "text": "..." }, { "id": "cand2", "filePath": "cv.pdf" }] }
+  { "action": "remove", "ids": ["cand1"] }
+  { "action": "search", "query": "job description text", "top_k": 20 }
+  { "action": "stats" }
+  { "action": "merge" }   (fold the delta log into the base snapshot now)
+  Any request may include "index": "/path/to/index.npz" (default: RESUME_INDEX_PATH or data/resume_index.npz)
+
+Output: { "success": true, ... }  (search adds "results": [{ "id": "cand2", "score": 12.3 }, ...])
+
+Stage timings: PROFILE_TIMINGS=1 adds "timings" to each response (see profiling.py).
+
+Run with --serve to keep the index in memory and answer one JSON request per stdin line.
+"""
+
+import sys
+import os
+import json
+import re
+import math
+import tempfile
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+import profiling
+from file_lock import locked
+
+DEFAULT_INDEX_PATH = os.environ.get(
+    'RESUME_INDEX_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'resume_index.npz')
+)
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+DEFAULT_TOP_K = 20
+
+# Compact the postings once this share of documents has been deleted
+COMPACT_DELETED_RATIO = 0.25
+
+# Merge the delta log into the base once it holds more than
+# max(MERGE_MIN_RECORDS, MERGE_LOG_RATIO * documents) records
+MERGE_MIN_RECORDS = 1000
+MERGE_LOG_RATIO = 0.2
+
+# Actions that hold the index's exclusive lock from read to append
+WRITE_ACTIONS = ('add', 'remove', 'merge')
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9][a-z0-9+#]*(?:\.[a-z0-9]+)*')
+
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the to was were will with
+we you your our their this these those i me my he she they them his her not but if then than so
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens with stopwords removed (keeps c++, c#, node.js)"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class ResumeIndex:
+    """Incremental BM25 inverted index over resume texts"""
+
+    def __init__(self):
+        self.vocab = {}              # term -> term id
+        self.postings_docs = []      # term id -> list of doc numbers
+        self.postings_tfs = []       # term id -> list of term frequencies
+        self.doc_freq = []           # term id -> number of live docs containing the term
+        self.doc_ids = []            # doc number -> external id
+        self.doc_terms = []          # doc number -> term ids (for deletes)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.id_to_doc = {}          # external id -> doc number
+        self.total_length = 0
+        self._array_cache = {}       # term id -> (doc numbers array, tf array)
+        self.journal = []            # delta-log records for changes not yet persisted
+
+    @property
+    def live_count(self):
+        return len(self.id_to_doc)
+
+    def _grow(self, size):
+        """Grow the per-document arrays geometrically"""
+        if size <= len(self.doc_lengths):
+            return
+        capacity = max(size, 2 * len(self.doc_lengths), 1024)
+        lengths = np.zeros(capacity, dtype=np.float32)
+        lengths[:len(self.doc_lengths)] = self.doc_lengths
+        deleted = np.ones(capacity, dtype=bool)
+        deleted[:len(self.deleted)] = self.deleted
+        self.doc_lengths = lengths
+        self.deleted = deleted
+
+    def add(self, doc_id, text):
+        """Add or replace a document"""
+        doc_id = str(doc_id)
+        counts = Counter(tokenize(text))
+        self.journal.append({"op": "add", "id": doc_id, "tf": counts})
+        self._add_counts(doc_id, counts)
+
+    def apply(self, record):
+        """Replay one delta-log record"""
+        if record["op"] == "add":
+            self._add_counts(record["id"], record["tf"])
+        else:
+            self._remove(record["id"])
+
+    def _add_counts(self, doc_id, counts):
+        if doc_id in self.id_to_doc:
+            self._remove(doc_id)
+
+        doc = len(self.doc_ids)
+        self._grow(doc + 1)
+
+        term_ids = []
+        for term, tf in counts.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                term_id = len(self.postings_docs)
+                self.vocab[term] = term_id
+                self.postings_docs.append([])
+                self.postings_tfs.append([])
+                self.doc_freq.append(0)
+            self.postings_docs[term_id].append(doc)
+            self.postings_tfs[term_id].append(tf)
+            self.doc_freq[term_id] += 1
+            self._array_cache.pop(term_id, None)
+            term_ids.append(term_id)
+
+        length = sum(counts.values())
+        self.doc_ids.append(doc_id)
+        self.doc_terms.append(np.asarray(term_ids, dtype=np.int32))
+        self.doc_lengths[doc] = length
+        self.deleted[doc] = False
+        self.id_to_doc[doc_id] = doc
+        self.total_length += length
+
+    def remove(self, doc_id):
+        """Delete a document (tombstoned until the next compaction)"""
+        removed = self._remove(str(doc_id))
+        if removed:
+            self.journal.append({"op": "remove", "id": str(doc_id)})
+        return removed
+
+    def _remove(self, doc_id):
+        doc = self.id_to_doc.pop(doc_id, None)
+        if doc is None:
+            return False
+
+        for term_id in self.doc_terms[doc]:
+            self.doc_freq[term_id] -= 1
+        self.deleted[doc] = True
+        self.total_length -= int(self.doc_lengths[doc])
+
+        if len(self.doc_ids) and (len(self.doc_ids) - self.live_count) / len(self.doc_ids) > COMPACT_DELETED_RATIO:
+            self.compact()
+        return True
+
+    def compact(self):
+        """Drop tombstoned documents and renumber the rest"""
+        live = [doc for doc in range(len(self.doc_ids)) if not self.deleted[doc]]
+        kept = [(self.doc_ids[doc], self.doc_terms[doc], self.doc_lengths[doc]) for doc in live]
+        remap = np.full(len(self.doc_ids), -1, dtype=np.int64)
+        remap[live] = np.arange(len(live))
+
+        for term_id in range(len(self.postings_docs)):
+            docs = np.asarray(self.postings_docs[term_id], dtype=np.int64)
+            tfs = np.asarray(self.postings_tfs[term_id], dtype=np.int32)
+            new_docs = remap[docs] if len(docs) else docs
+            keep = new_docs >= 0
+            self.postings_docs[term_id] = new_docs[keep].tolist()
+            self.postings_tfs[term_id] = tfs[keep].tolist()
+
+        self.doc_ids = [doc_id for doc_id, _, _ in kept]
+        self.doc_terms = [terms for _, terms, _ in kept]
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.deleted = np.zeros(0, dtype=bool)
+        self._grow(len(live))
+        self.doc_lengths[:len(live)] = [length for _, _, length in kept]
+        self.deleted[:len(live)] = False
+        self.id_to_doc = {doc_id: doc for doc, doc_id in enumerate(self.doc_ids)}
+        self._array_cache = {}
+
+    def _term_arrays(self, term_id):
+        cached = self._array_cache.get(term_id)
+        if cached is None:
+            cached = (
+                np.asarray(self.postings_docs[term_id], dtype=np.int64),
+                np.asarray(self.postings_tfs[term_id], dtype=np.float32),
+            )
+            self._array_cache[term_id] = cached
+        return cached
+
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """Return the top-K (id, score) pairs for a job description"""
+        n_docs = len(self.doc_ids)
+        live_count = self.live_count
+        if live_count == 0:
+            return []
+
+        avg_length = max(self.total_length / live_count, 1.0)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[:n_docs] / avg_length)
+        scores = np.zeros(n_docs, dtype=np.float32)
+
+        for term, query_tf in Counter(tokenize(query)).items():
+            term_id = self.vocab.get(term)
+            if term_id is None or self.doc_freq[term_id] <= 0:
+                continue
+            df = self.doc_freq[term_id]
+            idf = math.log(1 + (live_count - df + 0.5) / (df + 0.5))
+            docs, tfs = self._term_arrays(term_id)
+            scores[docs] += (idf * query_tf) * tfs * (BM25_K1 + 1) / (tfs + length_norm[docs])
+
+        scores[self.deleted[:n_docs]] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+
+        top_k = min(top_k, len(candidates))
+        top = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [(self.doc_ids[doc], round(float(scores[doc]), 4)) for doc in top]
+
+    def save(self, path):
+        """Persist as a compacted CSR-style .npz (atomic replace)"""
+        if len(self.doc_ids) != self.live_count:
+            self.compact()
+
+        terms = list(self.vocab)
+        lengths = np.asarray([len(self.postings_docs[self.vocab[term]]) for term in terms], dtype=np.int64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        docs = np.fromiter(
+            (doc for term in terms for doc in self.postings_docs[self.vocab[term]]),
+            dtype=np.int32, count=int(offsets[-1])
+        )
+        tfs = np.fromiter(
+            (tf for term in terms for tf in self.postings_tfs[self.vocab[term]]),
+            dtype=np.int32, count=int(offsets[-1])
+        )
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(
+                    f,
+                    terms=np.asarray(terms, dtype=str),
+                    offsets=offsets,
+                    docs=docs,
+                    tfs=tfs,
+                    doc_ids=np.asarray(self.doc_ids, dtype=str),
+                    doc_lengths=self.doc_lengths[:len(self.doc_ids)],
+                )
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """Load an index saved with save(); a missing file gives an empty index"""
+        index = cls()
+        if not os.path.exists(path):
+            return index
+
+        with np.load(path, allow_pickle=False) as data:
+            terms = data['terms'].tolist()
+            offsets = data['offsets']
+            docs = data['docs']
+            tfs = data['tfs']
+            index.doc_ids = data['doc_ids'].tolist()
+            n_docs = len(index.doc_ids)
+            index._grow(n_docs)
+            index.doc_lengths[:n_docs] = data['doc_lengths']
+            index.deleted[:n_docs] = False
+
+        doc_terms = [[] for _ in range(n_docs)]
+        for term_id, term in enumerate(terms):
+            start, end = int(offsets[term_id]), int(offsets[term_id + 1])
+            index.vocab[term] = term_id
+            term_docs = docs[start:end]
+            index.postings_docs.append(term_docs.tolist())
+            index.postings_tfs.append(tfs[start:end].tolist())
+            index.doc_freq.append(end - start)
+            for doc in index.postings_docs[-1]:
+                doc_terms[doc].append(term_id)
+
+        index.doc_terms = [np.asarray(terms_for_doc, dtype=np.int32) for terms_for_doc in doc_terms]
+        index.id_to_doc = {doc_id: doc for doc, doc_id in enumerate(index.doc_ids)}
+        index.total_length = int(index.doc_lengths[:n_docs].sum())
+        return index
+
+
+class LiveIds:
+    """Write-only stand-in for ResumeIndex in one-shot add/remove calls.
+
+    Tracks which ids exist (base id list plus the delta log) and journals the
+    changes, without loading any postings.
+    """
+
+    def __init__(self, ids):
+        self.ids = set(ids)
+        self.journal = []
+
+    @property
+    def live_count(self):
+        return len(self.ids)
+
+    def add(self, doc_id, text):
+        self.ids.add(str(doc_id))
+        self.journal.append({"op": "add", "id": str(doc_id), "tf": Counter(tokenize(text))})
+
+    def apply(self, record):
+        if record["op"] == "add":
+            self.ids.add(record["id"])
+        else:
+            self.ids.discard(record["id"])
+
+    def remove(self, doc_id):
+        if str(doc_id) not in self.ids:
+            return False
+        self.ids.discard(str(doc_id))
+        self.journal.append({"op": "remove", "id": str(doc_id)})
+        return True
+
+
+class IndexStore:
+    """Base snapshot + append-only delta log for one index path, safe across processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + '.log'
+        self.lock_path = path + '.lock'
+        self.index = None
+        self.log_records = 0
+        self._log_offset = 0
+        self._base_stat = None
+        self._writing = False
+
+    def _lock(self, exclusive):
+        # flock is per open file, so nested locks inside writing() would deadlock
+        return nullcontext() if self._writing else locked(self.lock_path, exclusive)
+
+    @contextmanager
+    def writing(self):
+        """Exclusive lock for a whole read-modify-append cycle"""
+        with locked(self.lock_path):
+            self._writing = True
+            try:
+                yield
+            finally:
+                self._writing = False
+
+    def _stat_base(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_ino, st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _replay(self, target, offset=0):
+        """Apply log records from `offset`; returns (new offset, records applied)"""
+        if not os.path.exists(self.log_path):
+            return 0, 0
+        applied = 0
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn final write; ignored until completed
+                target.apply(json.loads(line))
+                offset += len(line)
+                applied += 1
+        return offset, applied
+
+    def load(self):
+        """Full index: base snapshot plus every logged change"""
+        with self._lock(exclusive=False):
+            self._load_unlocked()
+        return self.index
+
+    def _load_unlocked(self):
+        self._base_stat = self._stat_base()
+        self.index = ResumeIndex.load(self.path)
+        self._log_offset, self.log_records = self._replay(self.index)
+
+    def refresh(self):
+        """Pick up changes written by other processes since the last load/refresh"""
+        with self._lock(exclusive=False):
+            self._refresh_unlocked()
+        return self.index
+
+    def _refresh_unlocked(self):
+        log_size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if self.index is None or self._stat_base() != self._base_stat or log_size < self._log_offset:
+            # Another process merged: start again from its new base
+            self._load_unlocked()
+        elif log_size > self._log_offset:
+            self._log_offset, applied = self._replay(self.index, self._log_offset)
+            self.log_records += applied
+
+    def live_ids(self):
+        """LiveIds view for one-shot writes (reads only the base's doc_ids member)"""
+        with self._lock(exclusive=False):
+            ids = []
+            if os.path.exists(self.path):
+                with np.load(self.path, allow_pickle=False) as data:
+                    ids = data['doc_ids'].tolist()
+            view = LiveIds(ids)
+            _, self.log_records = self._replay(view)
+        return view
+
+    def commit(self, target):
+        """Append target.journal to the delta log; merges when the log has grown too long"""
+        records, target.journal = target.journal, []
+        if not records:
+            return
+        body = ''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records).encode('utf-8')
+        with self._lock(exclusive=True):
+            if self.index is not None and not self._writing:
+                # Catch up first so our offset can move past our own records
+                self._refresh_unlocked()
+            os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+            self._trim_torn_tail()
+            with open(self.log_path, 'ab') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+                self._log_offset = f.tell()
+            self.log_records += len(records)
+            if self.log_records > max(MERGE_MIN_RECORDS, MERGE_LOG_RATIO * target.live_count):
+                self._merge_unlocked()
+
+    def _trim_torn_tail(self):
+        """Cut a record left unfinished by a crashed writer, so the next append starts on its own line"""
+        try:
+            f = open(self.log_path, 'r+b')
+        except FileNotFoundError:
+            return
+        with f:
+            size = end = f.seek(0, os.SEEK_END)
+            while end > 0:
+                start = max(end - 4096, 0)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline >= 0:
+                    end = start + newline + 1
+                    break
+                end = start
+            if end < size:
+                f.truncate(end)
+
+    def merge(self):
+        with self._lock(exclusive=True):
+            self._merge_unlocked()
+
+    def _merge_unlocked(self):
+        """Write base + log as a new base, then empty the log (replaying twice is harmless)"""
+        if self.index is None or self._stat_base() != self._base_stat:
+            self._load_unlocked()
+        else:
+            self._refresh_unlocked()
+        self.index.save(self.path)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.log_path)), suffix='.log')
+        os.close(fd)
+        os.replace(tmp_path, self.log_path)
+        self._base_stat = self._stat_base()
+        self._log_offset = 0
+        self.log_records = 0
+
+
+def document_text(document):
+    """Text for an add request: inline text, or extracted from a resume file"""
+    if document.get('text'):
+        return document['text']
+    if document.get('filePath'):
+        from extract_resume import extract_text_from_source
+        file_path = document['filePath']
+        file_type = document.get('fileType') or os.path.splitext(file_path)[1]
+        return extract_text_from_source(file_path, file_type)
+    raise Exception(f"Document {document.get('id')} has no text or filePath")
+
+
+def handle_request(index, data):
+    """Apply one request to the index; returns (response, index_changed)"""
+    action = data.get('action')
+
+    if action == 'add':
+        documents = data.get('documents') or []
+        added, errors = [], []
+        for document in documents:
+            doc_id = document.get('id')
+            if doc_id is None:
+                errors.append({"id": None, "error": "Missing document id"})
+                continue
+            try:
+                index.add(doc_id, document_text(document))
+                added.append(str(doc_id))
+            except Exception as e:
+                errors.append({"id": str(doc_id), "error": str(e)})
+        return {"success": True, "added": added, "errors": errors, "count": index.live_count}, bool(added)
+
+    if action == 'remove':
+        removed = [str(doc_id) for doc_id in data.get('ids') or [] if index.remove(doc_id)]
+        return {"success": True, "removed": removed, "count": index.live_count}, bool(removed)
+
+    if action == 'search':
+        query = data.get('query', '')
+        if not query:
+            return {"success": False, "error": "Missing query"}, False
+        top_k = int(data.get('top_k', DEFAULT_TOP_K))
+        results = [{"id": doc_id, "score": score} for doc_id, score in index.search(query, top_k)]
+        return {"success": True, "results": results, "count": index.live_count}, False
+
+    if action == 'merge':
+        return {"success": True, "count": index.live_count}, False
+
+    if action == 'stats':
+        return {
+            "success": True,
+            "count": index.live_count,
+            "terms": len(index.vocab),
+            "avg_length": round(index.total_length / index.live_count, 1) if index.live_count else 0
+        }, False
+
+    return {"success": False, "error": f"Unknown action: {action}"}, False
+
+
+def serve(index_path):
+    """Keep the index in memory and answer one JSON request per line"""
+    store = IndexStore(index_path)
+    index = store.load()
+    print(f"Loaded resume index: {index.live_count} documents", file=sys.stderr)
+
+    first = True
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        # Startup, imports and the index load are charged to the first request only
+        profiler = profiling.begin('resume_index', imports=first)
+        first = False
+        try:
+            with profiling.span('read'):
+                data = json.loads(line)
+            action = data.get('action')
+            with store.writing() if action in WRITE_ACTIONS else nullcontext():
+                with profiling.span('load'):
+                    # Changes from one-shot writers or other servers
+                    index = store.refresh()
+                with profiling.span(str(action)):
+                    response, changed = handle_request(index, data)
+                with profiling.span('save'):
+                    if action == 'merge':
+                        store.merge()
+                    elif changed:
+                        store.commit(index)
+        except Exception as e:
+            response = {"success": False, "error": str(e)}
+        sys.stdout.write(profiler.dumps(response) + "\n")
+        sys.stdout.flush()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--serve':
+        serve(sys.argv[2] if len(sys.argv) > 2 else DEFAULT_INDEX_PATH)
+        return
+
+    profiler = profiling.begin('resume_index', imports=True)
+    try:
+        with profiling.span('read'):
+            data = json.loads(sys.stdin.read())
+        store = IndexStore(data.get('index') or DEFAULT_INDEX_PATH)
+        action = data.get('action')
+        with store.writing() if action in WRITE_ACTIONS else nullcontext():
+            with profiling.span('load'):
+                # Writes only need the id list; reads need the whole index
+                index = store.live_ids() if action in ('add', 'remove') else store.load()
+            with profiling.span(str(action)):
+                response, changed = handle_request(index, data)
+            with profiling.span('save'):
+                if action == 'merge':
+                    store.merge()
+                elif changed:
+                    store.commit(index)
+        print(profiler.dumps(response))
+    except json.JSONDecodeError as e:
+        print(profiler.dumps({"success": False, "error": f"Invalid JSON input: {str(e)}"}))
+    except Exception as e:
+        print(profiler.dumps({"success": False, "error": f"Unexpected error: {str(e)}"}))
+
+
+if __name__ == '__main__':
+    main()
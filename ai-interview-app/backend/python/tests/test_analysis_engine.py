@@ -0,0 +1,78 @@
+import asyncio
+import os
+import signal
+
+import pytest
+
+pytest.importorskip("mediapipe")
+matplotlib = pytest.importorskip("matplotlib")
+
+import profiling
+from analysis_engine import AnalysisEngine
+
+with open(os.path.join(matplotlib.get_data_path(), "sample_data", "grace_hopper.jpg"), "rb") as f:
+    FACE = f.read()
+
+
+async def restarted(worker, restarts=1):
+    """Wait until the worker has been restarted and its replacement is warm"""
+    while worker.restarts < restarts:
+        await asyncio.sleep(0.05)
+    await worker.ready
+
+
+def run_engine(scenario, **options):
+    async def main():
+        engine = AnalysisEngine(1, queue_size=4, queue_timeout=30, **options)
+        try:
+            await engine.start()
+        except Exception as e:
+            pytest.skip(f"Face analyzer unavailable: {e}")
+        try:
+            return await asyncio.wait_for(scenario(engine, engine._workers[0]), timeout=120)
+        finally:
+            engine.shutdown()
+
+    return asyncio.run(main())
+
+
+def test_crashed_worker_is_restarted():
+    async def scenario(engine, worker):
+        assert (await engine.analyze(FACE))["face_detected"]
+        worker.process.kill()
+        await restarted(worker)
+        return await engine.analyze(FACE), engine.stats()
+
+    result, stats = run_engine(scenario)
+    assert result["face_detected"]
+    assert stats["workers"][0]["restarts"] == 1 and stats["in_use"] == 0
+
+
+def test_stalled_worker_is_recycled_at_the_timeout():
+    async def scenario(engine, worker):
+        stuck = worker.process.pid
+        os.kill(stuck, signal.SIGSTOP)  # never answers, like a hung native call
+        with pytest.raises(RuntimeError, match="did not finish"):
+            await engine.analyze(FACE)
+        await restarted(worker)
+        assert worker.process.pid != stuck
+        return await engine.analyze(FACE), engine.stats()
+
+    result, stats = run_engine(scenario, analysis_timeout=1.0)
+    assert result["face_detected"]
+    assert stats["stalled"] == 1 and stats["workers"][0]["restarts"] == 1 and stats["in_use"] == 0
+
+
+def test_worker_stages_reach_the_callers_profiler(monkeypatch):
+    monkeypatch.setenv("PROFILE_TIMINGS", "1")  # read by the spawned workers
+
+    async def scenario(engine, worker):
+        profiler = profiling.begin("test", report=True, sample_rate=1, trace_file=None)
+        result = await engine.analyze(FACE)
+        return result, profiler.timings()
+
+    result, timings = run_engine(scenario)
+    assert "timings" not in result and timings["worker_ms"] >= 0
+    assert {"queue_ms", "worker_ms", "decode_ms", "analyze_ms"} <= set(timings)
+    stages = sum(value for key, value in timings.items() if key != "total_ms")
+    assert stages <= timings["total_ms"]
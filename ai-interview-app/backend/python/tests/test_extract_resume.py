@@ -0,0 +1,169 @@
+import io
+import json
+import re
+
+import pytest
+
+import extract_resume
+
+SAMPLE_TEXT = "Jane Doe\njane@example.com\nSUMMARY\nBackend engineer with ten years of Python and Django experience.\n"
+
+
+def docx_bytes(text=SAMPLE_TEXT):
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    for line in text.splitlines():
+        document.add_paragraph(line)
+    buf = io.BytesIO()
+    document.save(buf)
+    return buf.getvalue()
+
+
+def frame(header, payload=b""):
+    body = json.dumps(header).encode()
+    return extract_resume.FRAME_LENGTH.pack(len(body)) + body + payload
+
+
+def responses(data):
+    out = []
+    while data:
+        (length,) = extract_resume.FRAME_LENGTH.unpack(data[:4])
+        out.append(json.loads(data[4:4 + length]))
+        data = data[4 + length:]
+    return out
+
+
+def serve(requests):
+    stdout = io.BytesIO()
+    code = extract_resume.serve_framed(io.BytesIO(requests), stdout)
+    return code, responses(stdout.getvalue())
+
+
+def test_framed_worker_survives_negative_length():
+    payload = docx_bytes()
+    code, results = serve(frame({"fileType": "docx", "length": -5})
+                          + frame({"fileType": "docx", "length": len(payload)}, payload))
+    assert code == 0
+    assert not results[0]["success"] and "length" in results[0]["error"]
+    assert results[1]["success"]
+
+
+def test_framed_worker_skips_oversized_payload(monkeypatch):
+    payload = docx_bytes()
+    monkeypatch.setattr(extract_resume, "MAX_PAYLOAD_BYTES", len(payload))
+    monkeypatch.setattr(extract_resume, "SKIP_CHUNK_BYTES", 100)
+    oversized = payload + b"\0" * 1000
+    code, results = serve(frame({"fileType": "docx", "length": len(oversized)}, oversized)
+                          + frame({"fileType": "docx", "length": len(payload)}, payload))
+    assert code == 0
+    assert not results[0]["success"] and "too large" in results[0]["error"]
+    assert results[1]["success"]
+
+
+def test_framed_worker_stops_on_truncated_payload():
+    code, results = serve(frame({"fileType": "docx", "length": 100}, b"x" * 10))
+    assert code == 1
+    assert "Truncated" in results[0]["error"]
+
+
+def baseline_extract_bio(text):
+    """extract_bio as shipped before the single-pass parser, kept to pin its behaviour"""
+    bio_headers = ['summary', 'profile', 'objective', 'about', 'bio']
+    lines = text.split('\n')
+    bio_text = ""
+    capturing = False
+    for line in lines:
+        line_lower = line.lower().strip()
+        if any(header in line_lower for header in bio_headers):
+            capturing = True
+            continue
+        if capturing and line.isupper() and len(line) > 5:
+            break
+        if capturing and line.strip():
+            bio_text += line.strip() + " "
+            if len(bio_text) > 300:
+                break
+    if not bio_text and len(lines) > 2:
+        bio_text = " ".join(lines[2:5])
+    return bio_text.strip()[:500]
+
+
+SUMMARY_PARAGRAPH = ("Engineering leader with twelve years building payment platforms.\n"
+                     "Grew teams from four to forty engineers across three countries.\n")
+
+RESUMES = {
+    "executive_summary": "Jane Doe\njane@x.com +1 555 123 4567\nEXECUTIVE SUMMARY\n" + SUMMARY_PARAGRAPH
+                         + "EXPERIENCE\nAcme Corp 2015-2024\n",
+    "profile_summary": "Jane Doe\njane@x.com\nProfile Summary\n" + SUMMARY_PARAGRAPH + "EDUCATION\nBSc Physics\n",
+    "summary_of_qualifications": "Jane Doe\nSummary of Qualifications\n" + SUMMARY_PARAGRAPH
+                                 + "WORK HISTORY\nAcme Corp\n",
+    "professional_summary": "JANE DOE\n+1 555 123 4567\nPROFESSIONAL SUMMARY\n" + SUMMARY_PARAGRAPH
+                            + "TECHNICAL SKILLS\nPython, Go\n",
+    "career_objective": "Jane Doe\nCareer Objective:\n" + SUMMARY_PARAGRAPH + "PROJECTS\nLedger\n",
+}
+
+
+@pytest.mark.parametrize("name", sorted(RESUMES))
+def test_bio_matches_baseline_for_summary_headers(name):
+    text = RESUMES[name]
+    expected = " ".join(SUMMARY_PARAGRAPH.split("\n")).strip()
+    assert baseline_extract_bio(text) == expected
+    assert extract_resume.extract_bio(text) == expected
+
+
+@pytest.mark.parametrize("header, section", [
+    ("EXECUTIVE SUMMARY", "summary"),
+    ("Profile Summary", "summary"),
+    ("Summary of Qualifications", "summary"),
+    ("About Me:", "summary"),
+    ("Relevant Work Experience", "experience"),
+    ("Educational Qualifications", "education"),
+    ("Areas of Expertise", "skills"),
+    ("Selected Projects", "projects"),
+])
+def test_section_headers_match_by_keyword(header, section):
+    assert extract_resume._section_for_header(header) == section
+
+
+@pytest.mark.parametrize("line", [
+    "Led the experience redesign for 3 products.",
+    "Passionate about distributed systems and developer tooling",
+    "jane.profile@example.com",
+])
+def test_content_lines_are_not_headers(line):
+    assert extract_resume._section_for_header(line) is None
+
+
+def test_fallback_bio_skips_contact_lines_and_headers():
+    text = ("Jane Doe\njane@x.com | +1 555 123 4567\nBackend engineer focused on APIs.\n"
+            "KEY ACHIEVEMENTS\nCut latency by half\n")
+    assert extract_resume.extract_bio(text) == "Backend engineer focused on APIs."
+
+
+def baseline_parse_skills(text):
+    """parse_skills as shipped before the single-pass parser (substring match)"""
+    text_lower = text.lower()
+    return [skill for skill in extract_resume.SKILL_KEYWORDS if skill.lower() in text_lower]
+
+
+def baseline_phone(text):
+    phones = re.findall(r'[\+]?[(]?[0-9]{3}[)]?[-\s\.]?[0-9]{3}[-\s\.]?[0-9]{4,6}', text)
+    return phones[0] if phones else None
+
+
+@pytest.mark.parametrize("text", [
+    "REST APIs, ReactJS, NodeJS, Python",
+    "Skills: Vue.js, Express.js, Node.js, C++, C#, Docker, Kubernetes",
+    "Built microservices in TypeScript and GraphQL on AWS with CI/CD pipelines",
+])
+def test_skills_match_baseline(text):
+    assert extract_resume.parse_skills(text) == baseline_parse_skills(text)
+
+
+@pytest.mark.parametrize("text", [
+    "Jane Doe\nCall (555)\n123-4567 any time\n",
+    "Jane Doe\njane@x.com\n+1 555.123.4567\n",
+    "Jane Doe\nno number here\n",
+])
+def test_phone_matches_baseline(text):
+    assert extract_resume.parse_contact_info(text)["phone"] == baseline_phone(text)
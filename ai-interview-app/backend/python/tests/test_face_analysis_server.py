@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("mediapipe")
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import face_analysis_server_fixed as server
+from analysis_engine import AnalysisEngine
+
+
+def test_mailbox_keeps_only_the_newest_frame():
+    async def scenario():
+        mailbox = server.FrameMailbox()
+        for frame_id in range(1, 4):
+            mailbox.put(frame_id)
+        newest = await mailbox.get()
+
+        # A waiting reader wakes for the next frame, then sees the close
+        reader = asyncio.create_task(mailbox.get())
+        await asyncio.sleep(0)
+        mailbox.put(4)
+        mailbox.close()
+        return newest, await reader, await mailbox.get(), mailbox.dropped
+
+    assert asyncio.run(scenario()) == (3, 4, None, 2)
+
+
+def test_mailbox_close_drains_the_pending_frame():
+    async def scenario():
+        mailbox = server.FrameMailbox()
+        mailbox.put(1)
+        mailbox.close()
+        return await mailbox.get(), await mailbox.get()
+
+    assert asyncio.run(scenario()) == (1, None)
+
+
+@pytest.mark.parametrize("pool", [None, AnalysisEngine(1, 1, 1.0)], ids=["no-pool", "warming"])
+def test_video_stream_waits_for_ready_analyzers(monkeypatch, pool):
+    monkeypatch.setattr(server, "pool", pool)
+    client = TestClient(server.app)
+    with client.websocket_connect("/ws/video") as websocket:
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1013
+    assert not server.active_connections
@@ -0,0 +1,163 @@
+import base64
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import face_verification
+import reference_cache
+
+cv2 = pytest.importorskip("cv2")
+
+
+def photo(seed):
+    rng = np.random.default_rng(seed)
+    img = rng.integers(0, 255, size=(120, 160, 3), dtype=np.uint8)
+    return "data:image/jpeg;base64," + base64.b64encode(cv2.imencode('.jpg', img)[1]).decode()
+
+
+def slow_method(*args):
+    """Stands in for a long multi-stage method (e.g. two face encodings)"""
+    for _ in range(200):
+        face_verification.checkpoint()
+        time.sleep(0.01)
+    return 90.0, None, None
+
+
+def test_deadline_leaves_no_method_threads_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_cache, "_default_cache", reference_cache.ReferenceCache(cache_dir=str(tmp_path)))
+    monkeypatch.setattr(face_verification, "try_face_recognition", slow_method)
+    monkeypatch.setattr(face_verification, "try_structural_similarity", slow_method)
+
+    started = time.perf_counter()
+    result = face_verification.verify(photo(1), photo(2), deadline_ms=100)
+    elapsed = time.perf_counter() - started
+
+    assert result["deadline_hit"] and result["method"] == "histogram"
+    assert "timeout" in {report["status"] for report in result["methods"].values()}
+    # Stopped at the next stage boundary, not after the remaining two seconds of work
+    assert elapsed < 1.0
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("verify-")]
+
+
+def test_cascade_is_loaded_once_per_process(monkeypatch):
+    loads = []
+    real = cv2.CascadeClassifier
+    monkeypatch.setattr(cv2, "CascadeClassifier", lambda path: loads.append(path) or real(path))
+    monkeypatch.setattr(face_verification, "_face_cascade", None)
+
+    face_verification.warm_up()
+    cascade = face_verification.get_face_cascade()
+    face_verification.extract_face_crop(face_verification.FaceImage(base64.b64decode(photo(3).split(",")[1])))
+    assert len(loads) == 1 and face_verification.get_face_cascade() is cascade
+
+
+def test_second_verification_reuses_cached_reference_face(tmp_path, monkeypatch):
+    matplotlib = pytest.importorskip("matplotlib")
+    with open(os.path.join(matplotlib.get_data_path(), "sample_data", "grace_hopper.jpg"), "rb") as f:
+        face = "data:image/jpeg;base64," + base64.b64encode(f.read()).decode()
+    monkeypatch.setattr(reference_cache, "_default_cache", reference_cache.ReferenceCache(cache_dir=str(tmp_path)))
+    crops = []
+    real_crop = face_verification.extract_face_crop
+    monkeypatch.setattr(face_verification, "extract_face_crop", lambda img: crops.append(img) or real_crop(img))
+
+    first = face_verification.verify(face, face)
+    assert len(crops) == 2
+    second = face_verification.verify(face, face)
+    # Only the current photo is searched for a face; the reference crop comes from the cache
+    assert len(crops) == 3
+    assert second["match_score"] == first["match_score"]
+
+
+def jpeg_bytes(img, quality=95):
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def test_large_photos_are_decoded_at_working_size():
+    ys, xs = np.mgrid[0:1920, 0:2560]
+    img = np.dstack([(xs // 10) % 256, (ys // 10) % 256, ((xs + ys) // 20) % 256]).astype(np.uint8)
+
+    decoded = face_verification.FaceImage(jpeg_bytes(img), max_side=640)
+    assert decoded.shape == (480, 640, 3) and decoded.full_size == (2560, 1920) and decoded.scale == 4.0
+
+    # Non-JPEG input has no draft mode but is still thumbnailed
+    png = face_verification.FaceImage(cv2.imencode('.png', img)[1].tobytes(), max_side=640)
+    assert max(png.shape[:2]) == 640 and png.scale == 4.0
+
+    small = face_verification.FaceImage(jpeg_bytes(img[:300, :400]), max_side=640)
+    assert small.shape == (300, 400, 3) and small.scale == 1.0
+
+
+def test_small_face_box_is_cropped_from_the_original():
+    rng = np.random.default_rng(5)
+    img = cv2.resize(rng.integers(0, 255, size=(240, 320, 3), dtype=np.uint8), (2560, 1920),
+                     interpolation=cv2.INTER_CUBIC)
+    decoded = face_verification.FaceImage(jpeg_bytes(img), max_side=640)
+    box = (100, 80, 40, 40)  # working-resolution pixels, 4x smaller than the original
+
+    working = decoded.crop_gray(box)
+    assert working.shape == (40, 40)
+
+    detailed = decoded.crop_gray(box, min_size=128)
+    assert detailed.shape == (160, 160)
+    original = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)[320:480, 400:560].astype(int)
+    assert np.abs(detailed.astype(int) - original).mean() < 4
+
+
+def native_method(*args):
+    """A method stuck in one long native stage, with no checkpoint until it returns"""
+    time.sleep(1.5)
+    face_verification.checkpoint()
+    return 90.0, None, None
+
+
+def test_deadline_does_not_wait_for_a_native_stage(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_cache, "_default_cache", reference_cache.ReferenceCache(cache_dir=str(tmp_path)))
+    monkeypatch.setattr(face_verification, "try_face_recognition", native_method)
+    monkeypatch.setattr(face_verification, "try_structural_similarity", native_method)
+
+    started = time.perf_counter()
+    result = face_verification.verify(photo(1), photo(2), deadline_ms=100)
+    assert time.perf_counter() - started < 0.5
+    assert result["deadline_hit"] and result["method"] == "histogram"
+
+
+def decoding_method(*args):
+    """Swallows decode failures like the real methods do, so only a cancellation can stop it"""
+    while True:
+        face_verification.decode_base64_image(photo(4))
+        time.sleep(0.005)
+
+
+def test_cancellation_inside_decode_is_not_swallowed(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_cache, "_default_cache", reference_cache.ReferenceCache(cache_dir=str(tmp_path)))
+    monkeypatch.setattr(face_verification, "try_face_recognition", decoding_method)
+    monkeypatch.setattr(face_verification, "try_structural_similarity", decoding_method)
+
+    result = face_verification.verify(photo(1), photo(2), deadline_ms=100)
+    assert result["deadline_hit"]
+    # Without the cancellation the loop would never end; with it each thread exits at its next decode
+    for thread in [t for t in threading.enumerate() if t.name.startswith("verify-")]:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+def test_cancellation_inside_encode_is_not_swallowed(monkeypatch):
+    cancelled = threading.Event()
+    cancelled.set()
+    current = face_verification.FaceImage(jpeg_bytes(np.full((240, 320, 3), 128, np.uint8)))
+    outcome = []
+
+    def run():
+        face_verification._method_state.cancelled = cancelled
+        try:
+            outcome.append(face_verification.try_structural_similarity(None, current, np.zeros((128, 128), np.uint8)))
+        except face_verification.VerificationCancelled:
+            outcome.append("cancelled")
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join(1)
+    assert outcome == ["cancelled"]
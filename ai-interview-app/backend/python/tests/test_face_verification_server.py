@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("fastapi")
+import face_verification_server as server
+
+
+def thread_pool(workers, queue_size):
+    pool = server.WorkerPool(workers, queue_size)
+    pool.executor = ThreadPoolExecutor(max_workers=workers)
+    pool.ready = True
+    return pool
+
+
+def test_batch_tasks_share_slots_with_single_requests():
+    order = []
+    running = []
+    peak = []
+
+    def task(name):
+        running.append(name)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.remove(name)
+        order.append(name)
+        return name
+
+    async def scenario():
+        pool = thread_pool(workers=1, queue_size=1)
+        loop = asyncio.get_running_loop()
+        mapper = server.PoolMapper(pool, loop, loop.time() + 5)
+        batch = loop.run_in_executor(None, lambda: list(mapper.map(task, [f"b{i}" for i in range(6)])))
+        await asyncio.sleep(0.07)
+        assert pool.in_flight == 1
+        single = await pool.run(task, "single", timeout=5)
+        return single, await batch
+
+    single, batch = asyncio.run(scenario())
+    assert single == "single"
+    assert batch == [f"b{i}" for i in range(6)]
+    assert max(peak) == 1
+    # The single request got the next free slot instead of queueing behind the whole batch
+    assert order.index("single") < order.index("b5")
+
+
+def test_cancelled_batch_stops_queueing_tasks():
+    started = []
+    gate = threading.Event()
+
+    def task(name):
+        started.append(name)
+        gate.wait(1)
+        return name
+
+    async def scenario():
+        pool = thread_pool(workers=1, queue_size=4)
+        loop = asyncio.get_running_loop()
+        mapper = server.PoolMapper(pool, loop, loop.time() + 5)
+
+        def coordinator():
+            try:
+                list(mapper.map(task, [f"b{i}" for i in range(6)]))
+            except BaseException as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=coordinator)
+        thread.start()
+        await asyncio.sleep(0.05)
+        mapper.cancel()
+        gate.set()
+        await asyncio.sleep(0.05)
+        thread.join(1)
+        return pool
+
+    errors = []
+    pool = asyncio.run(scenario())
+    assert started == ["b0"]
+    assert len(errors) == 1
+    assert pool.in_flight == 0
+
+
+def test_batch_over_limit_is_rejected(monkeypatch):
+    monkeypatch.setattr(server, "pool", thread_pool(workers=1, queue_size=1))
+    monkeypatch.setattr(server, "MAX_BATCH_PAIRS", 3)
+    request = server.BatchVerifyRequest(reference_photo="ref", frames=["a", "b", "c", "d"])
+    response = asyncio.run(server.verify_batch(request))
+    assert response.status_code == 413
+
+
+def test_ready_only_after_workers_warm(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    client = TestClient(server.app)
+    monkeypatch.setattr(server, "pool", None)
+    assert client.get("/ready").status_code == 503
+    assert client.post("/verify", json={}).status_code == 503
+
+    pool = server.WorkerPool(workers=1, queue_size=1)
+    monkeypatch.setattr(server, "pool", pool)
+    assert client.get("/ready").status_code == 503
+    pool.ready = True
+    assert client.get("/ready").json()["ready"] is True
@@ -0,0 +1,81 @@
+import os
+import json
+import subprocess
+import sys
+
+import numpy as np
+
+import identity_index
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'identity_index.py')
+
+
+def clustered(n, clusters=40, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, identity_index.DIM)).astype(np.float32) * 0.3
+    return centers[rng.integers(0, clusters, n)] + rng.normal(size=(n, identity_index.DIM)).astype(np.float32) * 0.02
+
+
+def test_ivf_search_reads_only_probed_partitions(tmp_path, monkeypatch):
+    monkeypatch.setattr(identity_index, "IVF_MIN_SIZE", 100)
+    monkeypatch.setattr(identity_index, "IVF_NPROBE", 2)
+    data = clustered(2000)
+    index = identity_index.IdentityIndex(str(tmp_path))
+    for i, vector in enumerate(data):
+        index.add(f"c{i}", vector)
+    flat = [index.search(data[i] + 0.001, top_k=1) for i in range(0, 2000, 97)]
+
+    assert index.rebuild() > 0
+    index.flush()
+    index = identity_index.IdentityIndex(str(tmp_path))
+    probes = np.argsort(((index.centroids - data[0]) ** 2).sum(axis=1))[:identity_index.IVF_NPROBE]
+    assert len(index._probed_rows(probes)) < index.count / 4
+    assert [index.search(data[i] + 0.001, top_k=1) for i in range(0, 2000, 97)] == flat
+
+    # Rows added after the rebuild are found through their partition id
+    index.add("late", data[5] + 0.0001)
+    assert "late" in [match["id"] for match in index.search(data[5], top_k=2)]
+
+
+def test_replace_and_remove_compact_into_new_generation(tmp_path):
+    data = clustered(40)
+    index = identity_index.IdentityIndex(str(tmp_path))
+    for i, vector in enumerate(data):
+        index.add(f"c{i}", vector)
+    index.add("c0", data[1])
+    assert index.live_count == 40 and index.search(data[1], top_k=2)[0]["id"] in ("c0", "c1")
+
+    for i in range(20, 40):
+        index.remove(f"c{i}")
+    index.flush()
+    assert index.generation >= 1 and index.count < 41
+    assert not os.path.exists(tmp_path / "vectors.f32")
+
+    reopened = identity_index.IdentityIndex(str(tmp_path))
+    assert sorted(reopened.row_of) == sorted(f"c{i}" for i in range(20))
+    assert reopened.search(data[7])[0]["id"] == "c7"
+
+
+def test_refresh_sees_other_writers(tmp_path):
+    data = clustered(2)
+    server = identity_index.IdentityIndex(str(tmp_path))
+    writer = identity_index.IdentityIndex(str(tmp_path))
+    writer.add("a", data[0])
+    writer.flush()
+    server.refresh()
+    assert server.search(data[0])[0]["id"] == "a"
+
+
+def test_concurrent_one_shot_adds_are_not_lost(tmp_path):
+    data = clustered(24)
+    writers = []
+    for i, vector in enumerate(data):
+        proc = subprocess.Popen([sys.executable, SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        proc.stdin.write(json.dumps({"action": "add", "id": f"c{i}", "encoding": vector.tolist(), "index": str(tmp_path)}))
+        proc.stdin.close()
+        writers.append(proc)
+    for proc in writers:
+        assert json.loads(proc.stdout.read())["success"]
+        proc.wait()
+
+    assert identity_index.IdentityIndex(str(tmp_path)).live_count == 24
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+pytest.importorskip("fastapi")
+cv2 = pytest.importorskip("cv2")
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import identity_stream
+
+AUTH = {"Authorization": "Bearer backend-secret"}
+
+
+def jpeg(value):
+    return cv2.imencode('.jpg', np.full((48, 64, 3), value, dtype=np.uint8))[1].tobytes()
+
+
+def test_sustained_no_face_alerts_and_recovers(monkeypatch):
+    monkeypatch.setattr(identity_stream, "NO_FACE_SECONDS", 5.0)
+    stream = identity_stream.IdentityStream()
+    for t in range(3):
+        assert stream.record(90.0, np.zeros((24, 32)), float(t)) is None
+
+    # Camera covered: nothing until the no-face run is long enough, and the covered
+    # frame never becomes the duplicate-skip baseline
+    events = [stream.record(None, np.full((24, 32), 200.0), 3.0 + t) for t in range(7)]
+    assert [e["reason"] for e in events if e] == ["no_face"]
+    assert stream.alert_reason == "no_face"
+    assert not stream.should_skip(np.full((24, 32), 200.0), 100.0)
+
+    assert stream.record(90.0, np.zeros((24, 32)), 11.0) is None
+    events = [stream.record(90.0, np.zeros((24, 32)), 12.0 + t) for t in range(2)]
+    assert events[-1]["type"] == "recovered" and not stream.alerting
+
+
+def test_websocket_uses_the_registered_reference(tmp_path, monkeypatch):
+    monkeypatch.setattr(identity_stream, "API_TOKEN", "backend-secret")
+    monkeypatch.setattr(identity_stream, "REFERENCE_DIR", str(tmp_path))
+    monkeypatch.setattr(identity_stream, "MIN_INTERVAL_S", 0.0)
+    monkeypatch.setattr(identity_stream, "executor", ThreadPoolExecutor(max_workers=1))
+    reference = {"hash": "ref", "encoding": [0.5] * 128, "face": None}
+    monkeypatch.setattr(identity_stream, "reference_entry", lambda photo, embedding: (reference, "face_recognition"))
+    seen = []
+
+    def score_frame(frame, ref_encoding, ref_face):
+        seen.append(ref_encoding)
+        return 90.0, None
+
+    monkeypatch.setattr(identity_stream, "score_frame", score_frame)
+    client = TestClient(identity_stream.app)
+
+    assert client.put("/references/i1", json={"reference_photo": "x"}).status_code == 401
+    stream_token = client.put("/references/i1", json={"reference_photo": "x"}, headers=AUTH).json()["stream_token"]
+
+    for url in ("/ws/identity/i1", "/ws/identity/i1?token=wrong", f"/ws/identity/i2?token={stream_token}"):
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect(url):
+                pass
+        assert rejected.value.code == 1008
+
+    with client.websocket_connect(f"/ws/identity/i1?token={stream_token}") as first:
+        assert first.receive_json()["type"] == "ready"
+        # A reference sent by the client is ignored; only frames are read
+        first.send_json({"reference_photo": "data:image/jpeg;base64,AAAA"})
+        first.send_bytes(jpeg(10))
+        assert first.receive_json()["score"] == 90.0
+        assert seen and np.allclose(seen[0], 0.5)
+
+        with client.websocket_connect(f"/ws/identity/i1?token={stream_token}") as second:
+            assert second.receive_json()["replaced"] is True
+            with pytest.raises(WebSocketDisconnect) as replaced:
+                first.receive_json()
+            assert replaced.value.code == 4001
+            second.send_bytes(jpeg(200))
+            assert second.receive_json()["type"] == "score"
+
+    summary = client.get("/streams/i1", headers=AUTH).json()
+    assert summary["frames"] == 2 and summary["verified"] == 2
+    assert client.get("/streams/i1").status_code == 401
@@ -0,0 +1,121 @@
+import hashlib
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+import model_store
+
+PAYLOAD = bytes(range(256)) * 64
+
+
+def write_manifest(model_dir, payload=PAYLOAD, name="model.bin"):
+    manifest = {name: {"url": "http://unused.invalid/" + name, "size": len(payload),
+                       "sha256": hashlib.sha256(payload).hexdigest()}}
+    with open(os.path.join(model_dir, model_store.MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def test_fetch_rejects_a_file_that_does_not_match_the_manifest(tmp_path):
+    model_dir, mirror = tmp_path / "models", tmp_path / "mirror"
+    model_dir.mkdir()
+    mirror.mkdir()
+    write_manifest(model_dir)
+    (mirror / "model.bin").write_bytes(PAYLOAD[:-1] + b"\x00")
+
+    with pytest.raises(model_store.ModelIntegrityError):
+        model_store.fetch("model.bin", mirror=str(mirror), model_dir=str(model_dir))
+    assert not os.path.exists(model_dir / "model.bin")
+    assert not os.path.exists(model_dir / "model.bin.part")
+
+
+def test_verify_stamps_and_rehashes_only_changed_files(tmp_path, monkeypatch):
+    write_manifest(tmp_path)
+    path = tmp_path / "model.bin"
+    path.write_bytes(PAYLOAD)
+    assert model_store.verify("model.bin", str(tmp_path))
+
+    monkeypatch.setattr(model_store, "sha256_file", lambda path: pytest.fail("stamped file was re-hashed"))
+    assert model_store.verify("model.bin", str(tmp_path))
+    monkeypatch.undo()
+
+    # Same size, new contents and mtime: the stale stamp forces a hash, which fails
+    path.write_bytes(PAYLOAD[::-1])
+    os.utime(path, ns=(0, 0))
+    assert not model_store.verify("model.bin", str(tmp_path))
+    with pytest.raises(model_store.ModelIntegrityError):
+        model_store.model_path("model.bin", str(tmp_path))
+
+
+def test_concurrent_stamps_are_all_kept(tmp_path):
+    names = [f"model{n}.bin" for n in range(8)]
+    threads = [
+        threading.Thread(target=lambda name=name: [
+            model_store._write_stamp(str(tmp_path), name, {"sha256": str(k), "size": k, "mtime_ns": k})
+            for k in range(20)
+        ])
+        for name in names
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(model_store._read_stamps(str(tmp_path))) == set(names)
+
+
+def test_directory_mirror_resumes_the_partial_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_store, "CHUNK_SIZE", 1024)
+    model_dir, mirror = tmp_path / "models", tmp_path / "mirror"
+    model_dir.mkdir()
+    mirror.mkdir()
+    write_manifest(model_dir)
+    (mirror / "model.bin").write_bytes(PAYLOAD)
+    (model_dir / "model.bin.part").write_bytes(PAYLOAD[:5000])
+
+    progress = []
+    path = model_store.fetch("model.bin", mirror=str(mirror), model_dir=str(model_dir), progress=progress.append)
+    assert open(path, "rb").read() == PAYLOAD
+    assert progress[0] == 5000 + 1024 and progress[-1] == len(PAYLOAD)
+    assert model_store.verify("model.bin", str(model_dir))
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    honor_range = True
+    ranges = []
+
+    def do_GET(self):
+        header = self.headers.get("Range")
+        type(self).ranges.append(header)
+        start = int(header[len("bytes="):].rstrip("-")) if header and self.honor_range else 0
+        body = PAYLOAD[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.mark.parametrize("honor_range", [True, False], ids=["range", "range-ignored"])
+def test_http_download_resumes_with_a_range_request(tmp_path, honor_range):
+    handler = type("Handler", (RangeHandler,), {"honor_range": honor_range, "ranges": []})
+    server = http.server.HTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        write_manifest(tmp_path)
+        (tmp_path / "model.bin.part").write_bytes(PAYLOAD[:5000])
+        mirror = f"http://127.0.0.1:{server.server_port}/assets"
+        path = model_store.fetch("model.bin", mirror=mirror, model_dir=str(tmp_path))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert handler.ranges == ["bytes=5000-"]
+    # Either way the result is whole: appended to the part file, or rewritten from byte 0
+    assert open(path, "rb").read() == PAYLOAD
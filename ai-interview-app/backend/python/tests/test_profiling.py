@@ -0,0 +1,108 @@
+import asyncio
+import contextvars
+import os
+import json
+import subprocess
+import sys
+import threading
+import time
+
+import profiling
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_nested_spans_count_only_toward_the_inner_stage():
+    profiler = profiling.Profiler("test", report=True, sample_rate=1, trace_file=None)
+    with profiler.span("read"):
+        with profiler.span("decode"):
+            time.sleep(0.05)
+    with profiler.span("extract"):
+        time.sleep(0.01)
+        with profiler.span("import"):
+            time.sleep(0.05)
+
+    timings = profiler.timings()
+    assert timings["decode_ms"] >= 50 and timings["read_ms"] < 20
+    assert timings["import_ms"] >= 50 and 10 <= timings["extract_ms"] < 30
+    stages = sum(value for key, value in timings.items() if key != "total_ms")
+    assert stages <= timings["total_ms"]
+
+
+def test_laps_are_nested_stages_of_the_enclosing_span():
+    profiler = profiling.Profiler("test", report=True, sample_rate=1, trace_file=None)
+    with profiler.span("parse"):
+        laps = profiling.Laps(profiler)
+        for _ in range(3):
+            time.sleep(0.01)
+            laps.lap("contact")
+            time.sleep(0.02)
+            laps.lap("skills")
+        laps.close()
+
+    timings = profiler.timings()
+    assert timings["contact_ms"] >= 30 and timings["skills_ms"] >= 60
+    assert timings["parse_ms"] < 10
+
+
+def test_extract_resume_stages_fit_in_total(tmp_path):
+    from test_extract_resume import docx_bytes
+
+    path = tmp_path / "resume.docx"
+    path.write_bytes(docx_bytes())
+    env = dict(os.environ, PROFILE_TIMINGS="1")
+    out = subprocess.run([sys.executable, os.path.join(HERE, "extract_resume.py"), "--file", str(path)],
+                         capture_output=True, text=True, env=env, cwd=HERE)
+    timings = json.loads(out.stdout)["timings"]
+    assert {"read_ms", "extract_ms", "import_ms", "contact_ms", "skills_ms", "sections_ms"} <= set(timings)
+    stages = sum(value for key, value in timings.items() if key != "total_ms")
+    assert stages <= timings["total_ms"]
+
+
+def test_concurrent_trace_writers_share_one_header(tmp_path):
+    trace = tmp_path / "trace.json"
+    env = dict(os.environ, PROFILE_TRACE_FILE=str(trace), PYTHONPATH=HERE)
+    code = "import profiling\nfor _ in range(20):\n    profiling.begin('t').write_trace()"
+    writers = [subprocess.Popen([sys.executable, "-c", code], env=env) for _ in range(8)]
+    for proc in writers:
+        assert proc.wait() == 0
+
+    lines = trace.read_text().splitlines()
+    assert lines[0] == "["
+    events = [json.loads(line.rstrip(",")) for line in lines[1:]]
+    assert len(events) == 8 * 20 and all(event["name"] == "t" for event in events)
+
+
+def test_concurrent_requests_keep_their_own_profiler():
+    def method():
+        with profiling.span("method"):
+            time.sleep(0.01)
+
+    async def request(name, delay):
+        profiler = profiling.begin(name, report=True, sample_rate=1, trace_file=None)
+        with profiling.span("wait"):
+            await asyncio.sleep(delay)
+        # A thread started with the request's context reports to the same profiler
+        thread = threading.Thread(target=contextvars.copy_context().run, args=(method,))
+        thread.start()
+        thread.join()
+        return profiling.current() is profiler, profiler.timings()
+
+    async def main():
+        return await asyncio.gather(request("a", 0.05), request("b", 0.01))
+
+    (a_is_current, a), (b_is_current, b) = asyncio.run(main())
+    assert a_is_current and b_is_current
+    assert a["wait_ms"] >= 50 and 10 <= b["wait_ms"] < 50
+    assert a["method_ms"] >= 10 and b["method_ms"] >= 10
+
+
+def test_worker_timings_are_charged_out_of_the_wait():
+    profiler = profiling.Profiler("test", report=True, sample_rate=1, trace_file=None)
+    with profiler.span("worker"):
+        time.sleep(0.05)
+        profiler.merge({"decode_ms": 10.0, "analyze_ms": 30.0, "total_ms": 45.0})
+
+    timings = profiler.timings()
+    assert timings["decode_ms"] == 10.0 and timings["analyze_ms"] == 30.0
+    assert 10 <= timings["worker_ms"] < 30
@@ -0,0 +1,91 @@
+import os
+import threading
+
+import numpy as np
+
+import reference_cache
+
+
+def entry(seed):
+    rng = np.random.default_rng(seed)
+    return {"encoding": rng.normal(size=128),
+            "face": rng.integers(0, 255, size=(128, 128), dtype=np.uint8)}
+
+
+def test_miss_then_hit_from_memory_and_disk(tmp_path):
+    cache = reference_cache.ReferenceCache(cache_dir=str(tmp_path))
+    assert cache.get("ab12") is None
+
+    stored = entry(1)
+    cache.put("ab12", stored)
+    assert cache.get("ab12")["encoding"] is not None
+
+    # A new process only has the .npz file
+    reopened = reference_cache.ReferenceCache(cache_dir=str(tmp_path))
+    hit = reopened.get("ab12")
+    assert np.array_equal(hit["encoding"], stored["encoding"]) and np.array_equal(hit["face"], stored["face"])
+
+
+def test_put_merges_method_data():
+    cache = reference_cache.ReferenceCache(cache_dir=None)
+    first = entry(1)
+    cache.put("ab12", {"encoding": first["encoding"], "face": None})
+    merged = cache.put("ab12", {"encoding": None, "face": first["face"]})
+    assert merged["encoding"] is first["encoding"] and merged["face"] is first["face"]
+
+
+def test_memory_is_lru_bounded():
+    cache = reference_cache.ReferenceCache(cache_dir=None, memory_entries=2)
+    for photo_id in ("a", "b"):
+        cache.put(photo_id, entry(1))
+    cache.get("a")
+    cache.put("c", entry(2))
+    assert list(cache._memory) == ["a", "c"]
+
+
+def test_prune_removes_least_recently_used_files(tmp_path):
+    cache = reference_cache.ReferenceCache(cache_dir=str(tmp_path), memory_entries=0, disk_entries=2)
+    for n, photo_id in enumerate(("aa01", "bb02", "cc03")):
+        cache.put(photo_id, entry(n))
+        os.utime(cache._path(photo_id), (1000 + n, 1000 + n))
+    # Reading an entry refreshes its mtime, so it outlives newer but unused ones
+    cache.get("aa01")
+    cache.prune()
+    assert not os.path.exists(cache._path("bb02"))
+    assert os.path.exists(cache._path("aa01")) and os.path.exists(cache._path("cc03"))
+
+
+def test_json_round_trip():
+    stored = entry(3)
+    data = reference_cache.entry_to_json("ab12", stored)
+    parsed = reference_cache.entry_from_json(data)
+    assert np.allclose(parsed["encoding"], stored["encoding"], atol=1e-6)
+    assert np.array_equal(parsed["face"], stored["face"])
+    assert reference_cache.entry_from_json({"hash": "ab12", "face": "bm90IGEgZmFjZQ=="}) is None
+    assert reference_cache.photo_hash("data:image/jpeg;base64,QUJD") == reference_cache.photo_hash("QUJD")
+
+
+def test_concurrent_batches_share_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(reference_cache, "PRUNE_INTERVAL", 8)
+    cache = reference_cache.ReferenceCache(cache_dir=str(tmp_path), memory_entries=4, disk_entries=1000)
+    errors = []
+
+    def batch(worker):
+        try:
+            for n in range(60):
+                photo_id = f"{n % 20:02d}ff"
+                if cache.get(photo_id) is None:
+                    cache.put(photo_id, entry(n))
+                cache.put(photo_id, {"encoding": None, "face": entry(worker)["face"]})
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=batch, args=(w,)) for w in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    reopened = reference_cache.ReferenceCache(cache_dir=str(tmp_path))
+    assert all(reopened.get(f"{n:02d}ff")["encoding"] is not None for n in range(20))
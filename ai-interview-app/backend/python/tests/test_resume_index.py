@@ -0,0 +1,124 @@
+import io
+import os
+import json
+import subprocess
+import sys
+
+import resume_index
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resume_index.py')
+
+RESUMES = {
+    "py": "Backend engineer, Python and Django, PostgreSQL",
+    "js": "Frontend engineer, React, TypeScript and Node.js",
+    "ml": "Machine learning engineer, Python, PyTorch and NumPy",
+    "ops": "Site reliability engineer, Kubernetes, Terraform, Python",
+}
+
+
+def run(monkeypatch, capsys, request):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(json.dumps(request)))
+    resume_index.main()
+    return json.loads(capsys.readouterr().out)
+
+
+def add_request(path, docs):
+    return {"action": "add", "index": path, "documents": [{"id": i, "text": t} for i, t in docs.items()]}
+
+
+def test_one_shot_add_appends_without_rewriting_base(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "index.npz")
+    run(monkeypatch, capsys, add_request(path, {"py": RESUMES["py"]}))
+    run(monkeypatch, capsys, {"action": "merge", "index": path})
+    base = os.stat(path)
+
+    response = run(monkeypatch, capsys, add_request(path, {"js": RESUMES["js"]}))
+    assert response["count"] == 2
+    after = os.stat(path)
+    assert (after.st_ino, after.st_mtime_ns) == (base.st_ino, base.st_mtime_ns)
+    with open(path + '.log') as f:
+        assert [json.loads(line)["id"] for line in f] == ["js"]
+
+    results = run(monkeypatch, capsys, {"action": "search", "index": path, "query": "react typescript"})["results"]
+    assert results[0]["id"] == "js"
+
+
+def test_log_replay_matches_merged_index(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "index.npz")
+    run(monkeypatch, capsys, add_request(path, RESUMES))
+    run(monkeypatch, capsys, {"action": "remove", "index": path, "ids": ["ml"]})
+    run(monkeypatch, capsys, add_request(path, {"py": "Python Flask developer"}))
+
+    query = {"action": "search", "index": path, "query": "python engineer django flask"}
+    before = run(monkeypatch, capsys, query)
+    run(monkeypatch, capsys, {"action": "merge", "index": path})
+    assert os.path.getsize(path + '.log') == 0
+    assert run(monkeypatch, capsys, query) == before
+    assert "ml" not in {r["id"] for r in before["results"]}
+
+
+def test_log_merges_past_threshold(tmp_path, monkeypatch):
+    monkeypatch.setattr(resume_index, "MERGE_MIN_RECORDS", 3)
+    path = str(tmp_path / "index.npz")
+    for doc_id, text in RESUMES.items():
+        store = resume_index.IndexStore(path)
+        with store.writing():
+            ids = store.live_ids()
+            ids.add(doc_id, text)
+            store.commit(ids)
+    assert os.path.exists(path)
+    assert os.path.getsize(path + '.log') == 0
+    assert resume_index.IndexStore(path).load().live_count == len(RESUMES)
+
+
+def test_torn_log_tail_is_ignored(tmp_path):
+    path = str(tmp_path / "index.npz")
+    store = resume_index.IndexStore(path)
+    with store.writing():
+        ids = store.live_ids()
+        ids.add("py", RESUMES["py"])
+        store.commit(ids)
+    with open(path + '.log', 'a') as f:
+        f.write('{"op":"add","id":"half')
+    assert resume_index.IndexStore(path).load().doc_ids == ["py"]
+
+    # The next writer drops the torn record instead of appending onto it
+    with store.writing():
+        ids = store.live_ids()
+        ids.add("ml", RESUMES["ml"])
+        store.commit(ids)
+    assert resume_index.IndexStore(path).load().doc_ids == ["py", "ml"]
+
+
+def test_server_refresh_sees_other_writers(tmp_path):
+    path = str(tmp_path / "index.npz")
+    server = resume_index.IndexStore(path)
+    assert server.load().live_count == 0
+
+    writer = resume_index.IndexStore(path)
+    with writer.writing():
+        ids = writer.live_ids()
+        ids.add("ml", RESUMES["ml"])
+        writer.commit(ids)
+    assert server.refresh().search("pytorch")[0][0] == "ml"
+
+    writer.merge()
+    index = server.refresh()
+    assert index.live_count == 1 and index.search("pytorch")[0][0] == "ml"
+
+
+def test_concurrent_one_shot_writers_keep_every_add(tmp_path):
+    path = str(tmp_path / "index.npz")
+    writers = [
+        subprocess.Popen([sys.executable, SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(6)
+    ]
+    for n, proc in enumerate(writers):
+        docs = {f"w{n}-{k}": f"{RESUMES['py']} {n} {k}" for k in range(5)}
+        proc.stdin.write(json.dumps(add_request(path, docs)))
+        proc.stdin.close()
+    for proc in writers:
+        assert json.loads(proc.stdout.read())["success"]
+        proc.wait()
+
+    assert resume_index.IndexStore(path).load().live_count == 30
@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("mediapipe")
+cv2 = pytest.importorskip("cv2")
+matplotlib = pytest.importorskip("matplotlib")
+
+import vision_mediapipe
+
+FACE = os.path.join(matplotlib.get_data_path(), "sample_data", "grace_hopper.jpg")
+# (upper lid, lower lid) landmark pairs used by calculate_ear
+LID_PAIRS = ((159, 144), (160, 145), (161, 153), (386, 373), (385, 374), (384, 380))
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    try:
+        analyzer = vision_mediapipe.FaceAnalyzer(max_num_faces=1)
+    except Exception as e:
+        pytest.skip(f"Face landmarker model unavailable: {e}")
+    yield analyzer
+    analyzer.close()
+
+
+def test_blinks_are_counted_through_the_motion_gate(analyzer, monkeypatch):
+    open_frame = cv2.imread(FACE)
+    height, width = open_frame.shape[:2]
+    landmarks = analyzer._detect_tracked(open_frame, None)[0][0]
+
+    # Closed eyes: lids painted over in the image, each lid pair's landmarks meeting in the middle
+    closed_frame = open_frame.copy()
+    closed_landmarks = list(landmarks)
+    for upper, lower in LID_PAIRS:
+        a, b = landmarks[upper], landmarks[lower]
+        cv2.rectangle(closed_frame, (int(a.x * width) - 6, int(a.y * height) - 4),
+                      (int(b.x * width) + 6, int(b.y * height) + 4), (120, 140, 180), -1)
+        middle = vision_mediapipe._Point((a.x + b.x) / 2, (a.y + b.y) / 2, a.z, a.presence)
+        closed_landmarks[upper] = closed_landmarks[lower] = middle
+
+    def detect(frame, session):
+        # The real landmarker does not treat a painted lid as a closed eye, so the pixels decide
+        eyes_covered = np.abs(frame.astype(int) - closed_frame).mean() < np.abs(frame.astype(int) - open_frame).mean()
+        return [closed_landmarks if eyes_covered else landmarks], None, "full"
+
+    monkeypatch.setattr(analyzer, "_detect_tracked", detect)
+    open_jpeg = cv2.imencode('.jpg', open_frame)[1].tobytes()
+    closed_jpeg = cv2.imencode('.jpg', closed_frame)[1].tobytes()
+
+    session = vision_mediapipe.AnalysisSession()
+    results = []
+    for jpeg in [open_jpeg] * 4 + [closed_jpeg] + [open_jpeg] * 4 + [closed_jpeg] + [open_jpeg]:
+        read = lambda jpeg=jpeg: cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        results.append(vision_mediapipe.analyze_gated(analyzer, session, jpeg, read))
+
+    assert session.blink_count == 2
+    assert [r["eye_metrics"]["eye_status"] for r in results][4] == "closed"
+    # Static frames still skip the landmarker, without copying eye or mouth readings
+    reused = [r for r in results if r["analysis_mode"] == "reused"]
+    assert session.counts["reused"] == len(reused) > 0
+    assert all(r["eye_metrics"]["eye_aspect_ratio"] is None and r["emotion"]["mouth_open"] is None
+               for r in reused)
@@ -1,13 +1,455 @@
+#!/usr/bin/env python3
 """
-⚠️ DEPRECATED FILE - DO NOT USE
+Server-side Face Analyzer (MediaPipe Tasks FaceLandmarker)
+Fallback for browsers that cannot run MediaPipe JS: computes the same
+metrics as the useMediaPipeJS hook (face count, head pose, eye metrics,
+gaze, emotion, violations) from a BGR frame.
 
-This file is no longer part of the active system.
-All face detection now runs in the frontend via MediaPipe JS.
+An analyzer holds a loaded model and is reused across requests; it runs in
+IMAGE mode so any frame can go to any analyzer. Per-candidate state (blink
+count, looking-away counter) lives in an AnalysisSession passed with each
+frame, so pooled analyzers stay stateless.
 
-🚀 USE INSTEAD:
-  Backend: python app_mediapipe_js.py  (logging only)
-  Frontend: useMediaPipeJS hook + FaceMetricsMonitor component
+For streams the session also makes analysis cheaper:
+- Motion gate: a frame whose tracked face region has not changed in any small
+  block since the last analyzed frame reuses that frame's face count, head pose
+  and emotion (see motion_thumbnail); eye and mouth metrics are never reused
+- Face ROI: landmarks are detected in a crop around the face found last time,
+  with a full-frame re-detection every REDETECT_INTERVAL analyzed frames, when
+  the face is lost, or while more than one face is in view
 
-Migration completed in previous iteration.
-File kept for historical reference only.
+Model: models/face_landmarker.task, checksum-verified via model_store.py
+(download_model.py fetches it), or any file named by FACE_LANDMARKER_MODEL.
 """
+
+import os
+import math
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import model_store
+
+# Checksummed asset from models/manifest.json; FACE_LANDMARKER_MODEL points at any other file instead
+MODEL_NAME = 'face_landmarker.task'
+MODEL_PATH = os.environ.get('FACE_LANDMARKER_MODEL')
+
+# Thresholds shared with the useMediaPipeJS hook
+EAR_BLINK_THRESHOLD = 0.18
+EAR_CLOSED = 0.15
+EAR_SQUINT = 0.22
+MOUTH_OPEN_DISTANCE = 0.02
+YAW_LIMIT = 25
+PITCH_LIMIT = 20
+AWAY_FRAMES = 8
+SIDEWAYS_LIMIT = 40
+BLINK_RATE_LIMIT = 25
+EMOTION_THRESHOLD = 0.15
+GAZE_H_RANGE = (0.40, 0.60)
+GAZE_V_RANGE = (0.30, 0.70)
+
+# Landmark count when the model reports iris points (468-477)
+IRIS_LANDMARKS = 478
+
+# Motion gate: 64x64 grayscale crops of the tracked face are compared in 8x8 blocks;
+# a frame is reused only if no block's mean absolute difference (0-255) reaches
+# MOTION_THRESHOLD (camera noise is ~1, a blink ~20), for at most MAX_REUSED frames in a row
+MOTION_THUMB = (64, 64)
+MOTION_BLOCK = 8
+MOTION_THRESHOLD = 2.5
+MAX_REUSED = 5
+
+# Face ROI tracking: crop margin around the last face (fraction of its size),
+# smallest crop side in pixels, and analyzed frames between full-frame detections
+ROI_MARGIN = 0.5
+MIN_ROI_SIDE = 96
+REDETECT_INTERVAL = 15
+
+
+class _Point:
+    """Landmark mapped from ROI crop coordinates back to full-frame coordinates."""
+
+    __slots__ = ('x', 'y', 'z', 'presence')
+
+    def __init__(self, x, y, z, presence):
+        self.x, self.y, self.z, self.presence = x, y, z, presence
+
+
+def motion_thumbnail(frame, session):
+    """Grayscale crop of the session's tracked face for the motion gate (None without one).
+
+    Accepts a BGR array or still-encoded JPEG bytes; encoded frames are decoded at the
+    smallest JPEG scale that keeps the face crop MOTION_THUMB wide, so a frame that
+    ends up reused is never decoded at full size.
+    """
+    import cv2
+
+    if session.roi is None or session.frame_shape is None:
+        return None
+    x0, y0, x1, y1 = session.roi
+    height, width = session.frame_shape
+    if isinstance(frame, np.ndarray):
+        if frame.shape[:2] != (height, width):
+            return None
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+    else:
+        side = min(x1 - x0, y1 - y0)
+        flag = next((flag for scale, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                                              (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                                              (2, cv2.IMREAD_REDUCED_GRAYSCALE_2))
+                     if side / scale >= MOTION_THUMB[0]), cv2.IMREAD_GRAYSCALE)
+        decoded = cv2.imdecode(np.frombuffer(frame, np.uint8), flag)
+        if decoded is None:
+            return None
+        # The ROI is in the analyzed frame's pixels, which may itself be downscaled
+        sy, sx = decoded.shape[0] / height, decoded.shape[1] / width
+        gray = decoded[int(y0 * sy):max(int(y1 * sy), int(y0 * sy) + 1),
+                       int(x0 * sx):max(int(x1 * sx), int(x0 * sx) + 1)]
+    return cv2.resize(gray, MOTION_THUMB, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+def motion_score(thumb, previous):
+    """Largest per-block mean difference: a blink moves one block a lot while the crop's mean barely changes."""
+    n = MOTION_BLOCK
+    diff = np.abs(thumb - previous)
+    return float(diff.reshape(diff.shape[0] // n, n, diff.shape[1] // n, n).mean(axis=(1, 3)).max())
+
+
+class AnalysisSession:
+    """Per-candidate state carried between frames (blinks, looking-away streak,
+    motion-gate reference and tracked face region)."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.blink_count = 0
+        self.prev_ear = 0.0
+        self.away_counter = 0
+        self.last_thumb = None
+        self.last_result = None
+        self.reused_streak = 0
+        self.roi = None  # (x0, y0, x1, y1) in pixels of the last analyzed frame
+        self.frame_shape = None
+        self.since_full = 0
+        self.counts = {"full": 0, "roi": 0, "reused": 0}
+
+    def blink_rate(self):
+        return self.blink_count / max(time.monotonic() - self.started, 1) * 60
+
+    def update_away(self, yaw, pitch):
+        """Advance the looking-away streak; True once it is long enough to report."""
+        if abs(yaw) > YAW_LIMIT or abs(pitch) > PITCH_LIMIT:
+            self.away_counter += 1
+        else:
+            self.away_counter = max(0, self.away_counter - 1)
+        return self.away_counter > AWAY_FRAMES
+
+    def reuse(self, thumb):
+        """Result for a frame whose face region has not moved since the last analyzed frame, else None.
+
+        Face count, head pose and emotion carry over and the looking-away streak
+        advances; eye and mouth metrics are per-frame measurements, so they are
+        reported as unmeasured (None) rather than copied.
+        """
+        if thumb is None or self.last_thumb is None or self.last_result is None:
+            return None
+        if self.reused_streak >= MAX_REUSED or thumb.shape != self.last_thumb.shape:
+            return None
+        if motion_score(thumb, self.last_thumb) >= MOTION_THRESHOLD:
+            return None
+        self.reused_streak += 1
+        self.counts["reused"] += 1
+        last = self.last_result
+        pose = last["head_pose"]
+        blink_rate = self.blink_rate()
+        result = dict(last)
+        result["eye_metrics"] = {"blink_rate": round(blink_rate, 2), "eye_aspect_ratio": None,
+                                 "eye_status": None, "gaze_direction": None}
+        result["emotion"] = dict(last["emotion"], mouth_open=None)
+        result["violations"] = _violations(last["face_count"], self.update_away(pose["yaw"], pose["pitch"]),
+                                           pose["sidewaysOffset"], blink_rate)
+        result["analysis_mode"] = "reused"
+        result["timestamp"] = datetime.now(timezone.utc).isoformat()
+        return result
+
+    def remember(self, thumb, result):
+        """Make an analyzed frame the motion-gate reference."""
+        self.last_thumb = thumb
+        self.last_result = result
+        self.reused_streak = 0
+
+    def track(self, landmarks, width, height, face_count):
+        """Update the face ROI from full-frame normalized landmarks (dropped while several faces are in view)."""
+        self.frame_shape = (height, width)
+        if landmarks is None or face_count != 1:
+            self.roi = None
+            return
+        xs = [p.x for p in landmarks]
+        ys = [p.y for p in landmarks]
+        x0, x1 = min(xs) * width, max(xs) * width
+        y0, y1 = min(ys) * height, max(ys) * height
+        mx = max((x1 - x0) * ROI_MARGIN, (MIN_ROI_SIDE - (x1 - x0)) / 2, 0)
+        my = max((y1 - y0) * ROI_MARGIN, (MIN_ROI_SIDE - (y1 - y0)) / 2, 0)
+        self.roi = (max(int(x0 - mx), 0), max(int(y0 - my), 0),
+                    min(int(x1 + mx), width), min(int(y1 + my), height))
+
+
+def _dist(a, b):
+    return math.hypot(a.x - b.x, a.y - b.y)
+
+
+def calculate_ear(lm):
+    """Eye aspect ratio averaged over both eyes."""
+    def eye(upper, lower, corners):
+        vertical = sum(_dist(lm[u], lm[l]) for u, l in zip(upper, lower))
+        horizontal = _dist(lm[corners[0]], lm[corners[1]])
+        return 0 if horizontal == 0 else vertical / (len(upper) * horizontal)
+
+    left = eye((159, 160, 161), (144, 145, 153), (33, 133))
+    right = eye((386, 385, 384), (373, 374, 380), (362, 263))
+    return (left + right) / 2.0
+
+
+def calculate_head_pose(lm):
+    """Approximate yaw/pitch (degrees) and the face's offset from the frame center."""
+    nose, chin, forehead = lm[1], lm[152], lm[10]
+    left_temple, right_temple = lm[234], lm[454]
+
+    face_width = _dist(left_temple, right_temple)
+    yaw = 0 if face_width == 0 else (_dist(nose, left_temple) - _dist(nose, right_temple)) / face_width * 90
+
+    to_forehead, to_chin = _dist(nose, forehead), _dist(nose, chin)
+    total = to_forehead + to_chin
+    pitch = 0 if total == 0 else (to_chin - to_forehead) / total * 90
+
+    sideways = ((left_temple.x + right_temple.x) / 2 - 0.5) * 200
+    vertical = ((forehead.y + chin.y) / 2 - 0.5) * 200
+    return yaw, pitch, sideways, vertical
+
+
+def calculate_head_roll(lm):
+    left_eye, right_eye = lm[33], lm[263]
+    return round(math.degrees(math.atan2(right_eye.y - left_eye.y, right_eye.x - left_eye.x)), 2)
+
+
+def detect_eye_gaze(lm):
+    """'center' when the irises sit inside the screen-focus zone, else e.g. 'left' or 'right-down'."""
+    if len(lm) < IRIS_LANDMARKS:
+        return 'center'
+
+    def ratio(value, start, end):
+        span = end - start
+        return 0.5 if span == 0 else (value - start) / span
+
+    gaze_x = (ratio(lm[468].x, lm[33].x, lm[133].x) + ratio(lm[473].x, lm[263].x, lm[362].x)) / 2
+    gaze_y = (ratio(lm[468].y, lm[159].y, lm[145].y) + ratio(lm[473].y, lm[386].y, lm[374].y)) / 2
+
+    horizontal = 'left' if gaze_x < GAZE_H_RANGE[0] else 'right' if gaze_x > GAZE_H_RANGE[1] else 'center'
+    vertical = 'up' if gaze_y < GAZE_V_RANGE[0] else 'down' if gaze_y > GAZE_V_RANGE[1] else 'center'
+    if horizontal == 'center':
+        return vertical
+    return horizontal if vertical == 'center' else f"{horizontal}-{vertical}"
+
+
+def detect_emotion(blendshapes):
+    """Dominant emotion from FaceLandmarker blendshapes (neutral if the model has none)."""
+    if not blendshapes:
+        return {"emotion": "neutral", "confidence": 0, "details": {}}
+
+    s = {shape.category_name: shape.score or 0 for shape in blendshapes}
+
+    def pair(a, b):
+        return s.get(a, 0) + s.get(b, 0)
+
+    emotions = {
+        "happy": pair('mouthSmileLeft', 'mouthSmileRight') * 0.5 + pair('cheekSquintLeft', 'cheekSquintRight') * 0.3
+                 + pair('mouthDimpleLeft', 'mouthDimpleRight') / 2 * 0.2,
+        "surprised": pair('eyeWideLeft', 'eyeWideRight') * 0.3 + pair('browOuterUpLeft', 'browOuterUpRight') * 0.25
+                     + s.get('browInnerUp', 0) * 2 * 0.15 + s.get('jawOpen', 0) * 0.3,
+        "sad": pair('mouthFrownLeft', 'mouthFrownRight') * 0.4 + s.get('browInnerUp', 0) * 0.3
+               + pair('mouthLowerDownLeft', 'mouthLowerDownRight') * 0.15
+               + pair('mouthPucker', 'mouthShrugLower') / 2 * 0.15,
+        "angry": pair('browDownLeft', 'browDownRight') * 0.35 + pair('eyeSquintLeft', 'eyeSquintRight') * 0.2
+                 + pair('mouthPressLeft', 'mouthPressRight') * 0.2 + pair('noseSneerLeft', 'noseSneerRight') * 0.125,
+        "focused": pair('eyeSquintLeft', 'eyeSquintRight') * 0.35 + pair('mouthPressLeft', 'mouthPressRight') * 0.3
+                   + pair('browDownLeft', 'browDownRight') / 2 * 0.2 + (1 - s.get('jawOpen', 0)) * 0.15,
+        "confused": abs(s.get('browDownLeft', 0) - s.get('browDownRight', 0)) * 0.4
+                    + abs(s.get('browOuterUpLeft', 0) - s.get('browOuterUpRight', 0)) * 0.3
+                    + s.get('mouthPucker', 0) * 0.15 + s.get('mouthFunnel', 0) * 0.15,
+    }
+
+    emotion, score = max(emotions.items(), key=lambda item: item[1])
+    detected = score > EMOTION_THRESHOLD
+    return {
+        "emotion": emotion if detected else "neutral",
+        "confidence": round(min(score / 0.8, 1) * 100) if detected else 0,
+        "details": {name: round(value * 100) for name, value in emotions.items()},
+    }
+
+
+def _violations(face_count, away, sideways, blink_rate):
+    violations = []
+    if face_count > 1:
+        violations.append(f"Multiple Faces Detected ({face_count})")
+    if away:
+        violations.append("❌ Looking Away")
+    if abs(sideways) > SIDEWAYS_LIMIT:
+        violations.append("➡️ Head Shifted Right" if sideways > 0 else "⬅️ Head Shifted Left")
+    if blink_rate > BLINK_RATE_LIMIT:
+        violations.append("👀 Frequent Blinking")
+    return violations
+
+
+def analyze_gated(analyzer, session, source, read_frame):
+    """Stream analysis behind the session's motion gate.
+
+    `source` is the frame as JPEG bytes or a BGR array; `read_frame()` returns the
+    BGR frame and is only called when the frame has to be analyzed.
+    """
+    result = session.reuse(motion_thumbnail(source, session))
+    if result is None:
+        result = analyzer.analyze_frame(read_frame(), session)
+        # Thumbnail again: the analysis may have moved the tracked face region
+        session.remember(motion_thumbnail(source, session), result)
+    return result
+
+
+def _no_face_result(violation):
+    return {
+        "face_detected": False,
+        "face_count": 0,
+        "head_pose": {"yaw": 0, "pitch": 0, "roll": 0},
+        "eye_metrics": {"blink_rate": 0, "eye_aspect_ratio": 0, "gaze_direction": "center"},
+        "emotion": {"emotion": "neutral", "confidence": 0},
+        "violations": [violation],
+        "confidence": 0,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+class FaceAnalyzer:
+    """A loaded FaceLandmarker plus the metric computations from the JS hook."""
+
+    def __init__(self, max_num_faces=3, model_path=MODEL_PATH):
+        import mediapipe as mp
+        from mediapipe.tasks.python import BaseOptions, vision
+
+        if model_path is None:
+            model_path = model_store.model_path(MODEL_NAME)
+        elif not os.path.exists(model_path):
+            raise FileNotFoundError(f"Face landmarker model not found: {model_path} (run download_model.py)")
+
+        self._mp = mp
+        self.max_num_faces = max_num_faces
+
+        # Loaded by path, not model_asset_buffer: MediaPipe maps the file shared, so
+        # every analyzer process on the node uses one page-cache copy of the model
+        def create(blendshapes):
+            options = vision.FaceLandmarkerOptions(
+                base_options=BaseOptions(model_asset_path=model_path),
+                running_mode=vision.RunningMode.IMAGE,
+                num_faces=max_num_faces,
+                output_face_blendshapes=blendshapes,
+            )
+            return vision.FaceLandmarker.create_from_options(options)
+
+        # Some model bundles ship without the blendshapes head; emotion then stays neutral
+        try:
+            self._landmarker = create(True)
+            self.blendshapes = True
+        except ValueError:
+            self._landmarker = create(False)
+            self.blendshapes = False
+
+    def warm_up(self):
+        """Run one blank frame so the first real request does not pay graph setup."""
+        self.analyze_frame(np.zeros((240, 320, 3), dtype=np.uint8))
+
+    def _detect(self, frame):
+        rgb = np.ascontiguousarray(frame[:, :, ::-1])
+        return self._landmarker.detect(self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=rgb))
+
+    def _detect_tracked(self, frame, session):
+        """(landmark lists in full-frame coordinates, blendshapes, mode), using the session's ROI when valid."""
+        height, width = frame.shape[:2]
+        roi = session.roi if session is not None else None
+        if roi and session.frame_shape == (height, width) and session.since_full < REDETECT_INTERVAL:
+            x0, y0, x1, y1 = roi
+            detection = self._detect(frame[y0:y1, x0:x1])
+            if detection.face_landmarks:
+                cw, ch = x1 - x0, y1 - y0
+                faces = [[_Point((p.x * cw + x0) / width, (p.y * ch + y0) / height, p.z, p.presence) for p in face]
+                         for face in detection.face_landmarks]
+                session.since_full += 1
+                return faces, detection.face_blendshapes, "roi"
+            # Face left the tracked region: fall through to a full-frame detection
+
+        detection = self._detect(frame)
+        if session is not None:
+            session.since_full = 0
+        return detection.face_landmarks, detection.face_blendshapes, "full"
+
+    def analyze_frame(self, frame, session=None):
+        """Metrics for one BGR frame; `session` carries blink/away and tracking state between frames."""
+        faces, blendshapes, mode = self._detect_tracked(frame, session)
+
+        face_count = len(faces)
+        if session is not None:
+            session.counts[mode] += 1
+            session.track(faces[0] if faces else None, frame.shape[1], frame.shape[0], face_count)
+        if face_count == 0:
+            result = _no_face_result("No Face Detected")
+            result["analysis_mode"] = mode
+            return result
+
+        lm = faces[0]
+        yaw, pitch, sideways, vertical = calculate_head_pose(lm)
+        ear = calculate_ear(lm)
+
+        blink_rate = 0.0
+        away = False
+        if session is not None:
+            if ear < EAR_BLINK_THRESHOLD <= session.prev_ear:
+                session.blink_count += 1
+            session.prev_ear = ear
+            blink_rate = session.blink_rate()
+            away = session.update_away(yaw, pitch)
+        violations = _violations(face_count, away, sideways, blink_rate)
+
+        eye_status = "closed" if ear < EAR_CLOSED else "squinting" if ear < EAR_SQUINT else "open"
+        emotion = detect_emotion(blendshapes[0] if blendshapes else None)
+
+        # The landmarker reports no detection score; presence and visibility are the closest signal
+        presence = [p.presence for p in lm if getattr(p, 'presence', None) is not None]
+        confidence = float(np.mean(presence)) if presence else 0.9
+
+        return {
+            "face_detected": True,
+            "face_count": face_count,
+            "head_pose": {
+                "yaw": round(yaw, 2),
+                "pitch": round(pitch, 2),
+                "roll": calculate_head_roll(lm),
+                "sidewaysOffset": round(sideways, 2),
+                "verticalOffset": round(vertical, 2),
+            },
+            "eye_metrics": {
+                "blink_rate": round(blink_rate, 2),
+                "eye_aspect_ratio": round(ear, 3),
+                "eye_status": eye_status,
+                "gaze_direction": detect_eye_gaze(lm),
+            },
+            "emotion": {
+                "emotion": emotion["emotion"],
+                "confidence": emotion["confidence"],
+                "mouth_open": _dist(lm[13], lm[14]) > MOUTH_OPEN_DISTANCE,
+                "details": emotion["details"],
+            },
+            "violations": violations,
+            "confidence": round(confidence * 100, 2),
+            "analysis_mode": mode,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def close(self):
+        self._landmarker.close()
@@ -3,6 +3,7 @@ import auth from '../middleware/auth.js';
 import Interview from '../models/Interview.js';
 import Candidate from '../models/Candidate.js';
 import { spawn } from 'child_process';
+import axios from 'axios';
 import path from 'path';
 import { fileURLToPath } from 'url';
 
@@ -117,7 +118,20 @@ router.post('/verify-face', auth, async (req, res) => {
     // ===================================================================
     
     console.log('🔍 Starting face matching with Python service...');
-    const faceMatchResult = await pythonFaceMatching(referencePhoto, currentPhoto);
+    const faceMatchResult = await pythonFaceMatching(
+      referencePhoto,
+      currentPhoto,
+      interview.candidateApplicationPhotoEmbedding
+    );
+    
+    // Persist the reference face data so later verifications only encode the current photo
+    const referenceEmbedding = faceMatchResult.reference_embedding;
+    if (referenceEmbedding &&
+        referenceEmbedding.hash !== interview.candidateApplicationPhotoEmbedding?.hash) {
+      interview.candidateApplicationPhotoEmbedding = referenceEmbedding;
+      interview.markModified('candidateApplicationPhotoEmbedding');
+      await interview.save();
+    }
     
     if (!faceMatchResult.success) {
       return res.status(400).json({
@@ -375,16 +389,58 @@ router.post('/manual-verify', auth, async (req, res) => {
 // HELPER FUNCTIONS
 // =====================================================================
 
+/**
+ * Call the long-lived face verification server (python/face_verification_server.py)
+ * Only used when FACE_VERIFICATION_URL is set, e.g. http://127.0.0.1:8001
+ * @returns {Promise<object|null>} - Result JSON, or null to fall back to spawning Python
+ */
+async function serviceFaceMatching(referencePhoto, currentPhoto, referenceEmbedding, timeoutMs) {
+  const serviceUrl = process.env.FACE_VERIFICATION_URL;
+  if (!serviceUrl) return null;
+  
+  try {
+    const response = await axios.post(`${serviceUrl}/verify`, {
+      reference_photo: referencePhoto,
+      current_photo: currentPhoto,
+      reference_embedding: referenceEmbedding || null,
+      timeout_ms: timeoutMs
+    }, {
+      timeout: timeoutMs + 1000,
+      maxBodyLength: Infinity,
+      // 503/504 carry a normal failure JSON body
+      validateStatus: (status) => status < 500 || status === 503 || status === 504
+    });
+    
+    if (response.status === 503) {
+      console.warn('⚠️ Face verification service busy or not ready:', response.data?.error);
+      return null;
+    }
+    
+    console.log('✅ Face matching result (service):', response.data);
+    return response.data;
+  } catch (err) {
+    console.warn('⚠️ Face verification service unavailable:', err.message);
+    return null;
+  }
+}
+
 /**
  * Call Python face matching service with timeout and fallback
  * @param {string} referencePhoto - Base64 reference photo
  * @param {string} currentPhoto - Base64 current photo
- * @returns {Promise<object>} - {success, match_score, is_match, threshold, error}
+ * @param {object} [referenceEmbedding] - Cached reference face data from a previous call
+ * @returns {Promise<object>} - {success, match_score, is_match, threshold, reference_embedding, error}
  */
-async function pythonFaceMatching(referencePhoto, currentPhoto) {
+async function pythonFaceMatching(referencePhoto, currentPhoto, referenceEmbedding = null) {
   const TIMEOUT_MS = 15000; // 15 second timeout
   
   try {
+    // Prefer the warm verification server when it is configured
+    const serviceResult = await serviceFaceMatching(referencePhoto, currentPhoto, referenceEmbedding, TIMEOUT_MS - 1000);
+    if (serviceResult && serviceResult.success !== undefined) {
+      return serviceResult;
+    }
+    
     const result = await new Promise((resolve) => {
       const pythonScriptPath = path.join(__dirname, '..', 'python', 'face_verification.py');
       
@@ -446,7 +502,10 @@ async function pythonFaceMatching(referencePhoto, currentPhoto) {
       // Send input data
       const inputData = JSON.stringify({
         reference_photo: referencePhoto,
-        current_photo: currentPhoto
+        current_photo: currentPhoto,
+        reference_embedding: referenceEmbedding || null,
+        // Budget for the method cascade, leaving room for interpreter start-up before the kill
+        deadline_ms: TIMEOUT_MS - 3000
       });
       
       pythonProcess.stdin.write(inputData);
@@ -1,4 +1,5 @@
 import express from 'express';
+import axios from 'axios';
 import Interview from '../models/Interview.js';
 import Question from '../models/Question.js';
 import AIService from '../services/aiService.js';
@@ -210,6 +211,9 @@ router.post('/start', auth, async (req, res) => {
         await existingInterview.save();
       }
 
+      // Continuous re-verification stream (a fresh stream token on every start or resume)
+      const identityStream = await registerIdentityStream(existingInterview);
+
       // If interview is already in-progress, return existing questions (resume)
       if (existingInterview.status === 'in-progress') {
         return res.status(200).json({
@@ -221,7 +225,8 @@ router.post('/start', auth, async (req, res) => {
           timeLimit: existingInterview.timeLimit || 30,
           questionCount: existingInterview.questions.length,
           currentQuestionIndex: existingInterview.currentQuestionIndex || 0,
-          violationThresholds: existingInterview.violationThresholds || {}
+          violationThresholds: existingInterview.violationThresholds || {},
+          identityStream
         });
       }
 
@@ -322,7 +327,8 @@ router.post('/start', auth, async (req, res) => {
         difficulty: existingInterview.difficulty,
         timeLimit: existingInterview.timeLimit,
         questionCount: shuffledQuestions.length,
-        violationThresholds: existingInterview.violationThresholds || {}
+        violationThresholds: existingInterview.violationThresholds || {},
+        identityStream
       });
     }
 
@@ -721,6 +727,9 @@ router.post('/complete', auth, async (req, res) => {
 
     interview.endTime = new Date();
     interview.completedAt = new Date();
+
+    // Stop re-verifying; the stream service drops the reference and closes the socket
+    await removeIdentityStream(interviewId);
     
     // Calculate duration safely
     if (interview.startTime) {
@@ -1492,4 +1501,66 @@ router.get('/:interviewId/report', auth, async (req, res) => {
   }
 });
 
+// =====================================================================
+// HELPER FUNCTIONS
+// =====================================================================
+
+/**
+ * Headers for the identity re-verification stream (python/identity_stream.py)
+ */
+function identityStreamHeaders() {
+  const token = process.env.IDENTITY_STREAM_TOKEN;
+  return token ? { Authorization: `Bearer ${token}` } : {};
+}
+
+/**
+ * Register the candidate's application photo with the re-verification stream.
+ * Only used when IDENTITY_STREAM_URL is set, e.g. http://127.0.0.1:8002
+ * (IDENTITY_STREAM_WS_URL overrides the WebSocket address given to the browser).
+ * @returns {Promise<object|null>} - { url, token } for the frontend, or null when not streaming
+ */
+async function registerIdentityStream(interview) {
+  const serviceUrl = process.env.IDENTITY_STREAM_URL;
+  if (!serviceUrl || !interview.candidateApplicationPhoto) return null;
+
+  try {
+    const response = await axios.put(`${serviceUrl}/references/${interview._id}`, {
+      reference_photo: interview.candidateApplicationPhoto,
+      reference_embedding: interview.candidateApplicationPhotoEmbedding || null
+    }, {
+      headers: identityStreamHeaders(),
+      timeout: 15000,
+      maxBodyLength: Infinity
+    });
+
+    const wsBase = process.env.IDENTITY_STREAM_WS_URL || serviceUrl.replace(/^http/, 'ws');
+    console.log(`🎥 Identity stream registered for interview ${interview._id} (${response.data.method})`);
+    return {
+      url: `${wsBase}/ws/identity/${interview._id}`,
+      token: response.data.stream_token
+    };
+  } catch (err) {
+    // The interview goes ahead without continuous re-verification
+    console.warn('⚠️ Identity stream registration failed:', err.response?.data?.error || err.message);
+    return null;
+  }
+}
+
+/**
+ * End the interview's re-verification stream (no-op when the service is not configured)
+ */
+async function removeIdentityStream(interviewId) {
+  const serviceUrl = process.env.IDENTITY_STREAM_URL;
+  if (!serviceUrl) return;
+
+  try {
+    await axios.delete(`${serviceUrl}/references/${interviewId}`, {
+      headers: identityStreamHeaders(),
+      timeout: 5000
+    });
+  } catch (err) {
+    console.warn('⚠️ Identity stream removal failed:', err.message);
+  }
+}
+
 export default router;
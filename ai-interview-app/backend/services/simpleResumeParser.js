@@ -9,6 +9,10 @@ const __dirname = path.dirname(__filename);
  * Simple Resume Parser - No AI, just extraction
  * Uses Python pdfplumber for PDF text extraction
  * Extracts contact, skills, and bio using regex
+ *
+ * The file is streamed to Python as raw bytes (`--raw` mode):
+ * a one-line file type header followed by the document itself,
+ * so Python never has to JSON-parse or base64-decode the payload.
  */
 class SimpleResumeParser {
 
@@ -27,7 +31,7 @@ class SimpleResumeParser {
         const scriptPath = path.join(__dirname, '../python/extract_resume.py');
         const pythonCommand = process.platform === 'win32' ? 'python' : 'python3';
         
-        const python = spawn(pythonCommand, [scriptPath]);
+        const python = spawn(pythonCommand, [scriptPath, '--raw']);
         
         let output = '';
         let errorOutput = '';
@@ -77,12 +81,12 @@ class SimpleResumeParser {
           }
         });
         
-        const input = JSON.stringify({
-          fileBase64,
-          fileType
-        });
+        // Strip data URL prefix if present and send the decoded bytes
+        const base64Data = fileBase64.includes(',') ? fileBase64.split(',')[1] : fileBase64;
+        const fileBuffer = Buffer.from(base64Data, 'base64');
         
-        python.stdin.write(input);
+        python.stdin.write(`${String(fileType).replace('.', '')}\n`);
+        python.stdin.write(fileBuffer);
         python.stdin.end();
         
       } catch (err) {